@@ -1,25 +1,49 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, current_app, request, jsonify, send_file
 from flask_cors import CORS
 import os
 import json
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
+import queue
+import zipfile
 import traceback
+import threading
 from pathlib import Path
+from functools import partial
+from concurrent.futures import as_completed
 
 # 导入我们的处理器
 from md_parser import MDParser
 from md_to_excel_processor import MDToExcelProcessor
+from zip_stream import iter_zip_stream
+from zip_ingest import MAX_ARCHIVE_SIZE, ZipBombError, iter_zip_members
+from worker_pool import get_processor, submit_api_data, submit_md_content
+from output_janitor import OutputJanitor
+from output_storage import XLSX_MIMETYPE, LocalStorage, MemoryStorage, get_output_storage
+from output_layout import content_hash_from_filename
+from template_registry import TemplateError, get_template_registry
+from mapping_discovery import DEFAULT_VALUE_COLUMN, discover_mapping
 
-# 配置详细日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# 允许使用ZIP包上限的接口
+LARGE_UPLOAD_ENDPOINTS = {'generate_excel_from_zip'}
+
+class UploadLimitRequest(Request):
+    """
+    按接口决定请求体上限：ZIP上传接口为MAX_ARCHIVE_SIZE，其他接口为MAX_CONTENT_LENGTH
+    上限在Werkzeug解析请求体时生效，没有Content-Length的分块请求同样受限
+    """
+
+    @property
+    def max_content_length(self):
+        if self.endpoint in LARGE_UPLOAD_ENDPOINTS:
+            return current_app.config['MAX_ARCHIVE_SIZE']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
 app = Flask(__name__)
+app.request_class = UploadLimitRequest
 CORS(app)  # 允许跨域请求
 
 # 添加请求日志中间件
@@ -37,16 +61,113 @@ def log_request_info():
         logger.info(f'上传文件: {list(request.files.keys())}')
 
 # 配置
+# 请求体上限：ZIP上传接口为ZIP包上限（由zip_ingest逐成员检查解压后的大小），其他接口为16MB
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_ARCHIVE_SIZE'] = MAX_ARCHIVE_SIZE
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['MAX_BATCH_DOWNLOAD_FILES'] = 500
+app.config['MAX_SYNC_JSON_RECORDS'] = 500
+app.config['SSE_HEARTBEAT_SECONDS'] = 15
 ALLOWED_EXTENSIONS = {'md', 'markdown', 'txt'}
 
+# 输出文件保留策略（0表示不限制）
+app.config['OUTPUT_MAX_AGE_HOURS'] = float(os.environ.get('OUTPUT_MAX_AGE_HOURS', 168))
+app.config['OUTPUT_MAX_SIZE_MB'] = float(os.environ.get('OUTPUT_MAX_SIZE_MB', 2048))
+app.config['OUTPUT_JANITOR_INTERVAL_SECONDS'] = float(os.environ.get('OUTPUT_JANITOR_INTERVAL_SECONDS', 300))
+
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 后台输出清理线程和下载用处理器：导入模块时不创建，由启动入口或第一次使用时创建
+_output_janitor = None
+_output_janitor_lock = threading.Lock()
+_output_processor = None
+_output_processor_lock = threading.Lock()
+
+def configure_logging(level=logging.DEBUG):
+    """配置详细日志（由启动入口调用，导入app模块不修改日志配置）"""
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def start_output_janitor():
+    """
+    启动后台清理过期或超出配额的输出文件的线程，每个进程只启动一次
+    对象存储由其自身的生命周期规则管理，不启动清理线程（返回None）
+    """
+    global _output_janitor
+    if _output_janitor is None:
+        with _output_janitor_lock:
+            if _output_janitor is None:
+                output_storage = get_output_storage()
+                disk_storage = output_storage.spill if isinstance(output_storage, MemoryStorage) else output_storage
+                if not isinstance(disk_storage, LocalStorage):
+                    return None
+                janitor = OutputJanitor(
+                    str(disk_storage.root),
+                    max_age_seconds=app.config['OUTPUT_MAX_AGE_HOURS'] * 3600 or None,
+                    max_total_bytes=int(app.config['OUTPUT_MAX_SIZE_MB'] * 1024 ** 2) or None,
+                    interval_seconds=app.config['OUTPUT_JANITOR_INTERVAL_SECONDS']
+                )
+                janitor.start()
+                _output_janitor = janitor
+    return _output_janitor
+
+def get_output_processor():
+    """下载和批量下载只使用处理器的输出存储方法，所有请求共享一个实例"""
+    global _output_processor
+    if _output_processor is None:
+        with _output_processor_lock:
+            if _output_processor is None:
+                _output_processor = MDToExcelProcessor()
+    return _output_processor
+
+def create_app():
+    """
+    应用入口：配置日志、启动后台清理线程后返回Flask应用
+    run.py和直接运行app.py时调用；gunicorn使用 gunicorn 'app:create_app()'
+    """
+    configure_logging()
+    start_output_janitor()
+    return app
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _generation_result_entry(filename, result):
+    """将处理器的成功结果整理为接口返回的单文件结果"""
+    return {
+        'filename': filename,
+        'output_filename': result['output_filename'],
+        'download_url': f"/api/download-excel/{result['output_filename']}",
+        'md_parsing': result['md_parsing'],
+        'excel_writing': result['excel_writing'],
+        'timings': result.get('timings', {}),
+        'timestamp': result['timestamp']
+    }
+
+def _requested_template_id():
+    """从查询参数、表单或JSON请求体中读取template_id，未指定时返回None（默认模板）"""
+    template_id = request.args.get('template_id') or request.form.get('template_id')
+    if not template_id and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('template_id'), str):
+            template_id = data['template_id']
+    return template_id or None
+
+def _template_error_response(error):
+    """模板不存在或无效时的错误响应"""
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'error_code': 'UNKNOWN_TEMPLATE'
+    }), 400
+
+def _sse_event(event, data):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -57,6 +178,56 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """运行指标接口"""
+    output_storage = get_output_storage()
+    return jsonify({
+        'success': True,
+        'data': {
+            'output_storage': type(output_storage).__name__,
+            'output_janitor': _output_janitor.metrics() if _output_janitor else None,
+            'memory_store': output_storage.stats() if isinstance(output_storage, MemoryStorage) else None,
+            'template_registry': get_template_registry().stats()
+        }
+    })
+
+@app.route('/api/templates', methods=['GET'])
+def list_templates():
+    """列出可用的模板"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'templates': get_template_registry().list_templates()
+        }
+    })
+
+@app.route('/api/templates/<template_id>/discover', methods=['GET'])
+def discover_template_mapping(template_id):
+    """扫描模板的科目名称列，返回建议的字段映射"""
+    try:
+        template = get_template_registry().get(template_id)
+    except TemplateError as e:
+        return _template_error_response(e)
+
+    try:
+        result = discover_mapping(
+            template.workbook_bytes, template.sheet,
+            compiled=template.compiled_mapping,
+            value_column=request.args.get('value_column', DEFAULT_VALUE_COLUMN)
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_code': 'INVALID_PARAMETER'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'data': dict(result, template_id=template.template_id)
+    })
+
 @app.route('/api/parse-md', methods=['POST'])
 def parse_md_file():
     """解析单个MD文件接口"""
@@ -279,6 +450,11 @@ def generate_excel_from_md():
         
         logger.info(f"📁 接收到 {len(files)} 个文件")
         
+        try:
+            template = get_template_registry().get(_requested_template_id())
+        except TemplateError as e:
+            return _template_error_response(e)
+        
         results = []
         errors = []
         
@@ -309,19 +485,12 @@ def generate_excel_from_md():
                 logger.info(f"📖 文件内容长度: {len(content)} 字符")
                 
                 # 使用MD到Excel处理器
-                processor = MDToExcelProcessor()
+                processor = get_processor(template.template_id)
                 result = processor.process_md_content(content, secure_filename(file.filename))
                 
                 if result['success']:
                     logger.info(f"✅ Excel生成成功: {result['output_filename']}")
-                    results.append({
-                        'filename': file.filename,
-                        'output_filename': result['output_filename'],
-                        'download_url': f"/api/download-excel/{result['output_filename']}",
-                        'md_parsing': result['md_parsing'],
-                        'excel_writing': result['excel_writing'],
-                        'timestamp': result['timestamp']
-                    })
+                    results.append(_generation_result_entry(file.filename, result))
                 else:
                     logger.error(f"❌ Excel生成失败: {result.get('error', 'Unknown error')}")
                     errors.append({
@@ -360,6 +529,14 @@ def generate_excel_from_md():
             }
         }
         
+        # 登记批量下载任务，前端可一次性下载全部结果
+        if success:
+            job_id = get_output_processor().create_download_job(
+                [r['output_filename'] for r in results]
+            )
+            response_data['data']['job_id'] = job_id
+            response_data['data']['batch_download_url'] = f"/api/download-excel-batch/{job_id}"
+        
         if not success and errors:
             response_data['error'] = 'All files failed to process'
             response_data['error_code'] = 'ALL_FAILED'
@@ -375,6 +552,485 @@ def generate_excel_from_md():
             'error_code': 'SERVER_ERROR'
         }), 500
 
+@app.route('/api/generate-excel-stream', methods=['POST'])
+def generate_excel_stream():
+    """从多个MD文件生成Excel文件，通过Server-Sent Events逐个推送处理进度"""
+    logger.info("🚀 开始处理Excel生成请求 (SSE进度流方式)")
+    
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return jsonify({
+            'success': False,
+            'error': 'No file provided',
+            'error_code': 'NO_FILE'
+        }), 400
+    
+    template_id = _requested_template_id()
+    try:
+        get_template_registry().get(template_id)
+    except TemplateError as e:
+        return _template_error_response(e)
+    
+    # 在请求上下文内读完所有文件，响应流开始后请求对象不再可用
+    events = queue.Queue()
+    futures = {}
+    early_errors = []
+    
+    def make_progress_callback(index, filename):
+        def callback(stage, info):
+            events.put(('progress', dict(info, index=index, filename=filename, stage=stage)))
+        return callback
+    
+    for idx, file in enumerate(files):
+        if file.filename == '' or not allowed_file(file.filename):
+            early_errors.append({
+                'index': idx,
+                'filename': file.filename or f'file_{idx + 1}',
+                'error': 'Invalid file type. Only .md, .markdown, and .txt files are allowed',
+                'error_code': 'INVALID_FILE_TYPE'
+            })
+            continue
+        try:
+            content = file.read().decode('utf-8')
+        except UnicodeDecodeError:
+            early_errors.append({
+                'index': idx,
+                'filename': file.filename,
+                'error': 'File encoding error. Please ensure the file is UTF-8 encoded',
+                'error_code': 'ENCODING_ERROR'
+            })
+            continue
+        
+        future = submit_md_content(content, secure_filename(file.filename),
+                                   make_progress_callback(idx, file.filename), template_id)
+        futures[future] = (idx, file.filename)
+        future.add_done_callback(lambda f: events.put(('done', f)))
+    
+    total_files = len(files)
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    
+    def generate():
+        results = []
+        errors = list(early_errors)
+        pending = len(futures)
+        
+        try:
+            yield _sse_event('start', {'total_files': total_files})
+            for error in early_errors:
+                yield _sse_event('file_error', error)
+            
+            while pending:
+                try:
+                    kind, payload = events.get(timeout=heartbeat)
+                except queue.Empty:
+                    # 注释行保持连接，防止代理超时断开
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                if kind == 'progress':
+                    yield _sse_event('progress', payload)
+                    continue
+                
+                pending -= 1
+                idx, filename = futures[payload]
+                try:
+                    result = payload.result()
+                except Exception as e:
+                    result = {'success': False, 'error': str(e), 'stage': 'processing'}
+                
+                if result['success']:
+                    entry = _generation_result_entry(filename, result)
+                    entry['index'] = idx
+                    results.append(entry)
+                    yield _sse_event('file_done', entry)
+                else:
+                    error = {
+                        'index': idx,
+                        'filename': filename,
+                        'error': result.get('error', 'Unknown error occurred'),
+                        'error_code': 'GENERATION_FAILED',
+                        'stage': result.get('stage', 'unknown')
+                    }
+                    errors.append(error)
+                    yield _sse_event('file_error', error)
+            
+            summary = {
+                'total_files': total_files,
+                'success_count': len(results),
+                'error_count': len(errors)
+            }
+            complete = {'success': len(results) > 0, 'summary': summary}
+            if results:
+                results.sort(key=lambda r: r['index'])
+                job_id = get_output_processor().create_download_job(
+                    [r['output_filename'] for r in results]
+                )
+                complete['job_id'] = job_id
+                complete['batch_download_url'] = f"/api/download-excel-batch/{job_id}"
+            
+            logger.info(f"✅ SSE进度流完成: {summary}")
+            yield _sse_event('complete', complete)
+        
+        finally:
+            # 客户端提前断开时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/generate-excel-zip', methods=['POST'])
+def generate_excel_from_zip():
+    """从ZIP包中的多个MD文件生成Excel文件，成员边读取边交给工作线程池处理"""
+    logger.info("🚀 开始处理Excel生成请求 (ZIP上传方式)")
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({
+                'success': False,
+                'error': 'No file provided',
+                'error_code': 'NO_FILE'
+            }), 400
+        
+        archive = request.files['file']
+        if not archive.filename.lower().endswith('.zip'):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file type. Only .zip files are allowed',
+                'error_code': 'INVALID_FILE_TYPE'
+            }), 400
+        
+        template_id = _requested_template_id()
+        try:
+            get_template_registry().get(template_id)
+        except TemplateError as e:
+            return _template_error_response(e)
+        
+        futures = {}
+        errors = []
+        member_count = 0
+        
+        try:
+            for member in iter_zip_members(archive.stream, ALLOWED_EXTENSIONS):
+                member_count += 1
+                if member.error:
+                    errors.append({
+                        'index': member.index,
+                        'filename': member.name,
+                        'error': member.error,
+                        'error_code': member.error_code
+                    })
+                    continue
+                
+                try:
+                    content = member.content.decode('utf-8')
+                except UnicodeDecodeError:
+                    errors.append({
+                        'index': member.index,
+                        'filename': member.name,
+                        'error': 'File encoding error. Please ensure the file is UTF-8 encoded',
+                        'error_code': 'ENCODING_ERROR'
+                    })
+                    continue
+                
+                # 读完一个成员立即提交，处理与后续成员的读取并行进行
+                output_name = secure_filename(Path(member.name).name) or f'member_{member.index + 1}.md'
+                future = submit_md_content(content, output_name, template_id=template_id)
+                futures[future] = member
+                
+        except zipfile.BadZipFile:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid or corrupted ZIP file',
+                'error_code': 'INVALID_ZIP'
+            }), 400
+        except ZipBombError as e:
+            for future in futures:
+                future.cancel()
+            logger.error(f"❌ ZIP超出安全限制: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': f'ZIP archive rejected: {str(e)}',
+                'error_code': 'ZIP_LIMIT_EXCEEDED'
+            }), 400
+        
+        logger.info(f"📁 ZIP中读取到 {member_count} 个文件，已提交 {len(futures)} 个处理任务")
+        
+        results = []
+        for future in as_completed(futures):
+            member = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"💥 处理ZIP成员 {member.name} 时发生异常: {str(e)}")
+                result = {'success': False, 'error': str(e), 'stage': 'processing'}
+            
+            if result['success']:
+                entry = _generation_result_entry(member.name, result)
+                entry['index'] = member.index
+                results.append(entry)
+            else:
+                errors.append({
+                    'index': member.index,
+                    'filename': member.name,
+                    'error': result.get('error', 'Unknown error occurred'),
+                    'error_code': 'GENERATION_FAILED',
+                    'stage': result.get('stage', 'unknown')
+                })
+        
+        # 按ZIP中的原始顺序返回
+        results.sort(key=lambda r: r['index'])
+        errors.sort(key=lambda e: e['index'])
+        
+        success = len(results) > 0
+        response_data = {
+            'success': success,
+            'data': {
+                'results': results,
+                'errors': errors,
+                'summary': {
+                    'total_files': member_count,
+                    'success_count': len(results),
+                    'error_count': len(errors)
+                }
+            }
+        }
+        
+        if success:
+            job_id = get_output_processor().create_download_job(
+                [r['output_filename'] for r in results]
+            )
+            response_data['data']['job_id'] = job_id
+            response_data['data']['batch_download_url'] = f"/api/download-excel-batch/{job_id}"
+        elif errors:
+            response_data['error'] = 'All files failed to process'
+            response_data['error_code'] = 'ALL_FAILED'
+        else:
+            response_data['error'] = 'No files found in ZIP archive'
+            response_data['error_code'] = 'EMPTY_ARCHIVE'
+        
+        return jsonify(response_data), 200 if success else 400
+        
+    except Exception as e:
+        logger.error(f"💥 ZIP处理过程中发生异常: {str(e)}")
+        logger.error(f"💥 异常堆栈: {traceback.format_exc()}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to generate Excel files: {str(e)}',
+            'error_code': 'SERVER_ERROR'
+        }), 500
+
+@app.route('/api/sync-json', methods=['POST'])
+def sync_json():
+    """从结构化的API数据生成Excel文件（单个对象或对象数组）"""
+    logger.info("🚀 开始处理Excel生成请求 (JSON数据方式)")
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            records = [data]
+        elif isinstance(data, list):
+            records = data
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Request body must be a JSON object or an array of objects',
+                'error_code': 'INVALID_JSON'
+            }), 400
+        
+        if not records:
+            return jsonify({
+                'success': False,
+                'error': 'No records provided',
+                'error_code': 'NO_RECORDS'
+            }), 400
+        
+        if len(records) > app.config['MAX_SYNC_JSON_RECORDS']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many records. Maximum is {app.config['MAX_SYNC_JSON_RECORDS']}",
+                'error_code': 'TOO_MANY_RECORDS'
+            }), 400
+        
+        logger.info(f"📦 接收到 {len(records)} 条记录")
+        
+        # 请求体就是数据本身，模板只能通过查询参数指定
+        template_id = request.args.get('template_id') or None
+        try:
+            get_template_registry().get(template_id)
+        except TemplateError as e:
+            return _template_error_response(e)
+        
+        errors = []
+        futures = {}
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                errors.append({
+                    'index': index,
+                    'status': 'error',
+                    'error': 'Each record must be a JSON object',
+                    'error_code': 'INVALID_RECORD'
+                })
+                continue
+            futures[submit_api_data(record, f'api_data_{index + 1}.json', template_id)] = index
+        
+        results = []
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"💥 处理第 {index + 1} 条记录时发生异常: {str(e)}")
+                result = {'success': False, 'error': str(e), 'stage': 'processing'}
+            
+            if result['success'] and not result.get('output_filename'):
+                # 写入成功但输出文件没有保存
+                result = {'success': False, 'error': 'Output file was not saved', 'stage': 'saving'}
+            
+            if result['success']:
+                results.append({
+                    'index': index,
+                    'status': result['excel_writing']['status'],
+                    'output_filename': result['output_filename'],
+                    'download_url': f"/api/download-excel/{result['output_filename']}",
+                    'excel_writing': result['excel_writing'],
+                    'timings': result.get('timings', {}),
+                    'timestamp': result['timestamp']
+                })
+            else:
+                errors.append({
+                    'index': index,
+                    'status': 'error',
+                    'error': result.get('error') or '; '.join(result.get('errors', [])) or 'Unknown error occurred',
+                    'error_code': 'GENERATION_FAILED',
+                    'stage': result.get('stage', 'unknown')
+                })
+        
+        # 按请求中的原始顺序返回
+        results.sort(key=lambda r: r['index'])
+        errors.sort(key=lambda e: e['index'])
+        
+        success = len(results) > 0
+        response_data = {
+            'success': success,
+            'data': {
+                'results': results,
+                'errors': errors,
+                'summary': {
+                    'total_records': len(records),
+                    'success_count': len(results),
+                    'error_count': len(errors)
+                }
+            }
+        }
+        
+        if success:
+            job_id = get_output_processor().create_download_job(
+                [r['output_filename'] for r in results]
+            )
+            response_data['data']['job_id'] = job_id
+            response_data['data']['batch_download_url'] = f"/api/download-excel-batch/{job_id}"
+        else:
+            response_data['error'] = 'All records failed to process'
+            response_data['error_code'] = 'ALL_FAILED'
+        
+        return jsonify(response_data), 200 if success else 400
+        
+    except Exception as e:
+        logger.error(f"💥 JSON数据处理过程中发生异常: {str(e)}")
+        logger.error(f"💥 异常堆栈: {traceback.format_exc()}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to generate Excel files: {str(e)}',
+            'error_code': 'SERVER_ERROR'
+        }), 500
+
+@app.route('/api/generate-excel-timeseries', methods=['POST'])
+def generate_excel_time_series():
+    """把同一公司多个期间的MD文件写入同一个Excel的连续列"""
+    logger.info("🚀 开始处理Excel生成请求 (时间序列方式)")
+    try:
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({
+                'success': False,
+                'error': 'No file provided',
+                'error_code': 'NO_FILE'
+            }), 400
+        
+        # 期间标签默认取文件名，也可以用逗号分隔的 periods 字段按顺序指定
+        labels = [label.strip() for label in request.form.get('periods', '').split(',') if label.strip()]
+        if labels and len(labels) != len(files):
+            return jsonify({
+                'success': False,
+                'error': 'The number of periods must match the number of files',
+                'error_code': 'PERIOD_MISMATCH'
+            }), 400
+        
+        header_row = request.form.get('header_row', type=int)
+        
+        documents = []
+        for idx, file in enumerate(files):
+            if not allowed_file(file.filename):
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid file type: {file.filename}',
+                    'error_code': 'INVALID_FILE_TYPE'
+                }), 400
+            try:
+                content = file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                return jsonify({
+                    'success': False,
+                    'error': f'File encoding error: {file.filename}',
+                    'error_code': 'ENCODING_ERROR'
+                }), 400
+            documents.append((labels[idx] if labels else Path(file.filename).stem, content))
+        
+        try:
+            template = get_template_registry().get(_requested_template_id())
+        except TemplateError as e:
+            return _template_error_response(e)
+        
+        processor = get_processor(template.template_id)
+        result = processor.process_md_time_series(
+            documents, secure_filename(files[0].filename) or 'time_series.md', header_row=header_row
+        )
+        
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'error': result.get('error') or '; '.join(result.get('errors', [])) or 'Unknown error occurred',
+                'error_code': 'GENERATION_FAILED',
+                'stage': result.get('stage', 'unknown'),
+                'period_errors': result.get('period_errors', [])
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'output_filename': result['output_filename'],
+                'download_url': f"/api/download-excel/{result['output_filename']}",
+                'periods': result['periods'],
+                'period_errors': result['period_errors'],
+                'timings': result['timings'],
+                'timestamp': result['timestamp']
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"💥 时间序列处理过程中发生异常: {str(e)}")
+        logger.error(f"💥 异常堆栈: {traceback.format_exc()}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to generate Excel file: {str(e)}',
+            'error_code': 'SERVER_ERROR'
+        }), 500
+
 @app.route('/api/generate-excel-text', methods=['POST'])
 def generate_excel_from_md_text():
     """从MD文本内容生成Excel文件"""
@@ -390,8 +1046,13 @@ def generate_excel_from_md_text():
         content = data['content']
         filename = data.get('filename', 'untitled.md')
         
+        try:
+            template = get_template_registry().get(_requested_template_id())
+        except TemplateError as e:
+            return _template_error_response(e)
+        
         # 使用MD到Excel处理器
-        processor = MDToExcelProcessor()
+        processor = get_processor(template.template_id)
         result = processor.process_md_content(content, filename)
         
         if result['success']:
@@ -423,20 +1084,39 @@ def generate_excel_from_md_text():
 def download_excel_file(filename):
     """下载生成的Excel文件"""
     try:
-        processor = MDToExcelProcessor()
+        processor = get_output_processor()
+        # 确定性输出的文件名就是内容哈希，直接作为ETag，客户端已有相同内容时返回304
+        content_hash = content_hash_from_filename(filename)
+        if content_hash and content_hash in request.if_none_match and processor.output_exists(filename):
+            response = Response(status=304)
+            response.set_etag(content_hash)
+            return response
+        
         file_path = processor.get_output_file(filename)
         
-        if not file_path or not Path(file_path).exists():
+        if file_path:
+            return send_file(
+                file_path,
+                as_attachment=True,
+                download_name=filename,
+                mimetype=XLSX_MIMETYPE,
+                etag=content_hash or True
+            )
+        
+        # 不在本地磁盘上（如对象存储未命中缓存），流式转发
+        stream = processor.open_output_file(filename)
+        if stream is None:
             return jsonify({
                 'success': False,
                 'error': 'File not found'
             }), 404
         
         return send_file(
-            file_path,
+            stream,
             as_attachment=True,
             download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            mimetype=XLSX_MIMETYPE,
+            etag=content_hash or False
         )
         
     except Exception as e:
@@ -446,11 +1126,122 @@ def download_excel_file(filename):
             'error': f'Failed to download file: {str(e)}'
         }), 500
 
+@app.route('/api/download-excel/<filename>/keep', methods=['POST'])
+def keep_excel_file(filename):
+    """长期保留一个生成的Excel文件（内存存储模式下转存到磁盘）"""
+    try:
+        output_storage = get_output_storage()
+        if isinstance(output_storage, MemoryStorage):
+            found = output_storage.extend_ttl(filename)
+        else:
+            found = get_output_processor().output_exists(filename)
+        
+        if not found:
+            return jsonify({
+                'success': False,
+                'error': 'File not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'output_filename': filename,
+                'download_url': f"/api/download-excel/{filename}"
+            }
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Error keeping Excel file {filename}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to keep file: {str(e)}'
+        }), 500
+
+@app.route('/api/download-excel-batch', methods=['POST'])
+@app.route('/api/download-excel-batch/<job_id>', methods=['GET'])
+def download_excel_batch(job_id=None):
+    """将多个生成的Excel文件打包为一个ZIP流式下载"""
+    try:
+        
+        if job_id is None:
+            data = request.get_json(silent=True) or {}
+            job_id = data.get('job_id')
+            filenames = data.get('filenames')
+        else:
+            filenames = None
+        
+        if job_id:
+            filenames = get_output_processor().get_download_job(job_id)
+            if filenames is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Download job not found',
+                    'error_code': 'JOB_NOT_FOUND'
+                }), 404
+        
+        if not filenames or not isinstance(filenames, list):
+            return jsonify({
+                'success': False,
+                'error': 'No filenames provided',
+                'error_code': 'NO_FILE'
+            }), 400
+        
+        if len(filenames) > app.config['MAX_BATCH_DOWNLOAD_FILES']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many files. Maximum is {app.config['MAX_BATCH_DOWNLOAD_FILES']}",
+                'error_code': 'TOO_MANY_FILES'
+            }), 400
+        
+        # 打包开始前先确认所有文件都存在，流开始后就无法再返回错误状态码
+        processor = get_output_processor()
+        members = []
+        missing = []
+        for filename in filenames:
+            source = None
+            if isinstance(filename, str):
+                source = processor.get_output_file(filename)
+                if not source and processor.output_exists(filename):
+                    # 远程存储的文件在打包到该成员时才打开
+                    source = partial(processor.open_output_file, filename)
+            if source:
+                members.append((filename, source))
+            else:
+                missing.append(filename)
+        
+        if missing:
+            return jsonify({
+                'success': False,
+                'error': 'File not found',
+                'error_code': 'FILE_NOT_FOUND',
+                'missing': missing
+            }), 404
+        
+        logger.info(f"📦 开始流式打包 {len(members)} 个文件")
+        archive_name = f"excel_outputs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        
+        return Response(
+            iter_zip_stream(members),
+            mimetype='application/zip',
+            headers={
+                'Content-Disposition': f'attachment; filename="{archive_name}"',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        app.logger.error(f"Error creating batch download: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to download files: {str(e)}'
+        }), 500
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
+    limit = request.max_content_length
     return jsonify({
         'success': False,
-        'error': 'File too large. Maximum size is 16MB'
+        'error': f'File too large. Maximum size is {limit // (1024 * 1024)}MB'
     }), 413
 
 @app.errorhandler(500)
@@ -461,4 +1252,4 @@ def internal_error(error):
     }), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
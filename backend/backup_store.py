@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的Excel模板备份存储
+相同内容的模板只保存一份，清单记录每次同步的时间戳对应的内容哈希
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from output_janitor import record_output
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.jsonl"
+STAT_CACHE_FILENAME = ".stat_cache.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Linux的FICLONE ioctl，在btrfs、XFS等文件系统上创建共享数据块的写时复制副本
+_FICLONE = 0x40049409
+
+
+def file_sha256(path) -> str:
+    """分块计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink_or_copy(source: Path, destination: Path) -> str:
+    """
+    尽量以reflink方式复制文件，不支持时退回普通复制
+
+    返回:
+        使用的方式：reflink 或 copy
+    """
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        shutil.copyfile(source, destination)
+        return "copy"
+
+
+class BackupStore:
+    """
+    内容寻址的备份存储
+
+    目录结构:
+        blobs/<哈希前2位>/<哈希>.xlsx   备份内容，只读
+        manifest.jsonl                  时间戳 → 哈希 的追加式清单
+        .stat_cache.json                源文件状态 → 哈希 的缓存，源文件未变化时无需重新读取
+    """
+
+    def __init__(self, root: str = "output/backups"):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / MANIFEST_FILENAME
+        self._stat_cache_path = self.root / STAT_CACHE_FILENAME
+        self._lock = threading.Lock()
+        self._stat_cache = self._load_stat_cache()
+
+    def _load_stat_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self._stat_cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_stat_cache(self):
+        tmp_path = self._stat_cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._stat_cache, f)
+        os.replace(tmp_path, self._stat_cache_path)
+
+    def _source_hash(self, source: Path) -> str:
+        """返回源文件的内容哈希；大小、修改时间和inode都未变化时直接使用缓存"""
+        stat = source.stat()
+        signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        key = str(source.resolve())
+
+        cached = self._stat_cache.get(key)
+        if cached and cached["signature"] == signature:
+            return cached["hash"]
+
+        content_hash = file_sha256(source)
+        self._stat_cache[key] = {"signature": signature, "hash": content_hash}
+        self._save_stat_cache()
+        return content_hash
+
+    def blob_path(self, content_hash: str) -> Path:
+        return self.blob_dir / content_hash[:2] / f"{content_hash}.xlsx"
+
+    def backup(self, source_path: str, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """
+        备份源文件
+
+        参数:
+            source_path: 要备份的文件
+            timestamp: 清单中记录的时间戳，默认为当前时间
+
+        返回:
+            包含hash、blob_path、deduplicated和method的字典
+        """
+        source = Path(source_path)
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        with self._lock:
+            content_hash = self._source_hash(source)
+            blob = self.blob_path(content_hash)
+            deduplicated = blob.exists()
+            method = "dedup"
+
+            if not deduplicated:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = blob.with_name(f".{blob.name}.tmp")
+                method = _reflink_or_copy(source, tmp_path)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, blob)
+            else:
+                # 复用的blob刷新修改时间，索引中的时间即为最近一次备份的时间
+                os.utime(blob)
+            record_output(blob, "backup", str(self.root.parent))
+
+            entry = {
+                "timestamp": timestamp,
+                "hash": content_hash,
+                "source": str(source),
+                "size": blob.stat().st_size
+            }
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        if deduplicated:
+            logger.info(f"模板内容未变化，复用已有备份: {blob}")
+        else:
+            logger.info(f"已创建备份 ({method}): {blob}")
+
+        return {"hash": content_hash, "blob_path": str(blob), "deduplicated": deduplicated,
+                "method": method, "timestamp": timestamp}
+
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """按时间顺序返回清单中的全部备份记录"""
+        if not self.manifest_path.exists():
+            return []
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def find(self, reference: str) -> Optional[Dict[str, Any]]:
+        """
+        按时间戳或哈希前缀查找备份，多条匹配时返回最新的一条
+        """
+        for entry in reversed(self.list_backups()):
+            if entry["timestamp"] == reference or entry["hash"].startswith(reference):
+                return entry
+        return None
+
+    def restore(self, reference: str, destination: str) -> Path:
+        """
+        将备份恢复为可写的普通文件
+
+        参数:
+            reference: 时间戳或哈希前缀
+            destination: 恢复到的文件路径
+
+        返回:
+            恢复后的文件路径
+        """
+        entry = self.find(reference)
+        if entry is None:
+            raise FileNotFoundError(f"找不到备份: {reference}")
+
+        blob = self.blob_path(entry["hash"])
+        if not blob.exists():
+            raise FileNotFoundError(f"备份内容已被清理: {entry['hash']}")
+
+        destination = Path(destination)
+        _reflink_or_copy(blob, destination)
+        os.chmod(destination, 0o644)
+        logger.info(f"已从 {entry['timestamp']} 的备份恢复到 {destination}")
+        return destination
+
+
+def main():
+    """列出或恢复备份"""
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="ExcelSync模板备份管理")
+    parser.add_argument("--root", default="output/backups", help="备份目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="列出全部备份")
+    restore_parser = subparsers.add_parser("restore", help="恢复备份")
+    restore_parser.add_argument("reference", help="时间戳或哈希前缀")
+    restore_parser.add_argument("destination", help="恢复到的文件路径")
+
+    args = parser.parse_args()
+    store = BackupStore(args.root)
+
+    if args.command == "list":
+        for entry in store.list_backups():
+            print(f"{entry['timestamp']}  {entry['hash'][:12]}  {entry['source']}")
+        return 0
+
+    try:
+        store.restore(args.reference, args.destination)
+    except FileNotFoundError as e:
+        print(f"错误: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
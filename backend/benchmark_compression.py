@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+压缩配置基准测试
+用同一个已写入数据的工作簿，按每种压缩配置重复保存，报告CPU时间、耗时和文件大小
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Any, Dict, List
+
+from openpyxl import load_workbook
+
+from excel_writer import ExcelWriter
+from mapping_config import TRIAL_BALANCE_MAPPING
+from workbook_archive import COMPRESSION_PROFILES, save_workbook
+
+
+def build_workbook(template: str, sheet: str, sheets: int):
+    """加载模板，写入测试数据；sheets大于1时复制工作表，模拟多公司输出"""
+    writer = ExcelWriter(template, sheet)
+    handle = writer.open_workbook()
+    api_data = {field: (index + 1) * 1234567 for index, field in enumerate(TRIAL_BALANCE_MAPPING)}
+    writer.write_data(api_data, TRIAL_BALANCE_MAPPING, handle.worksheet)
+    for index in range(2, sheets + 1):
+        writer.write_record_sheet(handle, api_data, TRIAL_BALANCE_MAPPING, index)
+    return handle.workbook
+
+
+def measure(workbook, profile: str, repeat: int) -> Dict[str, Any]:
+    """按一种压缩配置保存repeat次，取中位数"""
+    cpu_times: List[float] = []
+    wall_times: List[float] = []
+    size = 0
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        save_workbook(workbook, buffer, profile)
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+        size = len(buffer.getvalue())
+
+    # 确认输出可以被重新打开
+    load_workbook(io.BytesIO(buffer.getvalue()), read_only=True).close()
+
+    return {
+        "profile": profile,
+        "cpu_ms": round(statistics.median(cpu_times) * 1000, 2),
+        "wall_ms": round(statistics.median(wall_times) * 1000, 2),
+        "size_bytes": size
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各压缩配置保存工作簿的CPU时间和文件大小")
+    parser.add_argument("--excel", default="mapping.xlsx", help="模板Excel文件")
+    parser.add_argument("--sheet", default="A社貼り付けBS", help="工作表名称")
+    parser.add_argument("--sheets", type=int, default=1, help="输出工作簿中的工作表数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种配置的保存次数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    workbook = build_workbook(args.excel, args.sheet, args.sheets)
+    # 预热一次，排除首次保存时的导入和初始化开销
+    save_workbook(workbook, io.BytesIO())
+
+    results = [measure(workbook, profile, args.repeat) for profile in COMPRESSION_PROFILES]
+    baseline = next(r for r in results if r["profile"] == "default")
+    for r in results:
+        r["cpu_vs_default"] = round(r["cpu_ms"] / baseline["cpu_ms"], 2) if baseline["cpu_ms"] else None
+        r["size_vs_default"] = round(r["size_bytes"] / baseline["size_bytes"], 2)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return 0
+
+    print(f"{'配置':<10}{'CPU(ms)':>10}{'耗时(ms)':>10}{'大小(字节)':>12}{'CPU比':>8}{'大小比':>8}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['cpu_ms']:>10}{r['wall_ms']:>10}{r['size_bytes']:>12}"
+              f"{r['cpu_vs_default']:>8}{r['size_vs_default']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -4,56 +4,281 @@ ExcelSync项目的主模块
 简单实现：JSON输入 → Excel输出
 """
 
+import io
+import os
+import sys
+import glob
 import json
+import time
 import logging
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
-import shutil
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing.util import Finalize
 
-from excel_writer import ExcelWriter
+from excel_writer import ExcelWriter, DEFAULT_SHEET_TITLE
 from data_validator import prepare_api_data
 from mapping_config import TRIAL_BALANCE_MAPPING
+from output_layout import make_content_filename, make_output_filename, output_path_for
+from output_janitor import record_output
+from backup_store import BackupStore
+from write_behind import WriteBehindQueue, get_write_behind_queue
+from workbook_archive import COMPRESSION_PROFILES
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('excel_sync.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# 批量模式下每个工作进程最多同时排队的任务数
+BATCH_QUEUE_PER_WORKER = 4
+
+# JSONL输入的输出方式：每条记录一个工作簿，或所有记录写入同一工作簿的不同工作表
+JSONL_OUTPUT_MODES = ("workbook", "sheet")
+
+
+def _summarize_writes(result: Dict[str, Any]):
+    """在结果中加入写入成功的字段数和成功率（原地同步时值未变化的字段也算成功）"""
+    successful_writes = sum(1 for status in result["write_status"].values()
+                            if status in ("success", "unchanged"))
+    total_fields = len(TRIAL_BALANCE_MAPPING)
+    result.update({
+        "total_fields": total_fields,
+        "successful_writes": successful_writes,
+        "success_rate": f"{(successful_writes/total_fields)*100:.1f}%"
+    })
+
+
+def _save_content_addressed(output_dir: Path, excel_path: str, content: bytes) -> Tuple[Path, bool]:
+    """
+    确定性输出：以内容哈希命名保存工作簿
+    相同内容的文件已存在时不再写入，只刷新其使用时间；无论是否写入都重新登记到输出索引
+
+    返回:
+        (输出路径, 相同内容的文件是否已存在)
+    """
+    output_path = output_path_for(output_dir, make_content_filename(excel_path, content), create=True)
+    try:
+        os.utime(output_path)
+        cached = True
+        logger.info(f"相同内容的输出已存在: {output_path}")
+    except FileNotFoundError:
+        cached = False
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, output_path)
+    record_output(output_path, "output", str(output_dir))
+    return output_path, cached
+
+
+class _TemplateSession:
+    """
+    批量同步时在一个工作进程内复用已加载的模板
+    模板只加载和验证一次；每条记录写入前先把映射单元格恢复为模板原值，避免上一条记录的数据残留
+    作为上下文管理器使用，退出时关闭模板工作簿
+    """
+
+    def __init__(self, excel_path: str, sheet_name: str, output_dir: str, compression: Optional[str] = None,
+                 deterministic: Optional[bool] = None):
+        self.excel_path = excel_path
+        self.output_dir = Path(output_dir)
+        self.writer = ExcelWriter(excel_path, sheet_name, compression=compression, deterministic=deterministic)
+        self.handle = self.writer.open_workbook()
+        self.mapping_valid = self.writer.validate_mapping(TRIAL_BALANCE_MAPPING, self.handle)
+        self.template_values = {cell: self.handle.worksheet[cell].value
+                                for cell in TRIAL_BALANCE_MAPPING.values()}
+
+    def close(self):
+        """关闭模板工作簿"""
+        self.handle.close()
+
+    def __enter__(self) -> "_TemplateSession":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def sync(self, json_path: str) -> Dict[str, Any]:
+        """同步一个JSON文件，返回与sync_from_json_file相同结构的结果"""
+        started = time.perf_counter()
+        result = {
+            "status": "started",
+            "json_file": json_path,
+            "mapping_valid": self.mapping_valid,
+            "write_status": {},
+            "errors": []
+        }
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                api_data = json.load(f)
+            self.write_record(api_data, result)
+
+        except FileNotFoundError:
+            result.update({"status": "error", "error": f"找不到JSON文件: {json_path}"})
+        except json.JSONDecodeError as e:
+            result.update({"status": "error", "error": f"JSON文件格式错误: {str(e)}"})
+        except Exception as e:
+            result.update({"status": "error", "error": f"同步失败: {str(e)}"})
+
+        if result["status"] == "error":
+            logger.error(f"{json_path}: {result['error']}")
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+
+    def write_record(self, api_data: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        清理一条API数据并写入一个新的输出工作簿
+
+        参数:
+            api_data: 原始API数据
+            result: 要填写的结果字典
+
+        返回:
+            填写后的result
+        """
+        cleaned_data = prepare_api_data(api_data)
+
+        if not self.mapping_valid:
+            result["errors"].append("映射验证失败")
+            result["status"] = "validation_failed"
+            return result
+
+        for cell, value in self.template_values.items():
+            self.handle.worksheet[cell] = value
+        result["write_status"] = self.writer.write_data(cleaned_data, TRIAL_BALANCE_MAPPING, self.handle.worksheet)
+
+        failed_writes = [field for field, status in result["write_status"].items()
+                         if status != "success"]
+        if failed_writes:
+            result["errors"].append(f"写入失败的字段: {failed_writes}")
+            result["status"] = "partial_success"
+        else:
+            result["status"] = "success"
+
+        if self.writer.deterministic:
+            buffer = io.BytesIO()
+            self.writer.save_workbook(self.handle, buffer)
+            output_path, result["output_cached"] = _save_content_addressed(
+                self.output_dir, self.excel_path, buffer.getvalue())
+        else:
+            output_path = output_path_for(self.output_dir, make_output_filename(self.excel_path), create=True)
+            self.writer.save_workbook(self.handle, str(output_path))
+            record_output(output_path, "output", str(self.output_dir))
+
+        result["output_file"] = str(output_path)
+        _summarize_writes(result)
+        return result
+
+
+# 工作进程内的模板会话，由进程池的initializer创建
+_worker_session: Optional[_TemplateSession] = None
+
+
+def _init_batch_worker(excel_path: str, sheet_name: str, output_dir: str, compression: Optional[str] = None,
+                       deterministic: Optional[bool] = None):
+    global _worker_session
+    _worker_session = _TemplateSession(excel_path, sheet_name, output_dir, compression, deterministic)
+    # 工作进程退出时关闭模板工作簿（进程池的工作进程不执行atexit）
+    Finalize(_worker_session, _worker_session.close, exitpriority=0)
+
+
+def _sync_in_worker(json_path: str) -> Dict[str, Any]:
+    return _worker_session.sync(json_path)
+
+
+def expand_batch_paths(pattern: str) -> List[str]:
+    """
+    展开批量模式的输入：目录下的全部 .json 文件，或glob模式匹配的文件
+
+    返回:
+        按路径排序的文件列表
+    """
+    if Path(pattern).is_dir():
+        return sorted(str(p) for p in Path(pattern).glob("*.json"))
+    return sorted(p for p in glob.glob(pattern, recursive=True) if Path(p).is_file())
+
+
+def iter_jsonl_records(jsonl_path: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    逐行读取JSONL文件，内存占用只与单行大小有关
+
+    返回:
+        (行号, 记录, 错误信息) 的迭代器；解析失败时记录为None，空行跳过
+    """
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"JSON格式错误: {str(e)}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "每行必须是一个JSON对象"
+                continue
+            yield line_no, record, None
+
+
+def load_checkpoint(checkpoint_path: str) -> Set[str]:
+    """读取检查点文件中已成功同步的JSON文件路径"""
+    done = set()
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下不完整的最后一行
+                    continue
+                if entry.get("status") in ("success", "partial_success"):
+                    done.add(entry["json_file"])
+    except FileNotFoundError:
+        pass
+    return done
+
 
 class ExcelSync:
     """
     简单的JSON到Excel同步器
     """
     
-    def __init__(self, excel_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS"):
+    def __init__(self, excel_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS",
+                 compression: Optional[str] = None, deterministic: Optional[bool] = None,
+                 write_queue: Optional[WriteBehindQueue] = None):
         """
         初始化ExcelSync
         
         参数:
             excel_path: Excel文件路径
             sheet_name: 工作表名称
+            compression: 输出工作簿的压缩配置（stored/fast/default/max），None表示默认配置
+            deterministic: 确定性输出，相同的模板和数据生成相同的文件，输出文件名为内容哈希
+            write_queue: 原地更新使用的写入队列，默认为进程内共享的队列
         """
         self.excel_path = excel_path
         self.sheet_name = sheet_name
-        self.writer = ExcelWriter(excel_path, sheet_name)
+        self.writer = ExcelWriter(excel_path, sheet_name, compression=compression, deterministic=deterministic)
+        self.compression = self.writer.compression
+        self.write_queue = write_queue or get_write_behind_queue()
         
         # 创建输出文件夹
         self.output_dir = Path("output")
         self.output_dir.mkdir(exist_ok=True)
         
-    def sync_from_json_file(self, json_path: str) -> Dict[str, Any]:
+        # 模板备份按内容去重，模板未变化时不再复制
+        self.backups = BackupStore(self.output_dir / "backups")
+        
+    def sync_from_json_file(self, json_path: str, in_place: bool = False) -> Dict[str, Any]:
         """
         从JSON文件读取数据并写入Excel
         
         参数:
             json_path: JSON文件路径
+            in_place: 直接更新模板文件而不是生成新的输出文件；
+                      只写入有变化的单元格，所有值都未变化时不保存。
+                      经由写入队列提交，同一进程中并发更新同一工作簿的同步合并为一次保存
             
         返回:
             同步结果字典
@@ -70,36 +295,46 @@ class ExcelSync:
             logger.info("清理数据...")
             cleaned_data = prepare_api_data(api_data)
             
-            # 创建输出文件路径
-            output_filename = f"mapping_output_{timestamp}.xlsx"
-            output_path = self.output_dir / output_filename
-            
-            # 备份原文件到输出文件夹
-            backup_filename = f"mapping_backup_{timestamp}.xlsx"
-            backup_path = self.output_dir / backup_filename
-            shutil.copy2(self.excel_path, backup_path)
-            logger.info(f"已创建备份: {backup_path}")
+            # 备份原文件（相同内容只保存一份）
+            backup = self.backups.backup(self.excel_path, timestamp)
             
-            # 写入数据到输出文件
-            logger.info("写入数据到Excel...")
-            result = self.writer.process_api_data(cleaned_data, TRIAL_BALANCE_MAPPING, str(output_path))
+            if in_place:
+                # 原地更新：只写入有变化的单元格，没有变化时不保存；
+                # 写入队列合并同一工作簿的并发更新，保存时持有文件锁，其他进程的同步不会覆盖本次写入
+                logger.info("原地更新Excel...")
+                output_path = Path(self.excel_path)
+                future = self.write_queue.submit(output_path, cleaned_data, self.sheet_name, self.compression)
+                # 合并的提交共享同一个结果，复制后再添加本次同步的信息
+                result = dict(future.result())
+            elif self.writer.deterministic:
+                output_path, result = self._write_content_addressed(cleaned_data)
+            else:
+                # 创建输出文件路径
+                output_filename = make_output_filename(self.excel_path)
+                output_path = output_path_for(self.output_dir, output_filename, create=True)
+                
+                # 写入数据到输出文件
+                logger.info("写入数据到Excel...")
+                result = self.writer.process_api_data(cleaned_data, TRIAL_BALANCE_MAPPING, str(output_path))
+                if output_path.exists():
+                    record_output(output_path, "output", str(self.output_dir))
             
             # 计算成功率
-            successful_writes = sum(1 for status in result["write_status"].values() 
-                                  if status == "success")
-            total_fields = len(TRIAL_BALANCE_MAPPING)
+            _summarize_writes(result)
+            successful_writes = result["successful_writes"]
+            total_fields = result["total_fields"]
             
             result.update({
                 "timestamp": timestamp,
                 "json_file": json_path,
                 "output_file": str(output_path),
-                "backup_file": str(backup_path),
-                "total_fields": total_fields,
-                "successful_writes": successful_writes,
-                "success_rate": f"{(successful_writes/total_fields)*100:.1f}%"
+                "backup_file": backup["blob_path"],
+                "backup_hash": backup["hash"]
             })
             
-            if successful_writes == total_fields:
+            if result.get("save_skipped"):
+                logger.info(f"所有字段的值都未变化，未修改 {output_path}")
+            elif successful_writes == total_fields:
                 logger.info(f"同步成功完成: {successful_writes}/{total_fields} 字段已写入")
                 logger.info(f"输出文件: {output_path}")
             else:
@@ -120,33 +355,482 @@ class ExcelSync:
             logger.error(error_msg)
             return {"status": "error", "error": error_msg}
 
+    def _write_content_addressed(self, cleaned_data: Dict[str, Any]) -> Tuple[Optional[Path], Dict[str, Any]]:
+        """
+        确定性输出：在内存中生成工作簿，以内容哈希命名
+        相同内容的输出文件已存在时不再写入（结果中output_cached为True），只刷新其使用时间并重新登记
+        """
+        logger.info("写入数据到Excel（确定性输出）...")
+        buffer = io.BytesIO()
+        result = self.writer.process_api_data(cleaned_data, TRIAL_BALANCE_MAPPING, buffer)
+        content = buffer.getvalue()
+        if not content:
+            return None, result
+        
+        output_path, result["output_cached"] = _save_content_addressed(self.output_dir, self.excel_path, content)
+        return output_path, result
+    
+    def sync_from_jsonl_file(self, jsonl_path: str, output_mode: str = "workbook",
+                             sheet_title: str = DEFAULT_SHEET_TITLE,
+                             company_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        逐行读取JSONL文件（每行一个公司的API数据）并写入Excel
+
+        参数:
+            jsonl_path: JSONL文件路径
+            output_mode: workbook 每条记录生成一个工作簿；
+                         sheet 每条记录复制一份模板工作表，全部写入同一个工作簿后只保存一次
+            sheet_title: sheet方式的工作表命名格式，{index} 为行号
+            company_key: sheet方式下的公司键字段名，相同公司的记录写入同一工作表
+
+        返回:
+            同步结果字典，failed_lines 列出失败的行号和原因
+        """
+        if output_mode not in JSONL_OUTPUT_MODES:
+            return {"status": "error", "error": f"不支持的输出方式: {output_mode}"}
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        records = 0
+        failed_lines = []
+        output_files = []
+
+        try:
+            backup = self.backups.backup(self.excel_path, timestamp)
+            logger.info(f"读取JSONL文件: {jsonl_path}（输出方式: {output_mode}）")
+
+            if output_mode == "workbook":
+                with _TemplateSession(self.excel_path, self.sheet_name, str(self.output_dir),
+                                      self.compression, self.writer.deterministic) as session:
+                    for line_no, record, error in iter_jsonl_records(jsonl_path):
+                        records += 1
+                        if error is None:
+                            try:
+                                result = session.write_record(record, {"status": "started", "write_status": {}, "errors": []})
+                            except Exception as e:
+                                result = {"status": "error", "errors": [str(e)]}
+                            if result["status"] in ("success", "partial_success"):
+                                output_files.append({"line": line_no, "status": result["status"],
+                                                     "output_file": result["output_file"]})
+                                continue
+                            error = "; ".join(result["errors"])
+                        failed_lines.append({"line": line_no, "error": error})
+
+            else:
+                handle = self.writer.open_workbook()
+                try:
+                    if not self.writer.validate_mapping(TRIAL_BALANCE_MAPPING, handle):
+                        return {"status": "validation_failed", "error": "映射验证失败", "jsonl_file": jsonl_path}
+
+                    for line_no, record, error in iter_jsonl_records(jsonl_path):
+                        records += 1
+                        if error is None:
+                            # 单条记录失败（如工作表命名格式无效）只记入failed_lines，不中断其他记录
+                            try:
+                                # 公司键在清理前取出，避免被当作数值处理
+                                cleaned_data = prepare_api_data(record)
+                                if company_key and company_key in record:
+                                    cleaned_data[company_key] = record[company_key]
+                                entry = self.writer.write_record_sheet(handle, cleaned_data, TRIAL_BALANCE_MAPPING,
+                                                                       line_no, sheet_title, company_key)
+                            except Exception as e:
+                                error = f"写入工作表失败: {str(e)}"
+                            else:
+                                output_files.append({"line": line_no, "sheet": entry["sheet"], "status": entry["status"]})
+                                continue
+                        failed_lines.append({"line": line_no, "error": error})
+
+                    if output_files and self.writer.deterministic:
+                        buffer = io.BytesIO()
+                        self.writer.save_workbook(handle, buffer)
+                        output_path, _ = _save_content_addressed(self.output_dir, self.excel_path, buffer.getvalue())
+                    elif output_files:
+                        output_path = output_path_for(self.output_dir, make_output_filename(self.excel_path), create=True)
+                        self.writer.save_workbook(handle, str(output_path))
+                        record_output(output_path, "output", str(self.output_dir))
+                    if output_files:
+                        for entry in output_files:
+                            entry["output_file"] = str(output_path)
+                finally:
+                    handle.close()
+
+        except FileNotFoundError as e:
+            error_msg = f"找不到文件: {e.filename}"
+            logger.error(error_msg)
+            return {"status": "error", "error": error_msg}
+        except Exception as e:
+            error_msg = f"同步失败: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "error": error_msg}
+
+        if not output_files:
+            status = "error"
+        elif failed_lines or any(entry["status"] != "success" for entry in output_files):
+            status = "partial_success"
+        else:
+            status = "success"
+
+        for failure in failed_lines:
+            logger.warning(f"第 {failure['line']} 行同步失败: {failure['error']}")
+        logger.info(f"JSONL同步完成: {len(output_files)}/{records} 条记录已写入")
+
+        return {
+            "status": status,
+            "timestamp": timestamp,
+            "jsonl_file": jsonl_path,
+            "output_mode": output_mode,
+            "records": records,
+            "succeeded": len(output_files),
+            "outputs": output_files,
+            "failed_lines": failed_lines,
+            "backup_file": backup["blob_path"],
+            "backup_hash": backup["hash"]
+        }
+
+    def sync_time_series(self, json_paths: List[str], header_row: Optional[int] = None,
+                         append_to: Optional[str] = None) -> Dict[str, Any]:
+        """
+        把同一公司多个期间的JSON数据写入同一个工作簿的连续列（D、F、G……）
+
+        参数:
+            json_paths: 按时间顺序排列的JSON文件，文件名（不含扩展名）作为期间标签
+            header_row: 写入期间标签的行号，None表示不写标签
+            append_to: 追加到已有的时间序列输出文件，而不是从模板新建；需要同时指定header_row
+
+        返回:
+            同步结果字典
+        """
+        if append_to and not header_row:
+            # 没有期间标签就无法找到已写入的列，重复追加会产生重复的列
+            return {"status": "error", "error": "追加模式需要指定header_row（期间标签所在行）"}
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        try:
+            periods = []
+            for json_path in json_paths:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    periods.append((Path(json_path).stem, prepare_api_data(json.load(f))))
+
+            if append_to:
+                # 追加会覆盖原文件，先备份
+                backup = self.backups.backup(append_to, timestamp)
+                output_path = Path(append_to)
+            else:
+                backup = self.backups.backup(self.excel_path, timestamp)
+                output_path = output_path_for(self.output_dir, make_output_filename(self.excel_path), create=True)
+
+            logger.info(f"写入 {len(periods)} 个期间到 {output_path}")
+            result = self.writer.process_time_series(periods, TRIAL_BALANCE_MAPPING, str(output_path),
+                                                     header_row=header_row, append_to=append_to)
+            if not append_to and output_path.exists():
+                record_output(output_path, "output", str(self.output_dir))
+
+            result.update({
+                "timestamp": timestamp,
+                "json_files": list(json_paths),
+                "output_file": str(output_path),
+                "backup_file": backup["blob_path"],
+                "backup_hash": backup["hash"]
+            })
+            return result
+
+        except FileNotFoundError as e:
+            error_msg = f"找不到文件: {e.filename}"
+            logger.error(error_msg)
+            return {"status": "error", "error": error_msg}
+        except json.JSONDecodeError as e:
+            error_msg = f"JSON文件格式错误: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "error": error_msg}
+        except Exception as e:
+            error_msg = f"同步失败: {str(e)}"
+            logger.error(error_msg)
+            return {"status": "error", "error": error_msg}
+
+    def iter_sync(self, paths: Iterable[str], workers: int = 1,
+                  checkpoint_path: Optional[str] = None,
+                  resume: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        批量同步多个JSON文件，按完成顺序逐个返回结果
+
+        每个工作进程只加载一次模板，避免为每个文件重复启动解释器和加载模板。
+
+        参数:
+            paths: JSON文件路径
+            workers: 工作进程数，1表示在当前进程内顺序处理
+            checkpoint_path: 检查点文件，每完成一个文件追加一行结果
+            resume: 跳过检查点中已成功同步的文件
+
+        返回:
+            结果字典的迭代器；跳过的文件返回 status 为 skipped 的结果
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup = self.backups.backup(self.excel_path, timestamp)
+        done = load_checkpoint(checkpoint_path) if checkpoint_path and resume else set()
+
+        pending = []
+        for path in map(str, paths):
+            if path in done:
+                yield {"status": "skipped", "json_file": path}
+            else:
+                pending.append(path)
+
+        checkpoint = None
+        if checkpoint_path:
+            Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+            checkpoint = open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8')
+
+        def finish(result: Dict[str, Any]) -> Dict[str, Any]:
+            result.update({"timestamp": timestamp, "backup_file": backup["blob_path"],
+                           "backup_hash": backup["hash"]})
+            if checkpoint:
+                checkpoint.write(json.dumps({"json_file": result["json_file"], "status": result["status"],
+                                             "output_file": result.get("output_file")},
+                                            ensure_ascii=False) + "\n")
+                checkpoint.flush()
+            return result
+
+        try:
+            if workers <= 1:
+                with _TemplateSession(self.excel_path, self.sheet_name, str(self.output_dir),
+                                      self.compression, self.writer.deterministic) as session:
+                    for path in pending:
+                        yield finish(session.sync(path))
+                return
+
+            logger.info(f"启动批量同步: {len(pending)} 个文件，{workers} 个工作进程")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                     initargs=(self.excel_path, self.sheet_name, str(self.output_dir),
+                                               self.compression, self.writer.deterministic)) as pool:
+                queue = iter(pending)
+                in_flight = {}
+                # 限制排队任务数，避免一次提交数万个任务
+                for path in queue:
+                    in_flight[pool.submit(_sync_in_worker, path)] = path
+                    if len(in_flight) >= workers * BATCH_QUEUE_PER_WORKER:
+                        break
+
+                while in_flight:
+                    completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        path = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {"status": "error", "json_file": path, "error": f"工作进程异常: {str(e)}"}
+                        yield finish(result)
+
+                        next_path = next(queue, None)
+                        if next_path is not None:
+                            in_flight[pool.submit(_sync_in_worker, next_path)] = next_path
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+
+class BatchReport:
+    """统计批量同步的结果并输出进度和汇总报告"""
+
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.counts: Dict[str, int] = {}
+        self.failures: List[Dict[str, Any]] = []
+
+    @property
+    def processed(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: Dict[str, Any]):
+        status = result.get("status", "error")
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status not in ("success", "partial_success", "skipped"):
+            self.failures.append({"json_file": result.get("json_file"),
+                                  "status": status,
+                                  "error": result.get("error") or "; ".join(result.get("errors", []))})
+        self.print_progress()
+
+    def print_progress(self):
+        processed = self.processed
+        elapsed = time.perf_counter() - self.started
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        line = (f"[{processed}/{self.total}] 成功 {self.counts.get('success', 0)} "
+                f"部分成功 {self.counts.get('partial_success', 0)} 失败 {len(self.failures)} "
+                f"跳过 {self.counts.get('skipped', 0)}  {rate:.1f} 个/秒")
+        if self.stream.isatty():
+            end = "\n" if processed == self.total else ""
+            self.stream.write(f"\r{line}{end}")
+        elif processed % 100 == 0 or processed == self.total:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "processed": self.processed,
+            "counts": dict(self.counts),
+            "failures": self.failures,
+            "elapsed_seconds": round(time.perf_counter() - self.started, 2)
+        }
+
+    def write(self, report_path: str) -> Dict[str, Any]:
+        summary = self.summary()
+        Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
+
+
+def run_batch(args) -> int:
+    """命令行批量模式"""
+    paths = expand_batch_paths(args.batch)
+    if not paths:
+        print(f"错误: 没有匹配 '{args.batch}' 的JSON文件")
+        return 1
+
+    sync = ExcelSync(args.excel, args.sheet, args.compression, args.deterministic or None)
+    checkpoint_path = args.checkpoint or str(sync.output_dir / "batch_checkpoint.jsonl")
+    report_path = args.report or str(sync.output_dir / f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    report = BatchReport(len(paths))
+    for result in sync.iter_sync(paths, workers=args.workers,
+                                 checkpoint_path=checkpoint_path, resume=args.resume):
+        report.add(result)
+    summary = report.write(report_path)
+
+    print("\n=== 批量同步结果 ===")
+    print(f"📦 文件总数: {summary['total']}")
+    print(f"✅ 成功: {summary['counts'].get('success', 0)}")
+    print(f"⚠️  部分成功: {summary['counts'].get('partial_success', 0)}")
+    print(f"⏭️  跳过: {summary['counts'].get('skipped', 0)}")
+    print(f"❌ 失败: {len(summary['failures'])}")
+    print(f"⏱️  耗时: {summary['elapsed_seconds']} 秒")
+    print(f"📝 汇总报告: {report_path}")
+    print(f"📍 检查点: {checkpoint_path}")
+
+    return 0 if not summary["failures"] else 1
+
+
+def run_jsonl(args) -> int:
+    """命令行JSONL模式"""
+    sync = ExcelSync(args.excel, args.sheet, args.compression, args.deterministic or None)
+    result = sync.sync_from_jsonl_file(args.jsonl, args.jsonl_output,
+                                       sheet_title=args.sheet_title, company_key=args.company_key)
+
+    print("\n=== JSONL同步结果 ===")
+    if result["status"] in ("success", "partial_success"):
+        print(f"✅ 已写入: {result['succeeded']}/{result['records']} 条记录")
+        output_files = sorted({entry["output_file"] for entry in result["outputs"]})
+        if len(output_files) == 1:
+            print(f"📄 输出文件: {output_files[0]}")
+        else:
+            print(f"📄 输出文件: {len(output_files)} 个")
+        for failure in result["failed_lines"]:
+            print(f"❌ 第 {failure['line']} 行: {failure['error']}")
+    else:
+        print(f"❌ 失败: {result.get('error') or '没有可写入的记录'}")
+        for failure in result.get("failed_lines", []):
+            print(f"❌ 第 {failure['line']} 行: {failure['error']}")
+
+    return 0 if result["status"] == "success" else 1
+
+
+def run_time_series(args) -> int:
+    """命令行时间序列模式"""
+    sync = ExcelSync(args.excel, args.sheet, args.compression, args.deterministic or None)
+    result = sync.sync_time_series(args.time_series, header_row=args.header_row, append_to=args.append_to)
+
+    print("\n=== 时间序列同步结果 ===")
+    if result["status"] in ("success", "partial_success"):
+        for entry in result["periods"]:
+            print(f"📅 {entry['period']} → {entry['column']}列: 写入 {entry['written']}，未变化 {entry['unchanged']}")
+        if result.get("save_skipped"):
+            print(f"⏭️  所有值都未变化，未保存 {result['output_file']}")
+        else:
+            print(f"📄 输出文件: {result['output_file']}")
+    else:
+        print(f"❌ 失败: {result.get('error') or '; '.join(result.get('errors', [])) or '未知错误'}")
+
+    return 0 if result["status"] in ("success", "partial_success") else 1
+
 
 def main():
     """单一主函数 - 从JSON文件同步到Excel"""
     import argparse
     
     parser = argparse.ArgumentParser(description="ExcelSync - 简单的JSON到Excel数据同步工具")
-    parser.add_argument("json_file", help="包含数据的JSON文件路径")
+    parser.add_argument("json_file", nargs="?", help="包含数据的JSON文件路径")
     parser.add_argument("--excel", default="mapping.xlsx", help="Excel文件路径")
+    parser.add_argument("--in-place", action="store_true",
+                        help="直接更新Excel文件而不生成新的输出文件，值未变化时不保存")
     parser.add_argument("--sheet", default="A社貼り付けBS", help="工作表名称")
+    parser.add_argument("--compression", choices=list(COMPRESSION_PROFILES),
+                        help="输出工作簿的压缩配置，默认为环境变量EXCEL_COMPRESSION或default")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="确定性输出：相同的模板和数据生成相同的文件，文件名为内容哈希")
+    parser.add_argument("--jsonl", metavar="FILE", help="JSONL模式：每行一个API数据对象")
+    parser.add_argument("--jsonl-output", choices=JSONL_OUTPUT_MODES, default="workbook",
+                        help="JSONL模式的输出方式：每条记录一个工作簿(workbook)或一个工作表(sheet)")
+    parser.add_argument("--sheet-title", default=DEFAULT_SHEET_TITLE,
+                        help="sheet输出方式的工作表命名格式，可用 {sheet}、{index}、{company}")
+    parser.add_argument("--company-key", help="sheet输出方式的公司键字段名，相同公司写入同一工作表")
+    parser.add_argument("--time-series", nargs="+", metavar="JSON_FILE",
+                        help="时间序列模式：按时间顺序的多个JSON文件写入同一工作簿的连续列")
+    parser.add_argument("--append-to", metavar="XLSX",
+                        help="时间序列模式：追加到已有的输出文件（需要同时指定 --header-row）")
+    parser.add_argument("--header-row", type=int, help="时间序列模式：写入期间标签（文件名）的行号")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="批量模式：目录或glob模式，如 'data/**/*.json'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="批量模式的工作进程数")
+    parser.add_argument("--checkpoint", help="批量模式的检查点文件，默认为 output/batch_checkpoint.jsonl")
+    parser.add_argument("--resume", action="store_true", help="跳过检查点中已成功同步的文件")
+    parser.add_argument("--report", help="批量模式的汇总报告路径，默认为 output/batch_report_<时间>.json")
     
     args = parser.parse_args()
+    if args.append_to and not args.header_row:
+        parser.error("--append-to 需要同时指定 --header-row")
+    
+    # 只在命令行入口配置日志；作为模块导入时由调用方决定日志输出
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('excel_sync.log'),
+            logging.StreamHandler()
+        ]
+    )
+    
+    if args.batch:
+        return run_batch(args)
+    if args.jsonl:
+        return run_jsonl(args)
+    if args.time_series:
+        return run_time_series(args)
+    if not args.json_file:
+        parser.error("需要指定JSON文件、--jsonl 或 --batch")
     
     # 检查JSON文件是否存在
     if not Path(args.json_file).exists():
         print(f"错误: 找不到JSON文件 '{args.json_file}'")
         return 1
     
-    # 执行同步
-    sync = ExcelSync(args.excel, args.sheet)
-    result = sync.sync_from_json_file(args.json_file)
+    # 执行同步；命令行只有一个更新，写入队列无需等待合并
+    sync = ExcelSync(args.excel, args.sheet, args.compression, args.deterministic or None,
+                     write_queue=WriteBehindQueue(flush_interval=0))
+    result = sync.sync_from_json_file(args.json_file, in_place=args.in_place)
     
     # 输出结果
     print("\n=== 同步结果 ===")
-    if result["status"] == "success":
+    if result.get("save_skipped"):
+        print(f"⏭️  未变化: {result['unchanged']} 个字段与文件中的值相同，未保存 {result['output_file']}")
+    elif result["status"] == "success":
         print(f"✅ 成功: {result['success_rate']} ({result['successful_writes']}/{result['total_fields']} 字段)")
         print(f"📄 输出文件: {result['output_file']}")
         print(f"🔄 备份文件: {result['backup_file']}")
+        if result.get("output_cached"):
+            print("♻️  相同内容的输出已存在，未重新写入")
+        if args.in_place:
+            print(f"✏️  变化: {result['changed']} 个字段，未变化: {result['unchanged']} 个字段")
     elif result["status"] == "partial_success":
         print(f"⚠️  部分成功: {result['success_rate']} ({result['successful_writes']}/{result['total_fields']} 字段)")
         print(f"📄 输出文件: {result['output_file']}")
@@ -4,49 +4,154 @@ ExcelSync项目的Excel写入模块
 将API数据写入mapping.xlsx的D列特定单元格
 """
 
-import pandas as pd
-from openpyxl import load_workbook
-from typing import Dict, Any, Optional
+import io
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
 import logging
 import json
 from pathlib import Path
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from mapping_compiler import MappingError, compile_cells
+from workbook_archive import DEFAULT_DETERMINISTIC, resolve_compression, save_workbook as save_archive
+
+# openpyxl在首次使用时才导入，CLI启动和只用到配置的调用方无需加载
 logger = logging.getLogger(__name__)
 
+# 多公司模式的默认工作表名称，可用占位符: {sheet} 模板工作表名, {index} 序号, {company} 公司键的值
+DEFAULT_SHEET_TITLE = "{sheet}_{index}"
+
+# 时间序列模式：第一个期间写入D列，之后依次向右，跳过E列的科目名称
+TIME_SERIES_START_COLUMN = "D"
+TIME_SERIES_SKIP_COLUMNS = {"E"}
+
+# Excel工作表名称的限制
+SHEET_TITLE_MAX = 31
+_INVALID_SHEET_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+# 映射单元格对应的科目名称列
+LABEL_COLUMN = "E"
+
+# 映射验证结果的缓存：(模板内容哈希, 工作表, 映射版本) → 是否有效
+# 键中包含模板内容哈希，模板修改后自动使用新的键
+VALIDATION_CACHE_SIZE = 256
+_validation_cache: "OrderedDict[Tuple[str, str, str], bool]" = OrderedDict()
+_validation_lock = threading.Lock()
+
+# 原地同步时记录映射单元格当前值的快照文件（与工作簿同目录），值未变化时无需加载和保存工作簿
+SNAPSHOT_SUFFIX = ".sync_snapshot.json"
+
+# 模板文件路径 → (文件状态, 内容哈希)，文件未变化时无需重新计算哈希
+_file_hashes: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+
+
+def _stat_signature(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def _snapshot_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}{SNAPSHOT_SUFFIX}")
+
+
+def _count_changes(write_status: Dict[str, str]) -> Dict[str, int]:
+    """统计写入状态中有变化和未变化的字段数"""
+    return {
+        "changed": sum(1 for status in write_status.values() if status == "success"),
+        "unchanged": sum(1 for status in write_status.values() if status == "unchanged")
+    }
+
+
+def _file_content_hash(path: Path) -> str:
+    """返回文件的内容哈希；大小、修改时间和inode都未变化时直接使用缓存"""
+    stat = path.stat()
+    signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    key = str(path.resolve())
+    cached = _file_hashes.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    content_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+    _file_hashes[key] = (signature, content_hash)
+    return content_hash
+
+
+class WorkbookHandle:
+    """
+    一次写入请求独占的工作簿句柄
+    ExcelWriter本身只保存模板路径、工作表名称和模板内容等不可变状态，加载的工作簿都放在句柄中，
+    因此同一个ExcelWriter可以同时被多个线程使用
+    """
+
+    def __init__(self, workbook, worksheet, source_hash: Optional[str]):
+        self.workbook = workbook
+        self.worksheet = worksheet
+        # 加载的工作簿内容哈希，用于缓存映射验证结果
+        self.source_hash = source_hash
+        # 多公司模式下 公司键的值 → 工作表名称
+        self.company_sheets: Dict[str, str] = {}
+
+    def close(self):
+        """关闭工作簿"""
+        self.workbook.close()
+        logger.info("工作簿已关闭")
+
 
 class ExcelWriter:
     """
     处理将API数据写入Excel试算表的特定单元格
     只处理E列有值的D列34个特定单元格
+
+    实例不保存工作簿：process_*方法每次调用都打开自己的WorkbookHandle，可以在多线程间共享；
+    需要分步操作时用open_workbook取得句柄，再传给write_data、save_workbook等方法
     """
     
-    def __init__(self, excel_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS"):
+    def __init__(self, excel_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS",
+                 template_bytes: Optional[bytes] = None, compression: Optional[str] = None,
+                 deterministic: Optional[bool] = None):
         """
         初始化Excel写入器
         
         参数:
             excel_path: Excel文件路径
             sheet_name: 要写入的工作表名称
+            template_bytes: 可选的模板文件内容（如模板注册表中缓存的内容），指定时不再读取excel_path
+            compression: 保存时的压缩配置（stored/fast/default/max），None表示环境变量EXCEL_COMPRESSION的配置
+            deterministic: 确定性输出（固定时间戳和ZIP成员顺序），None表示环境变量EXCEL_DETERMINISTIC的配置
         """
         self.excel_path = Path(excel_path)
         self.sheet_name = sheet_name
-        self.workbook = None
-        self.worksheet = None
+        self.template_bytes = template_bytes
+        self.compression = resolve_compression(compression).name
+        self.deterministic = DEFAULT_DETERMINISTIC if deterministic is None else deterministic
+        self._template_bytes_hash = hashlib.sha256(template_bytes).hexdigest() if template_bytes is not None else None
+        
+    def open_workbook(self, path: Optional[Union[str, Path]] = None) -> WorkbookHandle:
+        """
+        加载Excel工作簿并选择工作表
+        
+        参数:
+            path: 可选的工作簿路径（如追加模式下已有的输出文件），默认为模板
+            
+        返回:
+            调用方独占的工作簿句柄，用完后调用其close方法
+        """
+        if path is None and self.template_bytes is not None:
+            source = io.BytesIO(self.template_bytes)
+        else:
+            source = path if path is not None else self.excel_path
+        path = path if path is not None else self.excel_path
+        from openpyxl import load_workbook
         
-    def load_workbook(self):
-        """加载Excel工作簿并选择工作表"""
         try:
-            self.workbook = load_workbook(self.excel_path)
-            self.worksheet = self.workbook[self.sheet_name]
-            logger.info(f"成功加载工作簿: {self.excel_path}")
+            workbook = load_workbook(source)
+            worksheet = workbook[self.sheet_name]
+            logger.info(f"成功加载工作簿: {path}")
             logger.info(f"已选择工作表: {self.sheet_name}")
+            return WorkbookHandle(workbook, worksheet, self._source_hash(source))
         except FileNotFoundError:
-            logger.error(f"找不到Excel文件: {self.excel_path}")
+            logger.error(f"找不到Excel文件: {path}")
             raise
         except KeyError:
             logger.error(f"工作簿中找不到工作表 '{self.sheet_name}'")
@@ -55,20 +160,29 @@ class ExcelWriter:
             logger.error(f"加载工作簿时出错: {str(e)}")
             raise
     
-    def write_data(self, api_data: Dict[str, Any], mapping: Dict[str, str]) -> Dict[str, str]:
+    def _source_hash(self, source=None) -> Optional[str]:
+        """返回工作簿的内容哈希（默认为模板），无法计算时返回None（不缓存验证结果）"""
+        try:
+            if (source is None and self.template_bytes is not None) or isinstance(source, io.BytesIO):
+                return self._template_bytes_hash
+            return _file_content_hash(Path(source if source is not None else self.excel_path))
+        except (OSError, TypeError):
+            return None
+    
+    def write_data(self, api_data: Dict[str, Any], mapping: Dict[str, str], worksheet,
+                   only_changed: bool = False) -> Dict[str, str]:
         """
         根据映射将API数据写入特定单元格
         
         参数:
             api_data: 包含API响应数据的字典
             mapping: API字段名到单元格位置的映射字典
+            worksheet: 目标工作表（句柄的worksheet或copy_template_sheet返回的副本）
+            only_changed: 只写入与单元格当前值不同的字段，相同的字段状态为unchanged
             
         返回:
             每个字段的写入状态字典
         """
-        if not self.workbook:
-            self.load_workbook()
-            
         write_status = {}
         
         for api_field, cell_location in mapping.items():
@@ -80,8 +194,12 @@ class ExcelWriter:
                     write_status[api_field] = "missing"
                     continue
                 
+                if only_changed and worksheet[cell_location].value == value:
+                    write_status[api_field] = "unchanged"
+                    continue
+                
                 # 写入单元格
-                self.worksheet[cell_location] = value
+                worksheet[cell_location] = value
                 logger.info(f"已将 {api_field} = {value} 写入单元格 {cell_location}")
                 write_status[api_field] = "success"
                 
@@ -91,102 +209,544 @@ class ExcelWriter:
         
         return write_status
     
-    def save_workbook(self, output_path: Optional[str] = None):
+    def copy_template_sheet(self, handle: WorkbookHandle, title: str):
+        """
+        在同一工作簿内复制模板工作表
+        
+        参数:
+            handle: 工作簿句柄
+            title: 新工作表的名称
+            
+        返回:
+            复制出的工作表
+        """
+        worksheet = handle.workbook.copy_worksheet(handle.worksheet)
+        worksheet.title = title
+        logger.debug(f"已复制工作表 {self.sheet_name} → {title}")
+        return worksheet
+    
+    def format_sheet_title(self, handle: Optional[WorkbookHandle],
+                           sheet_title: Union[str, Callable[[int, Dict[str, Any]], str]],
+                           index: int, api_data: Dict[str, Any], company_key: Optional[str] = None) -> str:
+        """
+        生成记录工作表的名称
+
+        参数:
+            handle: 工作簿句柄，用于避免与已有工作表重名；None表示不检查
+            sheet_title: 名称格式（占位符 {sheet}、{index}、{company}）或 (序号, 数据) → 名称 的函数
+            index: 记录序号
+            api_data: 记录数据
+            company_key: 公司键的字段名
+
+        返回:
+            去除非法字符并截断到31个字符、且在工作簿中不重复的名称
+        """
+        if callable(sheet_title):
+            title = sheet_title(index, api_data)
+        else:
+            company = api_data.get(company_key, "") if company_key else ""
+            title = sheet_title.format(sheet=self.sheet_name, index=index, company=company)
+
+        title = _INVALID_SHEET_TITLE_CHARS.sub('_', str(title)).strip("'") or str(index)
+        title = title[:SHEET_TITLE_MAX]
+
+        existing = set(handle.workbook.sheetnames) if handle else set()
+        candidate, n = title, 2
+        while candidate in existing:
+            suffix = f"_{n}"
+            candidate = title[:SHEET_TITLE_MAX - len(suffix)] + suffix
+            n += 1
+        return candidate
+
+    def write_record_sheet(self, handle: WorkbookHandle, api_data: Dict[str, Any], mapping: Dict[str, str], index: int,
+                           sheet_title: Union[str, Callable[[int, Dict[str, Any]], str]] = DEFAULT_SHEET_TITLE,
+                           company_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        将一条记录写入模板工作表的副本
+
+        指定company_key时每个公司只复制一次模板，同一公司的后续记录写入已有的工作表。
+
+        参数:
+            handle: 工作簿句柄
+            api_data: 记录数据
+            mapping: API字段名到单元格位置的映射字典
+            index: 记录序号，用于工作表命名
+            sheet_title: 工作表命名格式或函数
+            company_key: 公司键的字段名
+
+        返回:
+            包含sheet、company、status和write_status的字典
+        """
+        company = api_data.get(company_key) if company_key else None
+        if company is not None and str(company) in handle.company_sheets:
+            title = handle.company_sheets[str(company)]
+            worksheet = handle.workbook[title]
+            logger.info(f"公司 {company} 已有工作表 {title}，写入已有工作表")
+        else:
+            title = self.format_sheet_title(handle, sheet_title, index, api_data, company_key)
+            worksheet = self.copy_template_sheet(handle, title)
+            if company is not None:
+                handle.company_sheets[str(company)] = title
+
+        write_status = self.write_data(api_data, mapping, worksheet)
+        failed = any(status != "success" for status in write_status.values())
+        return {
+            "index": index,
+            "sheet": title,
+            "company": company,
+            "status": "partial_success" if failed else "success",
+            "write_status": write_status
+        }
+
+    def process_records(self, records: Iterable[Dict[str, Any]], mapping: Dict[str, str],
+                        output_path: Optional[Union[str, BinaryIO]] = None,
+                        sheet_title: Union[str, Callable[[int, Dict[str, Any]], str]] = DEFAULT_SHEET_TITLE,
+                        company_key: Optional[str] = None,
+                        keep_template_sheet: bool = True) -> Dict[str, Any]:
+        """
+        多公司模式：模板只加载一次，每条记录（或每个公司）一个工作表，最后只保存一次
+
+        参数:
+            records: 记录数据的可迭代对象
+            mapping: API字段名到单元格位置的映射字典
+            output_path: 可选的输出文件路径或可写的二进制流。如果为None，则覆盖原文件。
+            sheet_title: 工作表命名格式（占位符 {sheet}、{index}、{company}）或函数
+            company_key: 公司键的字段名，相同公司的记录写入同一工作表
+            keep_template_sheet: 是否保留原模板工作表
+
+        返回:
+            包含状态和每条记录结果的处理结果
+        """
+        result = {
+            "status": "started",
+            "mapping_valid": False,
+            "sheets": [],
+            "errors": []
+        }
+
+        handle = None
+        try:
+            handle = self.open_workbook()
+
+            result["mapping_valid"] = self.validate_mapping(mapping, handle)
+            if not result["mapping_valid"]:
+                result["errors"].append("映射验证失败")
+                result["status"] = "validation_failed"
+                return result
+
+            for index, api_data in enumerate(records, 1):
+                result["sheets"].append(
+                    self.write_record_sheet(handle, api_data, mapping, index, sheet_title, company_key))
+
+            if not result["sheets"]:
+                result["errors"].append("没有可写入的记录")
+                result["status"] = "error"
+                return result
+
+            if not keep_template_sheet:
+                handle.workbook.remove(handle.worksheet)
+
+            failed_sheets = [entry["sheet"] for entry in result["sheets"] if entry["status"] != "success"]
+            if failed_sheets:
+                result["errors"].append(f"部分字段写入失败的工作表: {failed_sheets}")
+                result["status"] = "partial_success"
+            else:
+                result["status"] = "success"
+
+            self.save_workbook(handle, output_path)
+            logger.info(f"已将 {len(result['sheets'])} 条记录写入 "
+                        f"{len(set(entry['sheet'] for entry in result['sheets']))} 个工作表")
+
+        except Exception as e:
+            result["errors"].append(str(e))
+            result["status"] = "error"
+            logger.error(f"处理多条记录时出错: {str(e)}")
+
+        finally:
+            if handle is not None:
+                handle.close()
+
+        return result
+
+    @staticmethod
+    def period_columns(start: str = TIME_SERIES_START_COLUMN) -> Iterator[str]:
+        """按顺序返回时间序列模式的期间列：D、F、G、H……"""
+        from openpyxl.utils import column_index_from_string, get_column_letter
+        
+        index = column_index_from_string(start)
+        while True:
+            column = get_column_letter(index)
+            if column not in TIME_SERIES_SKIP_COLUMNS:
+                yield column
+            index += 1
+    
+    @staticmethod
+    def shift_mapping(mapping: Dict[str, str], column: str) -> Dict[str, str]:
+        """把映射中的单元格移动到指定列，行号不变"""
+        from openpyxl.utils.cell import coordinate_from_string
+        
+        return {field: f"{column}{coordinate_from_string(cell)[1]}" for field, cell in mapping.items()}
+    
+    def _used_period_columns(self, handle: WorkbookHandle, mapping: Dict[str, str],
+                             header_row: Optional[int]) -> List[Tuple[str, Any]]:
+        """
+        返回工作表中已写入数据的期间列及其表头
+        
+        从D列开始依次检查，遇到第一个映射行和表头都为空的列即停止
+        """
+        from openpyxl.utils.cell import coordinate_from_string
+        
+        rows = [coordinate_from_string(cell)[1] for cell in mapping.values()]
+        used = []
+        for column in self.period_columns():
+            label = handle.worksheet[f"{column}{header_row}"].value if header_row else None
+            if label is None and all(handle.worksheet[f"{column}{row}"].value is None for row in rows):
+                break
+            used.append((column, label))
+        return used
+    
+    def process_column_data(self, column_data: Dict[str, Dict[str, Any]], mapping: Dict[str, str],
+                            output_path: Optional[Union[str, BinaryIO]] = None) -> Dict[str, Any]:
+        """
+        把同一份报表的多个数值列（如前月残高、借方金額、当月残高）写入模板的不同列，只保存一次
+        
+        参数:
+            column_data: 目标列 → 该列数据 的字典，如 {"D": {...}, "F": {...}}
+            mapping: API字段名到单元格位置的映射字典（行号取自此映射）
+            output_path: 可选的输出文件路径或可写的二进制流。如果为None，则覆盖原文件。
+            
+        返回:
+            与process_api_data相同的处理结果，另含每列的写入状态column_status；
+            write_status 为映射本身所在列（D列）的状态
+        """
+        result = {
+            "status": "started",
+            "mapping_valid": False,
+            "write_status": {},
+            "column_status": {},
+            "errors": []
+        }
+        
+        handle = None
+        try:
+            handle = self.open_workbook()
+            
+            result["mapping_valid"] = self.validate_mapping(mapping, handle)
+            if not result["mapping_valid"]:
+                result["errors"].append("映射验证失败")
+                result["status"] = "validation_failed"
+                return result
+            
+            from openpyxl.utils.cell import coordinate_from_string
+            
+            base_column = coordinate_from_string(next(iter(mapping.values())))[0]
+            for column, api_data in column_data.items():
+                if column in TIME_SERIES_SKIP_COLUMNS:
+                    raise ValueError(f"{column}列为科目名称，不能写入数值")
+                write_status = self.write_data(api_data, self.shift_mapping(mapping, column), handle.worksheet)
+                result["column_status"][column] = write_status
+                if column == base_column:
+                    result["write_status"] = write_status
+            
+            failed_columns = [column for column, write_status in result["column_status"].items()
+                              if any(status != "success" for status in write_status.values())]
+            if failed_columns:
+                result["errors"].append(f"部分字段写入失败的列: {failed_columns}")
+                result["status"] = "partial_success"
+            else:
+                result["status"] = "success"
+            
+            self.save_workbook(handle, output_path)
+            
+        except Exception as e:
+            result["errors"].append(str(e))
+            result["status"] = "error"
+            logger.error(f"处理多列数据时出错: {str(e)}")
+        
+        finally:
+            if handle is not None:
+                handle.close()
+        
+        return result
+    
+    def process_time_series(self, periods: Iterable[Tuple[str, Dict[str, Any]]], mapping: Dict[str, str],
+                            output_path: Optional[Union[str, BinaryIO]] = None,
+                            header_row: Optional[int] = None,
+                            append_to: Optional[Union[str, Path]] = None) -> Dict[str, Any]:
+        """
+        时间序列模式：同一公司的多个期间依次写入D列右侧的连续列，只加载和保存一次
+        
+        参数:
+            periods: (期间标签, 数据) 的可迭代对象，按时间顺序排列
+            mapping: API字段名到单元格位置的映射字典（D列）
+            output_path: 可选的输出文件路径或可写的二进制流。如果为None，则覆盖加载的文件。
+            header_row: 写入期间标签的行号，None表示不写标签
+            append_to: 追加模式：在已有的输出文件中接着最后一个期间写入；
+                       标签已存在的期间写回原列，只修改值有变化的单元格。
+                       必须同时指定header_row，否则无法识别已写入的期间，重复执行会追加重复的列
+            
+        返回:
+            包含状态和每个期间结果的处理结果
+        """
+        result = {
+            "status": "started",
+            "mapping_valid": False,
+            "periods": [],
+            "changed": 0,
+            "unchanged": 0,
+            "save_skipped": False,
+            "errors": []
+        }
+        
+        if append_to and not header_row:
+            result["errors"].append("追加模式需要指定header_row（期间标签所在行）")
+            result["status"] = "error"
+            return result
+        
+        label_written = False
+        handle = None
+        try:
+            handle = self.open_workbook(append_to)
+            
+            result["mapping_valid"] = self.validate_mapping(mapping, handle)
+            if not result["mapping_valid"]:
+                result["errors"].append("映射验证失败")
+                result["status"] = "validation_failed"
+                return result
+            
+            used = self._used_period_columns(handle, mapping, header_row) if append_to else []
+            label_columns = {label: column for column, label in used if label is not None}
+            free_columns = self.period_columns()
+            for _ in used:
+                next(free_columns)
+            
+            for label, api_data in periods:
+                if label in label_columns:
+                    column = label_columns[label]
+                else:
+                    column = next(free_columns)
+                    label_columns[label] = column
+                
+                # 追加模式下只写入值有变化的单元格
+                write_status = self.write_data(api_data, self.shift_mapping(mapping, column), handle.worksheet,
+                                               only_changed=bool(append_to))
+                if header_row and handle.worksheet[f"{column}{header_row}"].value != label:
+                    handle.worksheet[f"{column}{header_row}"] = label
+                    label_written = True
+                
+                failed = any(status not in ("success", "unchanged") for status in write_status.values())
+                result["periods"].append({
+                    "period": label,
+                    "column": column,
+                    "status": "partial_success" if failed else "success",
+                    "written": sum(1 for status in write_status.values() if status == "success"),
+                    "unchanged": sum(1 for status in write_status.values() if status == "unchanged"),
+                    "write_status": write_status
+                })
+            
+            if not result["periods"]:
+                result["errors"].append("没有可写入的期间")
+                result["status"] = "error"
+                return result
+            
+            failed_periods = [entry["period"] for entry in result["periods"] if entry["status"] != "success"]
+            if failed_periods:
+                result["errors"].append(f"部分字段写入失败的期间: {failed_periods}")
+                result["status"] = "partial_success"
+            else:
+                result["status"] = "success"
+            
+            result["changed"] = sum(entry["written"] for entry in result["periods"])
+            result["unchanged"] = sum(entry["unchanged"] for entry in result["periods"])
+            in_place = append_to and (output_path is None or (isinstance(output_path, (str, Path))
+                                                             and Path(output_path).resolve() == Path(append_to).resolve()))
+            if in_place and not result["changed"] and not label_written:
+                # 原地追加且没有任何变化：不重写文件
+                result["save_skipped"] = True
+                logger.info(f"所有期间的值都未变化，跳过保存: {append_to}")
+            else:
+                self.save_workbook(handle, output_path if output_path is not None else (append_to or None))
+            logger.info(f"已将 {len(result['periods'])} 个期间写入 "
+                        f"{result['periods'][0]['column']}~{result['periods'][-1]['column']} 列")
+            
+        except Exception as e:
+            result["errors"].append(str(e))
+            result["status"] = "error"
+            logger.error(f"处理时间序列数据时出错: {str(e)}")
+        
+        finally:
+            if handle is not None:
+                handle.close()
+        
+        return result
+    
+    def save_workbook(self, handle: WorkbookHandle, output_path: Optional[Union[str, BinaryIO]] = None):
         """
         保存工作簿
         
         参数:
-            output_path: 可选的保存路径。如果为None，则覆盖原文件。
+            handle: 工作簿句柄
+            output_path: 可选的保存路径或可写的二进制流（如BytesIO）。如果为None，则覆盖原文件。
         """
-        save_path = output_path or self.excel_path
+        save_path = output_path if output_path is not None else self.excel_path
         
         try:
-            self.workbook.save(save_path)
+            save_archive(handle.workbook, save_path, self.compression, self.deterministic)
             logger.info(f"工作簿已成功保存到: {save_path}")
         except Exception as e:
             logger.error(f"保存工作簿时出错: {str(e)}")
             raise
     
-    def close(self):
-        """关闭工作簿"""
-        if self.workbook:
-            self.workbook.close()
-            logger.info("工作簿已关闭")
-    
-    def validate_mapping(self, mapping: Dict[str, str]) -> bool:
+    def validate_mapping(self, mapping: Dict[str, str], handle: Optional[WorkbookHandle] = None) -> bool:
         """
         验证映射中的所有单元格都存在且E列有值
         
+        结果按 (模板内容哈希, 工作表, 映射版本) 缓存，同一模板和映射只检查一次；
+        模板内容变化后哈希不同，会重新检查
+        
         参数:
             mapping: API字段名到单元格位置的映射字典
+            handle: 要检查的工作簿句柄，None表示检查模板（缓存命中时不加载工作簿）
             
         返回:
             布尔值表示映射是否有效
         """
-        if not self.workbook:
-            self.load_workbook()
+        try:
+            mapping_version, coordinates = compile_cells(mapping)
+        except MappingError as e:
+            logger.error(f"映射中存在无效的单元格地址: {str(e)}")
+            return False
+        
+        source_hash = handle.source_hash if handle is not None else self._source_hash()
+        key = (source_hash, self.sheet_name, mapping_version) if source_hash else None
+        if key is not None:
+            with _validation_lock:
+                cached = _validation_cache.get(key)
+                if cached is not None:
+                    _validation_cache.move_to_end(key)
+                    logger.debug(f"使用缓存的映射验证结果: {cached}")
+                    return cached
+        
+        owned = handle is None
+        if owned:
+            handle = self.open_workbook()
         
         valid = True
+        from openpyxl.utils import column_index_from_string
         
-        for api_field, cell_location in mapping.items():
-            try:
-                # 检查单元格是否存在
-                cell = self.worksheet[cell_location]
-                
-                # 获取对应的E列单元格
-                row = int(cell_location[1:])
-                e_cell = f"E{row}"
-                e_value = self.worksheet[e_cell].value
-                
+        label_column = column_index_from_string(LABEL_COLUMN)
+        
+        try:
+            for api_field, (row, _) in coordinates.items():
+                e_value = handle.worksheet.cell(row=row, column=label_column).value
                 if e_value is None or (isinstance(e_value, str) and e_value.strip() == ""):
-                    logger.warning(f"单元格 {e_cell} (对应 {api_field}) 没有值")
+                    logger.warning(f"单元格 {LABEL_COLUMN}{row} (对应 {api_field}) 没有值")
                     valid = False
                 else:
-                    logger.debug(f"单元格 {e_cell} 有值: {e_value}")
-                    
-            except Exception as e:
-                logger.error(f"验证单元格 {cell_location} 时出错: {str(e)}")
-                valid = False
+                    logger.debug(f"单元格 {LABEL_COLUMN}{row} 有值: {e_value}")
+        finally:
+            if owned:
+                handle.close()
+        
+        if key is not None:
+            with _validation_lock:
+                _validation_cache[key] = valid
+                while len(_validation_cache) > VALIDATION_CACHE_SIZE:
+                    _validation_cache.popitem(last=False)
         
         return valid
     
-    def process_api_data(self, api_data: Dict[str, Any], mapping: Dict[str, str], output_path: Optional[str] = None) -> Dict[str, Any]:
+    def _read_snapshot(self, path: Path) -> Optional[Dict[str, Any]]:
+        """读取原地同步的快照；工作簿在快照之后被修改过时返回None"""
+        try:
+            with open(_snapshot_path(path), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if snapshot.get("sheet") == self.sheet_name and snapshot.get("signature") == _stat_signature(path):
+                return snapshot["values"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    def _write_snapshot(self, path: Path, worksheet, mapping: Dict[str, str]):
+        """原地同步后记录映射单元格的当前值和工作簿的文件状态"""
+        try:
+            snapshot = {
+                "sheet": self.sheet_name,
+                "signature": _stat_signature(path),
+                "values": {cell: worksheet[cell].value for cell in mapping.values()}
+            }
+            tmp_path = _snapshot_path(path).with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            Path(tmp_path).replace(_snapshot_path(path))
+        except (OSError, TypeError, ValueError) as e:
+            # 单元格值无法序列化或目录不可写时不使用快照，下次同步会加载工作簿比较
+            logger.debug(f"无法写入同步快照: {str(e)}")
+    
+    def process_api_data(self, api_data: Dict[str, Any], mapping: Dict[str, str],
+                         output_path: Optional[Union[str, BinaryIO]] = None) -> Dict[str, Any]:
         """
         完整的API数据处理和写入Excel的工作流程
         
+        output_path为None时原地更新模板：只写入值有变化的单元格，没有变化时不保存文件；
+        同步后记录快照，下次同步的值与快照一致时连工作簿都不加载
+        
         参数:
             api_data: 包含API响应数据的字典
             mapping: API字段名到单元格位置的映射字典
-            output_path: 可选的输出文件路径。如果为None，则覆盖原文件。
+            output_path: 可选的输出文件路径或可写的二进制流。如果为None，则覆盖原文件。
             
         返回:
-            包含状态和详细信息的处理结果
+            包含状态和详细信息的处理结果；changed、unchanged为有变化和未变化的字段数，
+            save_skipped表示没有变化而跳过了保存
         """
         result = {
             "status": "started",
             "mapping_valid": False,
             "write_status": {},
+            "changed": 0,
+            "unchanged": 0,
+            "save_skipped": False,
             "errors": []
         }
+        in_place = output_path is None
         
+        if in_place and self.template_bytes is None:
+            snapshot = self._read_snapshot(self.excel_path)
+            if (snapshot is not None
+                    and all(api_data.get(field) is not None and snapshot.get(cell) == api_data[field]
+                            for field, cell in mapping.items())
+                    and self.validate_mapping(mapping)):
+                result.update({
+                    "status": "success",
+                    "mapping_valid": True,
+                    "write_status": {field: "unchanged" for field in mapping},
+                    "unchanged": len(mapping),
+                    "save_skipped": True
+                })
+                logger.info(f"所有字段与上次同步相同，跳过加载和保存: {self.excel_path}")
+                return result
+        
+        handle = None
         try:
-            # 加载工作簿
-            self.load_workbook()
+            # 加载工作簿（每次调用独占一个句柄）
+            handle = self.open_workbook()
             
             # 验证映射
-            result["mapping_valid"] = self.validate_mapping(mapping)
+            result["mapping_valid"] = self.validate_mapping(mapping, handle)
             
             if not result["mapping_valid"]:
                 result["errors"].append("映射验证失败")
                 result["status"] = "validation_failed"
                 return result
             
-            # 写入数据
-            result["write_status"] = self.write_data(api_data, mapping)
+            # 写入数据（原地更新时只写入有变化的单元格）
+            result["write_status"] = self.write_data(api_data, mapping, handle.worksheet, only_changed=in_place)
+            result.update(_count_changes(result["write_status"]))
             
             # 检查是否所有写入都成功
             failed_writes = [field for field, status in result["write_status"].items() 
-                           if status != "success"]
+                           if status not in ("success", "unchanged")]
             
             if failed_writes:
                 result["errors"].append(f"写入失败的字段: {failed_writes}")
@@ -195,7 +755,13 @@ class ExcelWriter:
                 result["status"] = "success"
             
             # 保存工作簿
-            self.save_workbook(output_path)
+            if in_place and not result["changed"]:
+                result["save_skipped"] = True
+                logger.info(f"所有字段的值都未变化，跳过保存: {self.excel_path}")
+            else:
+                self.save_workbook(handle, output_path)
+            if in_place and self.template_bytes is None:
+                self._write_snapshot(self.excel_path, handle.worksheet, mapping)
             
         except Exception as e:
             result["errors"].append(str(e))
@@ -203,7 +769,8 @@ class ExcelWriter:
             logger.error(f"处理API数据时出错: {str(e)}")
         
         finally:
-            self.close()
+            if handle is not None:
+                handle.close()
         
         return result
 
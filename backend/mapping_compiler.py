@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+声明式映射文件的编译
+映射定义在JSON或YAML文件中，编译为不可变结构：整数(行, 列)坐标、科目别名表和版本哈希。
+编译只需不到1毫秒，每次加载时直接编译，不在磁盘上缓存
+"""
+
+import re
+import json
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# A1格式的单元格地址，如 D4、AA100、$D$4
+_A1_PATTERN = re.compile(r'^\$?([A-Za-z]{1,3})\$?([1-9][0-9]*)$')
+
+# Excel的最大行列数
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+
+class MappingError(ValueError):
+    """映射定义无效"""
+
+
+def parse_a1(cell: str) -> Tuple[int, int]:
+    """
+    解析A1格式的单元格地址
+
+    参数:
+        cell: 单元格地址，如 "D4"
+
+    返回:
+        从1开始的 (行, 列)
+
+    异常:
+        MappingError: 地址格式无效或超出Excel范围
+    """
+    match = _A1_PATTERN.match(str(cell).strip())
+    if not match:
+        raise MappingError(f"无效的单元格地址: {cell!r}")
+
+    letters, row = match.groups()
+    column = 0
+    for char in letters.upper():
+        column = column * 26 + (ord(char) - ord('A') + 1)
+    row = int(row)
+
+    if row > MAX_ROW or column > MAX_COLUMN:
+        raise MappingError(f"单元格地址超出Excel范围: {cell!r}")
+    return row, column
+
+
+class CompiledMapping(NamedTuple):
+    """编译后的映射，所有字典均为只读视图"""
+    version: str                                  # 源定义的内容哈希
+    fields: Tuple[str, ...]                       # 按定义顺序排列的字段名
+    cells: Mapping[str, str]                      # 字段名 → A1地址
+    coordinates: Mapping[str, Tuple[int, int]]    # 字段名 → (行, 列)
+    descriptions: Mapping[str, str]               # A1地址 → 描述
+    data_types: Mapping[str, str]                 # 字段名 → 数据类型
+    aliases: Mapping[str, str]                    # 科目名称 → 字段名
+    source_columns: Mapping[str, str]             # MD数值列 → 模板列
+    primary_source_column: str
+
+
+def definition_version(definition: Dict[str, Any]) -> str:
+    """按规范化的JSON计算映射定义的版本哈希"""
+    canonical = json.dumps(definition, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+@lru_cache(maxsize=256)
+def _compile_cells(items: Tuple[Tuple[str, str], ...]) -> Tuple[str, Mapping[str, Tuple[int, int]]]:
+    coordinates = {field: parse_a1(cell) for field, cell in items}
+    return definition_version({"mapping": dict(items)}), MappingProxyType(coordinates)
+
+
+def compile_cells(mapping: Mapping[str, str]) -> Tuple[str, Mapping[str, Tuple[int, int]]]:
+    """
+    把 字段 → A1地址 的映射解析为数值坐标，相同的映射只解析一次
+
+    返回:
+        (映射版本哈希, 字段 → (行, 列) 的只读字典)
+
+    异常:
+        MappingError: 存在无效的单元格地址
+    """
+    return _compile_cells(tuple(mapping.items()))
+
+
+def _compile_plain(definition: Dict[str, Any]) -> Dict[str, Any]:
+    """把映射定义编译为只含基本类型的字典"""
+    mapping = definition.get("mapping")
+    if not isinstance(mapping, dict) or not mapping:
+        raise MappingError("映射定义缺少 mapping")
+
+    coordinates = {}
+    cell_to_field = {}
+    for field, cell in mapping.items():
+        coordinate = parse_a1(cell)
+        if coordinate in cell_to_field:
+            raise MappingError(f"字段 {cell_to_field[coordinate]} 和 {field} 映射到同一个单元格 {cell}")
+        cell_to_field[coordinate] = field
+        coordinates[field] = coordinate
+
+    descriptions = dict(definition.get("descriptions") or {})
+
+    # 描述中括号前的部分为日文科目名；显式定义的别名优先
+    aliases = {}
+    for cell, description in descriptions.items():
+        field = cell_to_field.get(parse_a1(cell))
+        if field:
+            aliases[description.split(' (')[0].strip()] = field
+    aliases.update(definition.get("aliases") or {})
+
+    unknown = sorted({field for field in aliases.values() if field not in mapping})
+    if unknown:
+        logger.debug(f"别名指向映射外的字段: {unknown}")
+
+    source_columns = dict(definition.get("source_columns") or {"当月残高": "D"})
+    primary_source_column = definition.get("primary_source_column") or next(iter(source_columns))
+
+    return {
+        "version": definition_version(definition),
+        "fields": list(mapping),
+        "cells": {field: str(cell).replace('$', '').upper() for field, cell in mapping.items()},
+        "coordinates": coordinates,
+        "descriptions": descriptions,
+        "data_types": dict(definition.get("data_types") or {}),
+        "aliases": aliases,
+        "source_columns": source_columns,
+        "primary_source_column": primary_source_column
+    }
+
+
+def _freeze(plain: Dict[str, Any]) -> CompiledMapping:
+    return CompiledMapping(
+        version=plain["version"],
+        fields=tuple(plain["fields"]),
+        cells=MappingProxyType(plain["cells"]),
+        coordinates=MappingProxyType({field: tuple(coordinate) for field, coordinate in plain["coordinates"].items()}),
+        descriptions=MappingProxyType(plain["descriptions"]),
+        data_types=MappingProxyType(plain["data_types"]),
+        aliases=MappingProxyType(plain["aliases"]),
+        source_columns=MappingProxyType(plain["source_columns"]),
+        primary_source_column=plain["primary_source_column"]
+    )
+
+
+def compile_mapping(definition: Dict[str, Any]) -> CompiledMapping:
+    """
+    编译映射定义
+
+    参数:
+        definition: 与export_mapping_to_json相同结构的字典:
+                    mapping（字段 → 单元格）、descriptions（单元格 → 描述）、data_types、
+                    aliases（科目名称 → 字段）、source_columns、primary_source_column
+
+    返回:
+        不可变的CompiledMapping
+
+    异常:
+        MappingError: 定义无效
+    """
+    return _freeze(_compile_plain(definition))
+
+
+def _parse_definition(path: Path, content: bytes) -> Dict[str, Any]:
+    """按扩展名解析JSON或YAML映射文件"""
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise MappingError(f"读取 {path} 需要安装PyYAML: pip install pyyaml")
+        definition = yaml.safe_load(content)
+    else:
+        try:
+            definition = json.loads(content.decode('utf-8'))
+        except ValueError as e:
+            raise MappingError(f"映射文件 {path} 格式错误: {str(e)}")
+
+    if not isinstance(definition, dict):
+        raise MappingError(f"映射文件 {path} 的顶层必须是对象")
+    return definition
+
+
+def load_mapping(path: Union[str, Path]) -> CompiledMapping:
+    """
+    读取并编译映射文件
+
+    参数:
+        path: JSON（.json）或YAML（.yaml/.yml）映射文件
+
+    返回:
+        不可变的CompiledMapping
+    """
+    path = Path(path)
+    compiled = compile_mapping(_parse_definition(path, path.read_bytes()))
+    logger.info(f"已编译映射文件 {path}: {len(compiled.fields)} 个字段，版本 {compiled.version}")
+    return compiled
+
+
+def clean_subject_name(name: str) -> str:
+    """清理科目名称：去除前后空白（含全角空格）和【】符号"""
+    if not name:
+        return ""
+    return str(name).strip().replace('【', '').replace('】', '')
+
+
+def resolve_subject_name(name: str, aliases: Mapping[str, str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    将科目名称解析为字段名
+
+    参数:
+        name: 科目名称（MD表格或模板中的标签）
+        aliases: 科目名称 → 字段名 的别名表
+
+    返回:
+        (字段名, 匹配方式)，匹配方式为 exact 或 fuzzy；未匹配时返回 (None, None)
+    """
+    cleaned = clean_subject_name(name)
+    if not cleaned:
+        return None, None
+
+    # 先尝试直接匹配
+    if cleaned in aliases:
+        return aliases[cleaned], "exact"
+
+    # 如果没有直接匹配，尝试模糊匹配
+    for key, value in aliases.items():
+        if key in cleaned or cleaned in key:
+            return value, "fuzzy"
+    return None, None
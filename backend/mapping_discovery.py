@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+从模板工作簿自动发现映射
+以read_only方式逐行读取模板的科目名称列（默认E列及附近的标签列），用科目名称解析器匹配字段，
+生成 字段 → 单元格 的建议映射。扫描结果按工作簿内容哈希缓存，同一模板重复请求无需重新读取
+"""
+
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from mapping_compiler import CompiledMapping, clean_subject_name, parse_a1, resolve_subject_name
+from mapping_config import COMPILED_MAPPING
+
+logger = logging.getLogger(__name__)
+
+# 按优先级排列的科目名称列：E列为主，其次是数值列两侧的相邻列
+DEFAULT_LABEL_COLUMNS = ("E", "F", "C")
+
+# 建议映射写入的数值列
+DEFAULT_VALUE_COLUMN = "D"
+
+# 内存中缓存的扫描结果数
+DISCOVERY_CACHE_SIZE = 64
+
+_cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class LabelCell(NamedTuple):
+    """模板中的一个科目名称"""
+    row: int
+    column: str
+    label: str
+
+
+def _workbook_content(workbook: Union[str, Path, bytes]) -> bytes:
+    if isinstance(workbook, (bytes, bytearray)):
+        return bytes(workbook)
+    return Path(workbook).read_bytes()
+
+
+def scan_labels(content: bytes, sheet: str,
+                label_columns: Sequence[str] = DEFAULT_LABEL_COLUMNS) -> List[LabelCell]:
+    """
+    以只读方式逐行扫描工作表的科目名称列
+
+    参数:
+        content: 工作簿内容
+        sheet: 工作表名称
+        label_columns: 按优先级排列的科目名称列，每行取第一个非空的文本
+
+    返回:
+        按行排列的科目名称
+    """
+    from openpyxl import load_workbook
+    from openpyxl.utils import column_index_from_string, get_column_letter
+
+    indexes = [column_index_from_string(column) for column in label_columns]
+    min_col, max_col = min(indexes), max(indexes)
+
+    workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        if sheet not in workbook.sheetnames:
+            raise ValueError(f"工作表 '{sheet}' 不存在")
+        worksheet = workbook[sheet]
+
+        labels = []
+        for row_number, row in enumerate(worksheet.iter_rows(min_col=min_col, max_col=max_col, values_only=True), start=1):
+            for index in indexes:
+                position = index - min_col
+                value = row[position] if position < len(row) else None
+                if isinstance(value, str) and clean_subject_name(value):
+                    labels.append(LabelCell(row_number, get_column_letter(index), clean_subject_name(value)))
+                    break
+        return labels
+    finally:
+        workbook.close()
+
+
+def _canonical_fields(compiled: CompiledMapping) -> Dict[str, List[str]]:
+    """映射定义描述中的科目名（" ("之前的部分）→ 按行排列的字段，同名科目（如两行資本金）按行依次对应"""
+    cell_to_field = {coordinate: field for field, coordinate in compiled.coordinates.items()}
+    canonical: Dict[str, List[str]] = {}
+    for coordinate, description in sorted((parse_a1(cell), description)
+                                          for cell, description in compiled.descriptions.items()):
+        field = cell_to_field.get(coordinate)
+        name = clean_subject_name(description.split(' (')[0])
+        if field and name:
+            canonical.setdefault(name, []).append(field)
+    return canonical
+
+
+def _fuzzy_candidates(label: str, aliases: Mapping[str, str]) -> List[str]:
+    """部分匹配科目名称的所有字段（按别名表顺序去重）"""
+    fields: List[str] = []
+    for key, field in aliases.items():
+        if (key in label or label in key) and field not in fields:
+            fields.append(field)
+    return fields
+
+
+def _suggest(labels: List[LabelCell], compiled: CompiledMapping, value_column: str) -> Dict[str, Any]:
+    """
+    按科目名称匹配字段
+
+    科目名称与映射定义描述中的科目名相同时直接取该字段（同名的多行按行依次对应）；
+    否则用科目名称解析器匹配，部分匹配到多个字段的科目名称作为冲突列出，不自动选择。
+    同一字段有多个候选时，精确匹配优先，其次取最上面的一行
+    """
+    canonical = _canonical_fields(compiled)
+    chosen: Dict[str, Dict[str, Any]] = {}
+    conflicts = []
+    unmatched = []
+
+    for label in labels:
+        cell = f"{value_column}{label.row}"
+        label_cell = f"{label.column}{label.row}"
+
+        if label.label in canonical:
+            fields = canonical[label.label]
+            field = next((f for f in fields if f not in chosen or chosen[f]["match"] == "fuzzy"), fields[0])
+            match = "exact"
+        else:
+            field, match = resolve_subject_name(label.label, compiled.aliases)
+            if field is None:
+                unmatched.append({"cell": label_cell, "label": label.label})
+                continue
+            if match == "fuzzy":
+                candidates = _fuzzy_candidates(label.label, compiled.aliases)
+                if len(candidates) > 1:
+                    conflicts.append({"field": None, "cell": cell, "label": label.label,
+                                      "label_cell": label_cell, "match": "ambiguous",
+                                      "candidates": candidates})
+                    continue
+
+        candidate = {
+            "field": field,
+            "cell": cell,
+            "label": label.label,
+            "label_cell": label_cell,
+            "match": match
+        }
+        current = chosen.get(field)
+        if current is None:
+            chosen[field] = candidate
+        elif current["match"] == "fuzzy" and match == "exact":
+            conflicts.append(current)
+            chosen[field] = candidate
+        else:
+            conflicts.append(candidate)
+
+    matches = sorted(chosen.values(), key=lambda item: int(item["cell"][len(value_column):]))
+    return {
+        "mapping": {item["field"]: item["cell"] for item in matches},
+        "matches": matches,
+        "conflicts": conflicts,
+        "unmatched_labels": unmatched,
+        "missing_fields": [field for field in compiled.fields if field not in chosen]
+    }
+
+
+def discover_mapping(workbook: Union[str, Path, bytes], sheet: str,
+                     compiled: Optional[CompiledMapping] = None,
+                     value_column: str = DEFAULT_VALUE_COLUMN,
+                     label_columns: Sequence[str] = DEFAULT_LABEL_COLUMNS) -> Dict[str, Any]:
+    """
+    扫描模板并建议映射
+
+    参数:
+        workbook: 工作簿路径或内容
+        sheet: 工作表名称
+        compiled: 提供科目别名表和字段列表的映射，默认为 mapping.json
+        value_column: 建议映射写入的数值列
+        label_columns: 按优先级排列的科目名称列
+
+    返回:
+        包含template_hash、mapping（字段 → 单元格）、matches、conflicts、unmatched_labels、
+        missing_fields和cached的字典
+    """
+    from openpyxl.utils import column_index_from_string
+
+    compiled = compiled or COMPILED_MAPPING
+    value_column = value_column.upper()
+    label_columns = tuple(column.upper() for column in label_columns)
+    column_index_from_string(value_column)
+    if value_column in label_columns:
+        raise ValueError(f"数值列 {value_column} 不能同时作为科目名称列")
+
+    content = _workbook_content(workbook)
+    template_hash = hashlib.sha256(content).hexdigest()
+    key = (template_hash, sheet, label_columns, value_column, compiled.version)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return dict(cached, cached=True)
+
+    labels = scan_labels(content, sheet, label_columns)
+    result = dict(_suggest(labels, compiled, value_column),
+                  template_hash=template_hash,
+                  sheet=sheet,
+                  mapping_version=compiled.version,
+                  labels_scanned=len(labels))
+    logger.info(f"映射发现: 工作表 '{sheet}' 中 {len(labels)} 个科目名称，"
+                f"匹配 {len(result['mapping'])} 个字段，{len(result['missing_fields'])} 个字段未找到")
+
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > DISCOVERY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return dict(result, cached=False)
+
+
+def main():
+    """扫描模板并输出建议映射，可直接保存为映射文件"""
+    import argparse
+    import json
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="扫描Excel模板的科目名称列并建议字段映射")
+    parser.add_argument("workbook", help="模板工作簿")
+    parser.add_argument("--sheet", default="A社貼り付けBS", help="工作表名称")
+    parser.add_argument("--value-column", default=DEFAULT_VALUE_COLUMN, help="数值列")
+    parser.add_argument("--label-columns", default=",".join(DEFAULT_LABEL_COLUMNS),
+                        help="按优先级排列的科目名称列，逗号分隔")
+    parser.add_argument("--output", help="保存为映射文件（结构同mapping.json）")
+
+    args = parser.parse_args()
+
+    try:
+        result = discover_mapping(args.workbook, args.sheet,
+                                  value_column=args.value_column,
+                                  label_columns=[c.strip() for c in args.label_columns.split(",") if c.strip()])
+    except (OSError, ValueError) as e:
+        print(f"错误: {str(e)}")
+        return 1
+
+    for item in result["matches"]:
+        flag = "" if item["match"] == "exact" else "  (模糊匹配，请确认)"
+        print(f"  {item['field']:<35} -> {item['cell']:<5} {item['label']}{flag}")
+    if result["missing_fields"]:
+        print(f"\n未找到的字段: {', '.join(result['missing_fields'])}")
+    ambiguous = [item for item in result["conflicts"] if item["match"] == "ambiguous"]
+    for item in ambiguous:
+        print(f"  有歧义: {item['label_cell']} {item['label']} -> {', '.join(item['candidates'])}")
+    if result["unmatched_labels"]:
+        print(f"未匹配的科目名称: {len(result['unmatched_labels'])} 个")
+
+    if args.output:
+        descriptions = {item["cell"]: item["label"] for item in result["matches"]}
+        definition = {
+            "mapping": result["mapping"],
+            "descriptions": descriptions,
+            "data_types": {field: COMPILED_MAPPING.data_types.get(field, "number") for field in result["mapping"]},
+            "source_columns": dict(COMPILED_MAPPING.source_columns),
+            "primary_source_column": COMPILED_MAPPING.primary_source_column
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(definition, f, ensure_ascii=False, indent=2)
+        print(f"\n建议映射已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
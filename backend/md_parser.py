@@ -9,13 +9,7 @@ import json
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
-from bs4 import BeautifulSoup
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -284,6 +278,9 @@ class MDParser:
             解析结果字典或None
         """
         try:
+            # 只在内容中有HTML表格时才导入BeautifulSoup
+            from bs4 import BeautifulSoup
+            
             soup = BeautifulSoup(content, 'html.parser')
             tables = soup.find_all('table')
             
@@ -384,6 +381,10 @@ class MDParser:
 
 def main():
     """测试MD解析功能"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     parser = MDParser()
     
     # 测试内容
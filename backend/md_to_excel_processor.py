@@ -4,71 +4,126 @@ MD到Excel处理器
 将Markdown表格解析并生成带有D列数据的Excel文件
 """
 
+import io
 import os
+import re
 import json
+import time
+import uuid
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import BinaryIO, Callable, Dict, Any, List, Mapping, NamedTuple, Optional, Tuple, Union
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from md_parser import MDParser
 from excel_writer import ExcelWriter
 from data_validator import prepare_api_data
-from mapping_config import TRIAL_BALANCE_MAPPING, CELL_DESCRIPTIONS
+from mapping_config import TRIAL_BALANCE_MAPPING, COMPILED_MAPPING, PRIMARY_SOURCE_COLUMN, SOURCE_COLUMN_MAPPING
+from mapping_compiler import clean_subject_name, resolve_subject_name
+from output_layout import make_content_filename, make_output_filename
+from output_storage import OutputStorage, get_output_storage
+from template_registry import CompiledTemplate
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
+# 扇出写入时同时写入的目标数上限
+FANOUT_MAX_WORKERS = 4
+
+# 试算表中表示0的记号（空白以及各种横线）
+ZERO_PLACEHOLDERS = frozenset({'', '-', '−', '―', '－', 'ー', '—', '–'})
+
+
+class WriteTarget(NamedTuple):
+    """扇出写入的一个目标模板"""
+    template: str
+    sheet: str = "A社貼り付けBS"
+    mapping: Optional[Dict[str, str]] = None    # API字段名到单元格位置的映射，默认为处理器的映射
+    name: Optional[str] = None                  # 用于输出文件名，默认为模板文件名
+
+
 class MDToExcelProcessor:
     """
     处理MD文件到Excel文件的完整工作流程
+    初始化后不再修改实例状态，同一个处理器可以在多个线程中同时处理请求
     """
     
-    def __init__(self, excel_template_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS"):
+    def __init__(self, excel_template_path: str = "mapping.xlsx", sheet_name: str = "A社貼り付けBS",
+                 storage: Optional[OutputStorage] = None,
+                 column_mapping: Optional[Dict[str, str]] = None,
+                 template: Optional[CompiledTemplate] = None):
         """
         初始化处理器
         
         参数:
             excel_template_path: Excel模板文件路径
             sheet_name: 工作表名称
+            storage: 输出文件存储后端，默认按环境变量配置
+            column_mapping: MD数值列 → 模板列 的映射，默认为模板映射（未指定模板时为映射文件）的source_columns
+            template: 模板注册表中已编译的模板，指定时忽略excel_template_path和sheet_name
         """
-        self.excel_template_path = Path(excel_template_path)
-        self.sheet_name = sheet_name
-        self.output_dir = Path("output")
-        self.output_dir.mkdir(exist_ok=True)
-        
-        # 初始化组件
+        self.template = template
+        self.storage = storage or get_output_storage()
         self.md_parser = MDParser()
-        self.excel_writer = ExcelWriter(str(self.excel_template_path), sheet_name)
         
-        # 构建完整的日文到英文字段映射
-        self.japanese_to_field_mapping = self._build_japanese_mapping()
-        logger.info(f"已构建 {len(self.japanese_to_field_mapping)} 个日文到字段的映射")
+        if template is not None:
+            # 使用模板注册表中编译好的工作簿内容、映射和别名表
+            self.excel_template_path = template.workbook_path
+            self.sheet_name = template.sheet
+            self.mapping = template.mapping
+            self.excel_writer = ExcelWriter(str(template.workbook_path), template.sheet, template.workbook_bytes)
+            self.japanese_to_field_mapping = template.aliases
+            self.column_mapping = dict(column_mapping or template.compiled_mapping.source_columns)
+            self.primary_source_column = template.compiled_mapping.primary_source_column
+        else:
+            self.excel_template_path = Path(excel_template_path)
+            self.sheet_name = sheet_name
+            self.mapping = TRIAL_BALANCE_MAPPING
+            self.excel_writer = ExcelWriter(str(self.excel_template_path), sheet_name)
+            
+            # 映射文件编译时已生成日文到英文字段的别名表
+            self.japanese_to_field_mapping = self._build_japanese_mapping()
+            self.column_mapping = dict(column_mapping or SOURCE_COLUMN_MAPPING)
+            self.primary_source_column = PRIMARY_SOURCE_COLUMN
         
-    def process_md_content(self, md_content: str, filename: str = "uploaded.md") -> Dict[str, Any]:
+    def process_md_content(self, md_content: str, filename: str = "uploaded.md",
+                           progress_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                           targets: Optional[List[Union["WriteTarget", tuple]]] = None) -> Dict[str, Any]:
         """
         处理MD文本内容并生成Excel文件
         
         参数:
             md_content: Markdown文本内容
             filename: 原始文件名
+            progress_callback: 可选的进度回调，每完成一个阶段（parsed、converted、written）
+                               调用一次 callback(stage, info)
+            targets: 可选的目标列表，每项为WriteTarget或 (模板, 工作表, 映射) 元组。
+                     指定时只解析和转换一次，然后并行写入每个目标；结果的targets列出每个目标的输出，
+                     顶层的output_filename等字段取第一个成功的目标
             
         返回:
             处理结果字典
         """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timings = {}
+        started = time.perf_counter()
+        
+        def finish_stage(stage: str, timing_key: str, stage_started: float, **info):
+            timings[timing_key] = round((time.perf_counter() - stage_started) * 1000, 1)
+            if progress_callback:
+                progress_callback(stage, dict(info, duration_ms=timings[timing_key]))
         
         try:
             # 解析MD内容
             logger.info(f"🔍 开始解析Markdown内容 (文件: {filename})...")
             logger.debug(f"MD内容长度: {len(md_content)} 字符")
+            stage_started = time.perf_counter()
             parsed_result = self.md_parser.parse(md_content)
             logger.info(f"📊 MD解析完成，发现 {len(parsed_result.get('rows', []))} 行数据")
+            finish_stage("parsed", "parse_ms", stage_started,
+                         rows_count=len(parsed_result.get('rows', [])))
             
             if not parsed_result.get('rows') or len(parsed_result['rows']) == 0:
                 logger.error("❌ MD文件中没有找到有效的表格数据")
@@ -80,41 +135,51 @@ class MDToExcelProcessor:
             
             # 将解析结果转换为API数据格式
             logger.info("🔄 将解析结果转换为API数据格式...")
-            api_data = self._convert_md_to_api_data(parsed_result)
+            stage_started = time.perf_counter()
+            column_data = self._convert_md_to_columns(parsed_result)
+            api_data = column_data.get(self.primary_source_column, {})
             logger.info(f"✅ 转换完成，数据包含 {len(api_data)} 个字段")
             
             # 清理和验证数据
             logger.info("🧹 清理和验证数据...")
             cleaned_data = prepare_api_data(api_data)
             logger.info(f"✅ 数据清理完成，清理后数据: {len(cleaned_data)} 个字段")
-            
-            # 生成输出文件路径
-            base_name = Path(filename).stem
-            output_filename = f"{base_name}_output_{timestamp}.xlsx"
-            output_path = self.output_dir / output_filename
-            logger.info(f"📄 输出文件路径: {output_path}")
+            finish_stage("converted", "convert_ms", stage_started, fields_count=len(cleaned_data))
             
             # 使用Excel写入器处理数据
-            logger.info("📝 开始生成Excel文件...")
-            excel_result = self.excel_writer.process_api_data(
-                cleaned_data, 
-                TRIAL_BALANCE_MAPPING, 
-                str(output_path)
-            )
-            logger.info(f"📊 Excel写入完成，状态: {excel_result['status']}")
-            
-            # 计算统计信息
-            successful_writes = sum(1 for status in excel_result["write_status"].values() 
-                                  if status == "success")
-            total_fields = len(TRIAL_BALANCE_MAPPING)
+            stage_started = time.perf_counter()
+            column_targets = None
+            if self.column_mapping != {self.primary_source_column: "D"}:
+                # 配置了多个数值列：所有列在同一次保存中写入
+                column_targets = {target: prepare_api_data(column_data.get(source, {}))
+                                  for source, target in self.column_mapping.items()}
+            
+            target_results = None
+            if targets:
+                # 扇出：解析和转换只做一次，每个目标模板并行写入
+                target_results = self._write_targets(targets, cleaned_data, column_targets, filename)
+                primary = next((entry for entry in target_results if entry["success"]), target_results[0])
+                output_filename = primary["output_filename"]
+                output_path = primary["output_path"]
+                excel_result = primary["excel_result"]
+                mapping = primary["mapping"]
+            else:
+                mapping = self.mapping
+                write = None
+                if column_targets:
+                    write = partial(self.excel_writer.process_column_data, column_targets, self.mapping)
+                output_filename, output_path, excel_result = self._write_output(cleaned_data, filename, write)
+            finish_stage("written", "write_ms", stage_started,
+                         status=excel_result['status'], output_filename=output_filename)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
             
             # 准备返回结果
             result = {
-                "success": excel_result["status"] in ["success", "partial_success"],
+                "success": excel_result["status"] in ["success", "partial_success"] and output_path is not None,
                 "timestamp": timestamp,
                 "input_filename": filename,
                 "output_filename": output_filename,
-                "output_path": str(output_path),
+                "output_path": str(output_path) if output_path is not None else None,
                 "stage": "completed",
                 
                 # MD解析信息
@@ -125,19 +190,34 @@ class MDToExcelProcessor:
                 },
                 
                 # Excel写入信息
-                "excel_writing": {
-                    "status": excel_result["status"],
-                    "total_fields": total_fields,
-                    "successful_writes": successful_writes,
-                    "success_rate": f"{(successful_writes/total_fields)*100:.1f}%",
-                    "write_status": excel_result["write_status"],
-                    "mapping_valid": excel_result["mapping_valid"]
-                },
+                "excel_writing": self._excel_writing_summary(excel_result, mapping),
+                
+                # 各数值列的写入信息
+                "column_writing": self._column_writing_summary(excel_result),
+                
+                # 各阶段耗时（毫秒）
+                "timings": timings,
                 
                 # 错误信息
                 "errors": excel_result.get("errors", [])
             }
             
+            if target_results is not None:
+                result["success"] = any(entry["success"] for entry in target_results)
+                result["targets"] = [
+                    {
+                        "name": entry["name"],
+                        "template": entry["template"],
+                        "sheet": entry["sheet"],
+                        "success": entry["success"],
+                        "output_filename": entry["output_filename"],
+                        "output_path": str(entry["output_path"]) if entry["output_path"] else None,
+                        "excel_writing": self._excel_writing_summary(entry["excel_result"], entry["mapping"]),
+                        "errors": entry["excel_result"].get("errors", [])
+                    }
+                    for entry in target_results
+                ]
+            
             if result["success"]:
                 logger.info(f"处理成功完成: {output_filename}")
                 logger.info(f"Excel写入成功率: {result['excel_writing']['success_rate']}")
@@ -156,6 +236,273 @@ class MDToExcelProcessor:
                 "timestamp": timestamp
             }
     
+    def process_api_data(self, api_data: Dict[str, Any], filename: str = "api_data.json") -> Dict[str, Any]:
+        """
+        将结构化的API数据直接写入Excel，不经过MD解析
+        
+        参数:
+            api_data: 字段名到数值的字典
+            filename: 用于生成输出文件名的名称
+            
+        返回:
+            处理结果字典（与process_md_content相同，但没有md_parsing）
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timings = {}
+        started = time.perf_counter()
+        
+        try:
+            stage_started = time.perf_counter()
+            cleaned_data = prepare_api_data(api_data)
+            timings["convert_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            
+            stage_started = time.perf_counter()
+            output_filename, output_path, excel_result = self._write_output(cleaned_data, filename)
+            timings["write_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            
+            # 保存失败时没有输出文件，output_filename和output_path为None
+            success = excel_result["status"] in ["success", "partial_success"] and output_path is not None
+            return {
+                "success": success,
+                "timestamp": timestamp,
+                "input_filename": filename,
+                "output_filename": output_filename if success else None,
+                "output_path": str(output_path) if success else None,
+                "stage": "completed",
+                "excel_writing": self._excel_writing_summary(excel_result),
+                "timings": timings,
+                "errors": excel_result.get("errors", [])
+            }
+            
+        except Exception as e:
+            error_msg = f"处理API数据时发生错误: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return {
+                "success": False,
+                "error": error_msg,
+                "stage": "processing",
+                "timestamp": timestamp
+            }
+    
+    def process_md_time_series(self, documents: List[Tuple[str, str]],
+                               filename: str = "time_series.md",
+                               header_row: Optional[int] = None) -> Dict[str, Any]:
+        """
+        把同一公司多个期间的MD报表写入同一个工作簿的连续列
+        
+        参数:
+            documents: (期间标签, Markdown文本) 的列表，按时间顺序排列
+            filename: 用于生成输出文件名的名称
+            header_row: 写入期间标签的行号，None表示不写标签
+            
+        返回:
+            处理结果字典，periods 为每个期间的写入列和状态，errors 为无法解析的期间
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        started = time.perf_counter()
+        periods = []
+        errors = []
+        
+        try:
+            for label, md_content in documents:
+                parsed_result = self.md_parser.parse(md_content)
+                if not parsed_result.get('rows'):
+                    errors.append({"period": label, "error": "MD文件中没有找到有效的表格数据"})
+                    continue
+                periods.append((label, prepare_api_data(self._convert_md_to_api_data(parsed_result))))
+            
+            if not periods:
+                return {
+                    "success": False,
+                    "error": "没有可写入的期间",
+                    "stage": "md_parsing",
+                    "period_errors": errors,
+                    "timestamp": timestamp
+                }
+            
+            write = partial(self.excel_writer.process_time_series, periods, self.mapping,
+                            header_row=header_row)
+            output_filename, output_path, excel_result = self._write_output(None, filename, write)
+            
+            success = excel_result["status"] in ["success", "partial_success"] and output_path is not None
+            return {
+                "success": success,
+                "timestamp": timestamp,
+                "input_filename": filename,
+                "output_filename": output_filename if success else None,
+                "output_path": str(output_path) if success else None,
+                "stage": "completed",
+                "periods": [{key: entry[key] for key in ("period", "column", "status", "written")}
+                            for entry in excel_result["periods"]],
+                "period_errors": errors,
+                "timings": {"total_ms": round((time.perf_counter() - started) * 1000, 1)},
+                "errors": excel_result.get("errors", [])
+            }
+            
+        except Exception as e:
+            error_msg = f"处理时间序列MD内容时发生错误: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return {
+                "success": False,
+                "error": error_msg,
+                "stage": "processing",
+                "timestamp": timestamp
+            }
+    
+    def _write_targets(self, targets: List[Union["WriteTarget", tuple]], cleaned_data: Dict[str, Any],
+                       column_targets: Optional[Dict[str, Dict[str, Any]]], filename: str) -> List[Dict[str, Any]]:
+        """
+        把同一份数据写入多个目标模板
+        
+        每个目标使用独立的ExcelWriter和工作簿对象，互不共享状态，因此可以并行写入；
+        目标的ExcelWriter沿用处理器的压缩和确定性输出配置
+        
+        返回:
+            与targets顺序一致的结果列表
+        """
+        targets = [target if isinstance(target, WriteTarget) else WriteTarget(*target) for target in targets]
+        stem = Path(filename).stem
+        
+        def write_target(target: WriteTarget) -> Dict[str, Any]:
+            name = target.name or Path(target.template).stem
+            mapping = target.mapping or self.mapping
+            writer = ExcelWriter(str(target.template), target.sheet,
+                                 compression=self.excel_writer.compression,
+                                 deterministic=self.excel_writer.deterministic)
+            if column_targets:
+                write = partial(writer.process_column_data, column_targets, mapping)
+            else:
+                write = partial(writer.process_api_data, cleaned_data, mapping)
+            output_filename, output_path, excel_result = self._write_output(
+                cleaned_data, f"{stem}_{name}{Path(filename).suffix}", write)
+            success = excel_result["status"] in ["success", "partial_success"]
+            return {
+                "name": name,
+                "template": str(target.template),
+                "sheet": target.sheet,
+                "mapping": mapping,
+                "success": success,
+                # 写入失败的目标没有输出文件
+                "output_filename": output_filename if success else None,
+                "output_path": output_path if success else None,
+                "excel_result": excel_result
+            }
+        
+        if len(targets) == 1:
+            return [write_target(targets[0])]
+        
+        with ThreadPoolExecutor(max_workers=min(len(targets), FANOUT_MAX_WORKERS),
+                                thread_name_prefix='md-excel-fanout') as executor:
+            return list(executor.map(write_target, targets))
+    
+    def _write_output(self, cleaned_data: Optional[Dict[str, Any]], filename: str,
+                      write: Optional[Callable[[Any], Dict[str, Any]]] = None):
+        """
+        将清理后的数据写入模板并保存到输出存储
+        
+        参数:
+            cleaned_data: 清理后的数据（指定write时不使用）
+            filename: 用于生成输出文件名的名称
+            write: 可选的写入函数 write(保存目标) → ExcelWriter的处理结果，默认为process_api_data
+        
+        返回:
+            (输出文件名, 输出路径, ExcelWriter的处理结果)；没有保存成功时输出路径为None
+        """
+        if write is None:
+            write = partial(self.excel_writer.process_api_data, cleaned_data, self.mapping)
+        
+        if self.excel_writer.deterministic:
+            return self._write_content_addressed_output(filename, write)
+        
+        # 生成输出文件路径
+        output_filename = make_output_filename(filename)
+        if self.storage.in_memory:
+            # 内存存储：工作簿直接保存到内存缓冲区，不经过磁盘
+            output_buffer = io.BytesIO()
+            output_path = f"memory://{output_filename}"
+        else:
+            output_buffer = None
+            output_path = self.storage.write_path(output_filename)
+        logger.info(f"📄 输出文件路径: {output_path}")
+        
+        logger.info("📝 开始生成Excel文件...")
+        excel_result = write(output_buffer if output_buffer is not None else str(output_path))
+        logger.info(f"📊 Excel写入完成，状态: {excel_result['status']}")
+        saved = excel_result["status"] in ["success", "partial_success"]
+        if output_buffer is not None:
+            if not saved or not output_buffer.tell():
+                return output_filename, None, excel_result
+            self.storage.put_bytes(output_filename, output_buffer.getvalue())
+        elif not saved or not output_path.exists():
+            # 保存失败时删除可能残留的不完整文件，不提交到存储
+            Path(output_path).unlink(missing_ok=True)
+            return output_filename, None, excel_result
+        else:
+            self.storage.commit(output_filename, output_path)
+            output_path = self.storage.local_path(output_filename) or output_path
+        
+        return output_filename, output_path, excel_result
+    
+    def _write_content_addressed_output(self, filename: str, write: Callable[[Any], Dict[str, Any]]):
+        """
+        确定性输出：先保存到内存，以内容哈希作为文件名
+        相同模板和数据再次生成时文件名相同，存储中已有该文件则不再写入（excel_result["output_cached"]为True），
+        只刷新其使用时间，避免仍在被重复生成的文件按首次写入时间被清理
+        """
+        output_buffer = io.BytesIO()
+        logger.info("📝 开始生成Excel文件（确定性输出）...")
+        excel_result = write(output_buffer)
+        logger.info(f"📊 Excel写入完成，状态: {excel_result['status']}")
+        
+        content = output_buffer.getvalue()
+        if not content or excel_result["status"] not in ["success", "partial_success"]:
+            return make_output_filename(filename), None, excel_result
+        
+        output_filename = make_content_filename(filename, content)
+        excel_result["output_cached"] = self.storage.touch(output_filename)
+        if excel_result["output_cached"]:
+            logger.info(f"♻️ 相同内容的输出已存在: {output_filename}")
+        else:
+            self.storage.put_bytes(output_filename, content)
+        
+        if self.storage.in_memory:
+            output_path = f"memory://{output_filename}"
+        else:
+            output_path = self.storage.local_path(output_filename) or output_filename
+        logger.info(f"📄 输出文件路径: {output_path}")
+        return output_filename, output_path, excel_result
+    
+    def _excel_writing_summary(self, excel_result: Dict[str, Any],
+                               mapping: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """整理ExcelWriter的处理结果，按写入时使用的映射（默认为处理器的映射）计算写入成功率"""
+        successful_writes = sum(1 for status in excel_result["write_status"].values() 
+                              if status == "success")
+        total_fields = len(mapping or self.mapping)
+        return {
+            "status": excel_result["status"],
+            "total_fields": total_fields,
+            "successful_writes": successful_writes,
+            "success_rate": f"{(successful_writes/total_fields)*100:.1f}%",
+            "write_status": excel_result["write_status"],
+            "mapping_valid": excel_result["mapping_valid"],
+            "output_cached": excel_result.get("output_cached", False)
+        }
+    
+    def _column_writing_summary(self, excel_result: Dict[str, Any]) -> Dict[str, Any]:
+        """按数值列统计写入成功的字段数"""
+        column_status = excel_result.get("column_status")
+        if column_status is None:
+            column_status = {self.column_mapping.get(self.primary_source_column, "D"): excel_result["write_status"]}
+        summary = {}
+        for source, target in self.column_mapping.items():
+            write_status = column_status.get(target, {})
+            summary[source] = {
+                "column": target,
+                "successful_writes": sum(1 for status in write_status.values() if status == "success")
+            }
+        return summary
+    
     def process_md_file(self, md_file_path: str) -> Dict[str, Any]:
         """
         处理MD文件
@@ -194,8 +541,7 @@ class MDToExcelProcessor:
     
     def _convert_md_to_api_data(self, parsed_result: Dict[str, Any]) -> Dict[str, Any]:
         """
-        将MD解析结果转换为API数据格式
-        使用完整的财务字段映射逻辑
+        将MD解析结果转换为API数据格式（只取当月残高列）
         
         参数:
             parsed_result: MD解析结果
@@ -203,7 +549,20 @@ class MDToExcelProcessor:
         返回:
             API数据格式字典
         """
-        api_data = {}
+        return self._convert_md_to_columns(parsed_result).get(self.primary_source_column, {})
+    
+    def _convert_md_to_columns(self, parsed_result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        将MD解析结果转换为API数据格式
+        使用完整的财务字段映射逻辑，一次遍历提取所有数值列
+        
+        参数:
+            parsed_result: MD解析结果
+            
+        返回:
+            列名 → API数据格式字典，如 {"前月残高": {...}, "当月残高": {...}, "構成比": {...}}
+        """
+        columns: Dict[str, Dict[str, Any]] = {}
         rows = parsed_result.get('rows', [])
         capital_stock_count = 0  # 用于区分两个資本金
         
@@ -213,16 +572,16 @@ class MDToExcelProcessor:
         if rows:
             for i, row in enumerate(rows):
                 # 表格格式：['', '前月残高', '借方金額', '貸方金額', '当月残高', '構成比']
-                # 第一列（空列名）包含科目名称，当月残高列包含我们需要的数值
+                # 第一列（空列名）包含科目名称，其余各列为数值
                 subject_name = None
-                value = None
+                values = {}
                 
                 # 查找科目名称和数值
                 for key, val in row.items():
                     if key == '' and val:  # 第一列（空列名）包含科目名称
                         subject_name = val
-                    elif key == '当月残高' and val is not None:  # 当月残高列包含数值
-                        value = val
+                    elif key and val is not None:
+                        values[key] = val
                 
                 if subject_name:
                     # 清理科目名称
@@ -265,26 +624,36 @@ class MDToExcelProcessor:
                         # 使用完整映射查找对应的JSON字段名
                         field_name = self.japanese_to_field_mapping.get(subject_name)
                     
-                    if field_name and value is not None:
-                        # 解析数值
+                    if not field_name:
+                        logger.debug(f"行 {i+1}: 未找到映射 - {subject_name}")
+                        continue
+                    if self.primary_source_column not in values:
+                        logger.debug(f"行 {i+1}: 未找到数值 - {subject_name}")
+                    # 所有数值列都为空的是分类标题行，不写入
+                    if all(isinstance(value, str) and not value.strip() for value in values.values()):
+                        logger.debug(f"行 {i+1}: 没有数值 - {subject_name}")
+                        continue
+                    
+                    for column, value in values.items():
+                        # 解析数值（空白和横线为0），跳过无法解析的列
                         if isinstance(value, str):
                             parsed_value = self._parse_numeric_value(value)
-                        else:
+                            if parsed_value is None:
+                                continue
+                        elif isinstance(value, (int, float)) and not isinstance(value, bool):
                             parsed_value = float(value) if value != 0 else 0.0
+                        else:
+                            continue
                         
-                        api_data[field_name] = parsed_value
-                        logger.debug(f"行 {i+1}: {subject_name} -> {field_name} = {parsed_value}")
-                    else:
-                        if not field_name:
-                            logger.debug(f"行 {i+1}: 未找到映射 - {subject_name}")
-                        if value is None:
-                            logger.debug(f"行 {i+1}: 未找到数值 - {subject_name}")
+                        columns.setdefault(column, {})[field_name] = parsed_value
+                    logger.debug(f"行 {i+1}: {subject_name} -> {field_name} = {values.get(self.primary_source_column)}")
         
-        logger.info(f"转换完成，成功映射 {len(api_data)} 个字段")
+        api_data = columns.get(self.primary_source_column, {})
+        logger.info(f"转换完成，成功映射 {len(api_data)} 个字段，共 {len(columns)} 个数值列")
         logger.debug(f"转换的API数据: {json.dumps(api_data, ensure_ascii=False, indent=2)}")
-        return api_data
+        return columns
     
-    def _parse_numeric_value(self, value_str: str) -> float:
+    def _parse_numeric_value(self, value_str: str) -> Optional[float]:
         """
         解析数值字符串
         
@@ -292,117 +661,42 @@ class MDToExcelProcessor:
             value_str: 数值字符串（可能包含逗号、负号等）
             
         返回:
-            解析后的浮点数
+            解析后的浮点数；空白和横线（试算表中表示0）返回0.0，不含数字的文本返回None
         """
-        if not value_str or str(value_str).strip() == "":
-            return 0.0
-            
         # 去除空格
-        value_str = str(value_str).strip()
+        value_str = str(value_str or "").strip()
+        
+        if value_str in ZERO_PLACEHOLDERS:
+            return 0.0
+        if not re.search(r'[0-9]', value_str):
+            return None
         
         # 处理负数（可能是负号开头）
         is_negative = value_str.startswith('-') or value_str.startswith('−')
         
+        # 百分比（構成比列）转换为小数
+        is_percent = value_str.endswith('%') or value_str.endswith('％')
+        
         # 去除所有非数字字符（保留小数点）
-        import re
         value_str = re.sub(r'[^0-9.-]', '', value_str)
         
         try:
             value = float(value_str)
+            if is_percent:
+                value /= 100
             return -abs(value) if is_negative else value
         except ValueError:
             logger.warning(f"无法解析数值: {value_str}")
-            return 0.0
+            return None
     
-    def _build_japanese_mapping(self) -> Dict[str, str]:
+    def _build_japanese_mapping(self) -> Mapping[str, str]:
         """
-        从mapping_config构建日文科目名到JSON字段的映射
+        返回映射文件编译时生成的日文科目名到JSON字段的映射（只读，所有处理器共享）
         
         返回:
             日文科目名到JSON字段名的映射字典
         """
-        mapping = {}
-        
-        # 从CELL_DESCRIPTIONS中提取日文名称
-        for cell, description in CELL_DESCRIPTIONS.items():
-            # 提取日文部分（括号前的内容）
-            japanese_name = description.split(' (')[0].strip()
-            
-            # 查找对应的JSON字段
-            for field, cell_ref in TRIAL_BALANCE_MAPPING.items():
-                if cell_ref == cell:
-                    mapping[japanese_name] = field
-                    break
-        
-        # 添加一些特殊的映射（处理格式差异）
-        special_mappings = {
-            "現金及び預金合計": "cash_and_deposits_total",
-            "売上債権合計": "receivables_total",
-            "その他流動資産合計": "other_current_assets_total",
-            "流動資産合計": "current_assets_total",
-            "有形固定資産合計": "tangible_fixed_assets_total",
-            "投資その他の資産合計": "investment_assets_total",
-            "固定資產合計": "fixed_assets_total",  # 注意是資產不是資産
-            "資産の部合計": "total_assets",
-            "その他流動負債合計": "other_current_liabilities_total",
-            "流動負債合計": "current_liabilities_total",
-            "固定負債合計": "fixed_liabilities_total",
-            "負債の部合計": "total_liabilities",
-            "資本金合計": "capital_stock_duplicate",  # 特殊处理
-            "資本剰余金合計": "capital_surplus_total",
-            "利益剩余金合計": "retained_earnings_total",  # 注意是剩余不是剰余
-            "株主資本合計": "shareholders_equity_total",
-            "純資産の部合計": "net_assets_total",
-            "負債·純資産の部合計": "total_liabilities_and_equity",
-            "負債・純資産の部合計": "total_liabilities_and_equity",  # 处理不同的中点符号
-            "繰越利益剩余金": "retained_earnings",  # 添加留存收益映射
-            # 中文映射（保留原有的映射）
-            "现金": "cash",
-            "银行存款": "ordinary_deposits", 
-            "现金及存款合计": "cash_and_deposits_total",
-            "现金及预金合计": "cash_and_deposits_total",
-            "应收账款": "accounts_receivable",
-            "应收票据": "notes_receivable",
-            "其他应收款": "other_receivables",
-            "应收债权合计": "receivables_total",
-            "库存": "inventory",
-            "库存商品": "inventory",
-            "其他流动资产": "other_current_assets",
-            "流动资产合计": "current_assets_total",
-            "建筑物": "buildings",
-            "机械设备": "machinery_equipment",
-            "车辆": "vehicles",
-            "有形固定资产合计": "tangible_fixed_assets_total",
-            "投资有价证券": "investment_securities",
-            "投资其他资产合计": "investment_assets_total",
-            "固定资产合计": "fixed_assets_total",
-            "资产合计": "total_assets",
-            "总资产": "total_assets",
-            "应付账款": "accounts_payable",
-            "应付票据": "notes_payable",
-            "短期借款": "short_term_loans",
-            "其他流动负债": "other_current_liabilities",
-            "流动负债合计": "current_liabilities_total",
-            "长期借款": "long_term_loans",
-            "固定负债合计": "fixed_liabilities_total",
-            "负债合计": "total_liabilities",
-            "总负债": "total_liabilities",
-            "资本金": "capital_stock",
-            "资本公积": "capital_surplus",
-            "利润公积": "retained_earnings",
-            "股东权益合计": "shareholders_equity_total",
-            "纯资产合计": "net_assets_total",
-            "负债及资本合计": "total_liabilities_and_equity",
-            "负债和权益合计": "total_liabilities_and_equity"
-        }
-        
-        mapping.update(special_mappings)
-        
-        logger.debug("映射关系构建完成:")
-        for jp, en in mapping.items():
-            logger.debug(f"  {jp} -> {en}")
-            
-        return mapping
+        return COMPILED_MAPPING.aliases
     
     def _clean_subject_name(self, name: str) -> str:
         """
@@ -414,19 +708,7 @@ class MDToExcelProcessor:
         返回:
             清理后的科目名称
         """
-        if not name:
-            return ""
-            
-        # 去除前后空格
-        name = name.strip()
-        
-        # 去除【】符号
-        name = name.replace('【', '').replace('】', '')
-        
-        # 统一全角半角
-        # 这里可以根据需要添加更多转换
-        
-        return name
+        return clean_subject_name(name)
     
     def _map_md_field_to_api_field(self, md_field: str) -> Optional[str]:
         """
@@ -438,43 +720,99 @@ class MDToExcelProcessor:
         返回:
             对应的API字段名，如果没有映射则返回None
         """
-        # 构建完整的日文到英文映射（如果还没有构建）
-        if not hasattr(self, 'japanese_to_field_mapping'):
-            self.japanese_to_field_mapping = self._build_japanese_mapping()
-            logger.info(f"已构建 {len(self.japanese_to_field_mapping)} 个日文到字段的映射")
-        
-        # 清理字段名
-        cleaned_field = self._clean_subject_name(md_field)
-        
-        # 先尝试直接匹配
-        if cleaned_field in self.japanese_to_field_mapping:
-            return self.japanese_to_field_mapping[cleaned_field]
-        
-        # 如果没有直接匹配，尝试模糊匹配
-        for key, value in self.japanese_to_field_mapping.items():
-            if key in cleaned_field or cleaned_field in key:
-                return value
+        field_name, _ = resolve_subject_name(md_field, self.japanese_to_field_mapping)
+        if field_name:
+            return field_name
         
         # 如果都没有匹配，返回None
-        logger.debug(f"未找到字段映射: {md_field} (清理后: {cleaned_field})")
+        logger.debug(f"未找到字段映射: {md_field} (清理后: {self._clean_subject_name(md_field)})")
         return None
     
     def get_output_file(self, output_filename: str) -> Optional[str]:
         """
-        获取输出文件的完整路径
+        获取输出文件的本地路径
         
         参数:
             output_filename: 输出文件名
             
         返回:
-            完整文件路径，如果文件不存在返回None
+            完整文件路径，如果文件不存在或不在本地磁盘上返回None
         """
-        file_path = self.output_dir / output_filename
-        return str(file_path) if file_path.exists() else None
-
+        file_path = self.storage.local_path(output_filename)
+        return str(file_path.resolve()) if file_path else None
+    
+    def open_output_file(self, output_filename: str) -> Optional[BinaryIO]:
+        """
+        以二进制流打开输出文件，适用于所有存储后端
+        
+        参数:
+            output_filename: 输出文件名
+            
+        返回:
+            文件对象，如果文件不存在返回None
+        """
+        try:
+            return self.storage.open(output_filename)
+        except ValueError:
+            return None
+    
+    def output_exists(self, output_filename: str) -> bool:
+        """检查输出文件是否存在于存储后端"""
+        try:
+            return self.storage.exists(output_filename)
+        except ValueError:
+            return False
+    
+    def create_download_job(self, output_filenames: List[str]) -> str:
+        """
+        记录一组输出文件，供批量下载时通过任务ID引用
+        
+        参数:
+            output_filenames: 输出文件名列表
+            
+        返回:
+            任务ID
+        """
+        job_id = uuid.uuid4().hex
+        manifest = {
+            "job_id": job_id,
+            "created_at": datetime.now().isoformat(),
+            "output_filenames": output_filenames
+        }
+        self.storage.put_bytes(
+            f"jobs/{job_id}.json",
+            json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            "job"
+        )
+        
+        logger.info(f"已创建下载任务 {job_id}，包含 {len(output_filenames)} 个文件")
+        return job_id
+    
+    def get_download_job(self, job_id: str) -> Optional[List[str]]:
+        """
+        获取下载任务中的输出文件名列表
+        
+        参数:
+            job_id: 任务ID
+            
+        返回:
+            输出文件名列表，如果任务不存在返回None
+        """
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id or ''):
+            return None
+        
+        data = self.storage.get_bytes(f"jobs/{job_id}.json")
+        if data is None:
+            return None
+        
+        return json.loads(data).get("output_filenames", [])
 
 def main():
     """测试MD到Excel处理功能"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     processor = MDToExcelProcessor()
     
     # 测试内容
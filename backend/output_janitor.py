@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+输出文件的保留期限与磁盘配额管理
+写入方登记每个生成的文件，清理线程按索引删除过期文件，并在总大小超出配额时从最旧的文件开始删除
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 索引数据库文件名（位于输出目录下）
+INDEX_FILENAME = ".output_index.sqlite"
+
+# 默认策略
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600      # 7天
+DEFAULT_MAX_TOTAL_BYTES = 2 * 1024 ** 3      # 2GB
+DEFAULT_INTERVAL_SECONDS = 300               # 每5分钟清理一次
+DEFAULT_GRACE_SECONDS = 60                   # 刚生成的文件不参与配额淘汰，避免删除正在下载的文件
+
+# 不参与清理的文件类别：备份blob由追加式清单引用，删除后清单中的记录无法恢复
+PROTECTED_KINDS = ("backup",)
+
+# 单次清理中每批读取的索引行数
+_BATCH_SIZE = 500
+
+# 重建索引时明确排除的文件：备份清单、批量模式的检查点和汇总报告（隐藏的附属文件本来就跳过）
+_REBUILD_EXCLUDED_NAMES = ("manifest.jsonl",)
+_REBUILD_EXCLUDED_PREFIXES = ("batch_checkpoint", "batch_report_")
+
+_UNPROTECTED = f"kind NOT IN ({', '.join('?' for _ in PROTECTED_KINDS)})"
+
+
+class OutputIndex:
+    """
+    输出目录的文件索引
+    使用SQLite记录每个文件的路径、大小和创建时间，清理时无需遍历整个目录
+    """
+
+    def __init__(self, output_dir: str = "output"):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.output_dir / INDEX_FILENAME
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        with self._transaction() as conn:
+            # 使用默认的回滚日志模式：WAL依赖共享内存，不能用于EFS等网络文件系统
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " kind TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS files_created ON files (created)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 进程内复用一个连接（由_lock串行化）；批量模式fork出的工作进程不能沿用父进程的连接，按pid重新打开
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(str(self.index_path), timeout=30, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """在锁内执行一个事务，正常结束时提交，异常时回滚"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                yield conn
+
+    def _relative(self, path) -> str:
+        path = Path(path)
+        try:
+            return str(path.relative_to(self.output_dir))
+        except ValueError:
+            return str(path)
+
+    def record(self, path, kind: str = "output"):
+        """
+        登记一个新写入的文件
+
+        参数:
+            path: 文件路径
+            kind: 文件类别（output、backup、job等）
+        """
+        stat = Path(path).stat()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, created, kind) VALUES (?, ?, ?, ?)",
+                (self._relative(path), stat.st_size, stat.st_mtime, kind)
+            )
+
+    def forget(self, relative_path: str):
+        """从索引中移除一个文件"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+
+    def stats(self) -> Dict[str, int]:
+        """返回索引中的文件数和总字节数"""
+        with self._transaction() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return {"tracked_files": count, "tracked_bytes": total}
+
+    def evictable_bytes(self) -> int:
+        """返回可被清理的文件（PROTECTED_KINDS之外）的总字节数"""
+        with self._transaction() as conn:
+            return conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM files WHERE {_UNPROTECTED}",
+                                PROTECTED_KINDS).fetchone()[0]
+
+    def oldest(self, created_before: float, limit: int = _BATCH_SIZE, offset: int = 0):
+        """按创建时间从旧到新返回早于指定时间、可被清理的文件"""
+        with self._transaction() as conn:
+            return conn.execute(
+                f"SELECT path, size, created FROM files WHERE created < ? AND {_UNPROTECTED}"
+                " ORDER BY created LIMIT ? OFFSET ?",
+                (created_before, *PROTECTED_KINDS, limit, offset)
+            ).fetchall()
+
+    def _classify(self, path: Path) -> Optional[str]:
+        """重建索引时判断文件类别；只索引生成的工作簿、备份blob和下载任务清单，其他文件返回None"""
+        name = path.name
+        if name in _REBUILD_EXCLUDED_NAMES or name.startswith(_REBUILD_EXCLUDED_PREFIXES):
+            return None
+        parts = path.relative_to(self.output_dir).parts
+        if path.suffix == ".json" and parts[0] == "jobs":
+            return "job"
+        if path.suffix != ".xlsx":
+            return None
+        if "backups" in parts or "_backup_" in name:
+            return "backup"
+        return "output"
+
+    def rebuild(self) -> int:
+        """
+        遍历输出目录重建索引
+        仅在索引首次创建或手动修复时使用；检查点、报告和清单等文件不纳入索引，不会被清理
+
+        返回:
+            索引中的文件数
+        """
+        rows = []
+        for root, dirs, files in os.walk(self.output_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = Path(root) / name
+                kind = self._classify(path)
+                if kind is None:
+                    continue
+                stat = path.stat()
+                rows.append((self._relative(path), stat.st_size, stat.st_mtime, kind))
+
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM files")
+            conn.executemany("INSERT INTO files (path, size, created, kind) VALUES (?, ?, ?, ?)", rows)
+
+        logger.info(f"已重建输出索引: {len(rows)} 个文件")
+        return len(rows)
+
+
+# 输出目录 → 索引，每个目录只创建一次（建目录、建表），之后复用
+_indexes: Dict[str, OutputIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_output_index(output_dir: str = "output") -> OutputIndex:
+    """返回输出目录对应的共享索引"""
+    key = str(Path(output_dir).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or not index.index_path.exists():
+            # 索引文件被删除（如输出目录被清空）时重新创建
+            index = _indexes[key] = OutputIndex(output_dir)
+        return index
+
+
+def record_output(path, kind: str = "output", output_dir: str = "output"):
+    """
+    登记新生成的文件，登记失败不影响主流程
+
+    参数:
+        path: 文件路径
+        kind: 文件类别
+        output_dir: 输出根目录
+    """
+    try:
+        get_output_index(output_dir).record(path, kind)
+    except Exception as e:
+        logger.warning(f"登记输出文件 {path} 失败: {str(e)}")
+
+
+class OutputJanitor:
+    """
+    按保留期限和磁盘配额清理输出目录
+    可作为后台线程周期运行，也可通过run_once单次执行
+    """
+
+    def __init__(self, output_dir: str = "output",
+                 max_age_seconds: Optional[float] = DEFAULT_MAX_AGE_SECONDS,
+                 max_total_bytes: Optional[int] = DEFAULT_MAX_TOTAL_BYTES,
+                 interval_seconds: float = DEFAULT_INTERVAL_SECONDS,
+                 grace_seconds: float = DEFAULT_GRACE_SECONDS,
+                 dry_run: bool = False):
+        """
+        初始化清理器
+
+        参数:
+            output_dir: 输出根目录
+            max_age_seconds: 文件最长保留时间，None表示不按时间清理
+            max_total_bytes: 文件总大小上限，None表示不限制
+            interval_seconds: 后台线程的清理间隔
+            grace_seconds: 配额淘汰时跳过最近生成的文件
+            dry_run: 只统计不删除
+        """
+        self.output_dir = Path(output_dir)
+        self.max_age_seconds = max_age_seconds
+        self.max_total_bytes = max_total_bytes
+        self.interval_seconds = interval_seconds
+        self.grace_seconds = grace_seconds
+        self.dry_run = dry_run
+
+        fresh_index = not (self.output_dir / INDEX_FILENAME).exists()
+        self.index = get_output_index(output_dir)
+        if fresh_index:
+            # 首次启用时纳入之前版本生成的文件
+            self.index.rebuild()
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "runs": 0,
+            "files_removed": 0,
+            "bytes_reclaimed": 0,
+            "last_run_at": None,
+            "last_run_files_removed": 0,
+            "last_run_bytes_reclaimed": 0,
+            "last_run_duration_ms": 0.0,
+        }
+
+    def _remove(self, relative_path: str, size: int) -> Optional[int]:
+        """删除一个文件并从索引移除，返回回收的字节数；不应清理的文件只移出索引，返回None"""
+        if self.dry_run:
+            return size
+        if self.index._classify(self.output_dir / relative_path) is None:
+            # 旧版本重建的索引可能包含清单、检查点等文件：只移出索引，不删除
+            self.index.forget(relative_path)
+            return None
+        try:
+            (self.output_dir / relative_path).unlink()
+        except FileNotFoundError:
+            # 已被其他途径删除，只需更新索引
+            size = 0
+        self.index.forget(relative_path)
+        return size
+
+    def _iter_oldest(self, created_before: float):
+        """
+        按创建时间从旧到新分批遍历索引
+        实际删除时已删除的行不会再次返回；演练模式下不删除，需要按偏移翻页
+        """
+        offset = 0
+        while True:
+            rows = self.index.oldest(created_before, offset=offset)
+            yield from rows
+            if len(rows) < _BATCH_SIZE:
+                return
+            if self.dry_run:
+                offset += len(rows)
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        执行一次清理
+
+        返回:
+            本次清理删除的文件数和回收的字节数
+        """
+        started = time.perf_counter()
+        now = time.time()
+        removed_paths = set()
+        reclaimed = 0
+
+        # 1. 删除超过保留期限的文件
+        if self.max_age_seconds is not None:
+            for path, size, _ in self._iter_oldest(now - self.max_age_seconds):
+                freed = self._remove(path, size)
+                if freed is not None:
+                    reclaimed += freed
+                    removed_paths.add(path)
+
+        # 2. 可清理文件的总大小超出配额时从最旧的文件开始删除
+        if self.max_total_bytes is not None:
+            total = self.index.evictable_bytes()
+            if self.dry_run:
+                total -= reclaimed
+            if total > self.max_total_bytes:
+                for path, size, _ in self._iter_oldest(now - self.grace_seconds):
+                    if total <= self.max_total_bytes:
+                        break
+                    if path in removed_paths:
+                        continue
+                    freed = self._remove(path, size)
+                    total -= size
+                    if freed is not None:
+                        reclaimed += freed
+                        removed_paths.add(path)
+
+        removed = len(removed_paths)
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        with self._metrics_lock:
+            self._metrics["runs"] += 1
+            self._metrics["files_removed"] += removed
+            self._metrics["bytes_reclaimed"] += reclaimed
+            self._metrics["last_run_at"] = now
+            self._metrics["last_run_files_removed"] = removed
+            self._metrics["last_run_bytes_reclaimed"] = reclaimed
+            self._metrics["last_run_duration_ms"] = duration_ms
+
+        if removed:
+            action = "可删除" if self.dry_run else "已删除"
+            logger.info(f"🧹 输出清理完成: {action} {removed} 个文件，回收 {reclaimed} 字节，耗时 {duration_ms}ms")
+
+        return {"files_removed": removed, "bytes_reclaimed": reclaimed, "duration_ms": duration_ms}
+
+    def metrics(self) -> Dict[str, Any]:
+        """返回累计的清理指标和当前索引统计"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics.update(self.index.stats())
+        metrics.update({
+            "max_age_seconds": self.max_age_seconds,
+            "max_total_bytes": self.max_total_bytes,
+        })
+        return metrics
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"输出清理失败: {str(e)}", exc_info=True)
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="output-janitor", daemon=True)
+        self._thread.start()
+        logger.info(f"输出清理线程已启动: 目录 {self.output_dir}，间隔 {self.interval_seconds} 秒")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+def main():
+    """命令行单次清理输出目录"""
+    import argparse
+    import json
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="清理输出目录中过期或超出配额的文件")
+    parser.add_argument("--output-dir", default="output", help="输出目录")
+    parser.add_argument("--max-age-hours", type=float, default=DEFAULT_MAX_AGE_SECONDS / 3600,
+                        help="文件最长保留小时数，0表示不按时间清理")
+    parser.add_argument("--max-size-mb", type=float, default=DEFAULT_MAX_TOTAL_BYTES / 1024 ** 2,
+                        help="输出目录总大小上限(MB)，0表示不限制")
+    parser.add_argument("--rebuild-index", action="store_true", help="清理前遍历目录重建索引")
+    parser.add_argument("--dry-run", action="store_true", help="只统计可回收的空间，不删除文件")
+
+    args = parser.parse_args()
+
+    janitor = OutputJanitor(
+        args.output_dir,
+        max_age_seconds=args.max_age_hours * 3600 or None,
+        max_total_bytes=int(args.max_size_mb * 1024 ** 2) or None,
+        dry_run=args.dry_run
+    )
+    if args.rebuild_index:
+        janitor.index.rebuild()
+
+    result = janitor.run_once()
+    print(json.dumps(dict(result, **janitor.index.stats()), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+输出文件的命名与目录布局
+使用ULID生成不会冲突的文件名，并按文件名哈希前缀分片存放，避免单个目录下文件过多；
+确定性输出可以改用内容哈希作为文件名，相同内容得到相同的文件名
+"""
+
+import os
+import re
+import time
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+# Crockford Base32字母表（ULID标准）
+_CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# 分片层数和每层的十六进制字符数：output/ab/cd/<文件名>
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+# 文件名中不允许出现的字符（路径分隔符和控制字符）
+_UNSAFE_CHARS = re.compile(r'[/\\\x00-\x1f]')
+
+# 内容哈希文件名中的哈希长度（SHA-256的十六进制前缀）
+CONTENT_HASH_LENGTH = 32
+_CONTENT_NAME = re.compile(r'_output_([0-9a-f]{%d})\.[A-Za-z]+$' % CONTENT_HASH_LENGTH)
+
+
+def new_ulid() -> str:
+    """
+    生成ULID：48位毫秒时间戳 + 80位随机数，编码为26个字符
+    按字典序排序即按生成时间排序
+    """
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), 'big')
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD_ALPHABET[value & 0x1F])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def make_output_filename(source_name: str, suffix: str = ".xlsx") -> str:
+    """
+    根据源文件名生成不会冲突的输出文件名
+
+    参数:
+        source_name: 原始文件名（仅使用其stem部分）
+        suffix: 输出文件扩展名
+
+    返回:
+        形如 {stem}_output_{ULID}.xlsx 的文件名
+    """
+    stem = _UNSAFE_CHARS.sub('_', Path(source_name).stem) or "output"
+    return f"{stem}_output_{new_ulid()}{suffix}"
+
+
+def make_content_filename(source_name: str, content: bytes, suffix: str = ".xlsx") -> str:
+    """
+    根据文件内容生成输出文件名，相同内容得到相同的文件名
+
+    参数:
+        source_name: 原始文件名（仅使用其stem部分）
+        content: 输出文件的内容
+        suffix: 输出文件扩展名
+
+    返回:
+        形如 {stem}_output_{内容哈希}.xlsx 的文件名
+    """
+    stem = _UNSAFE_CHARS.sub('_', Path(source_name).stem) or "output"
+    return f"{stem}_output_{hashlib.sha256(content).hexdigest()[:CONTENT_HASH_LENGTH]}{suffix}"
+
+
+def content_hash_from_filename(filename: str) -> Optional[str]:
+    """返回内容哈希文件名中的哈希，ULID文件名返回None"""
+    match = _CONTENT_NAME.search(filename)
+    return match.group(1) if match else None
+
+
+def is_safe_filename(filename: str) -> bool:
+    """检查文件名不含路径分隔符等特殊字符"""
+    return bool(filename) and not _UNSAFE_CHARS.search(filename) and filename not in ('.', '..')
+
+
+def shard_dir(output_dir: Path, filename: str) -> Path:
+    """
+    计算文件所在的分片目录
+
+    分片由文件名的哈希决定，查找时无需扫描目录
+    """
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    parts = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return Path(output_dir).joinpath(*parts)
+
+
+def output_path_for(output_dir: Path, filename: str, create: bool = False) -> Path:
+    """
+    获取输出文件的存放路径
+
+    参数:
+        output_dir: 输出根目录
+        filename: 输出文件名
+        create: 是否创建分片目录
+
+    返回:
+        分片目录下的完整路径
+    """
+    directory = shard_dir(output_dir, filename)
+    if create:
+        directory.mkdir(parents=True, exist_ok=True)
+    return directory / filename
+
+
+def find_output_file(output_dir: Path, filename: str) -> Optional[Path]:
+    """
+    O(1)查找输出文件，兼容旧版直接存放在根目录下的文件
+
+    参数:
+        output_dir: 输出根目录
+        filename: 输出文件名
+
+    返回:
+        文件路径，如果不存在或文件名不合法返回None
+    """
+    if not is_safe_filename(filename):
+        return None
+
+    path = output_path_for(output_dir, filename)
+    if path.is_file():
+        return path
+
+    legacy_path = Path(output_dir) / filename
+    if legacy_path.is_file():
+        return legacy_path
+
+    return None
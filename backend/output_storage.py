@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+输出文件存储后端
+支持本地磁盘、多个任务共享挂载的文件系统（如EFS）以及S3兼容的对象存储，
+使下载请求被负载均衡到任意后端任务时都能找到文件
+"""
+
+import io
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from output_layout import is_safe_filename, output_path_for, find_output_file
+from output_janitor import OutputJanitor, record_output
+
+logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 流式读写的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+class OutputStorage:
+    """
+    输出文件存储后端基类
+
+    写入流程：write_path(key) 取得本地可写路径 → 写入器保存文件 → commit(key, path)
+    读取流程：local_path(key) 可直接发送的本地文件，否则 open(key) 流式读取
+    in_memory为True的后端希望直接接收内存中的字节（put_bytes），写入器无需落盘
+    """
+
+    in_memory = False
+
+    def write_path(self, key: str) -> Path:
+        """返回写入器应保存到的本地路径"""
+        raise NotImplementedError
+
+    def commit(self, key: str, path: Path, kind: str = "output"):
+        """写入器保存完成后提交文件"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """如果文件在本地磁盘上可直接访问，返回其路径"""
+        return None
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """以二进制流打开文件，不存在时返回None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def touch(self, key: str) -> bool:
+        """
+        重用已有文件时刷新其使用时间，使清理按最近一次使用而不是首次写入计算保留期
+
+        返回:
+            文件是否存在（不存在时调用方应重新写入）
+        """
+        return self.exists(key)
+
+    def put_bytes(self, key: str, data: bytes, kind: str = "output"):
+        """保存一个小对象（如下载任务清单）"""
+        raise NotImplementedError
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """读取一个小对象，不存在时返回None"""
+        stream = self.open(key)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+
+
+def _validate_key(key: str):
+    parts = key.split('/')
+    if not all(is_safe_filename(part) for part in parts):
+        raise ValueError(f"非法的存储键: {key}")
+    return parts
+
+
+class LocalStorage(OutputStorage):
+    """本地磁盘存储，使用哈希分片目录布局"""
+
+    def __init__(self, root: str = "output"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str, create: bool = False) -> Path:
+        parts = _validate_key(key)
+        if len(parts) == 1:
+            return output_path_for(self.root, key, create=create)
+        # 带前缀的键（如 jobs/<id>.json）直接按目录存放
+        path = self.root.joinpath(*parts)
+        if create:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def write_path(self, key: str) -> Path:
+        return self._path(key, create=True)
+
+    def commit(self, key: str, path: Path, kind: str = "output"):
+        record_output(path, kind, str(self.root))
+
+    def local_path(self, key: str) -> Optional[Path]:
+        try:
+            parts = _validate_key(key)
+        except ValueError:
+            return None
+        if len(parts) == 1:
+            return find_output_file(self.root, key)
+        path = self.root.joinpath(*parts)
+        return path if path.is_file() else None
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        path = self.local_path(key)
+        return open(path, 'rb') if path else None
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key) is not None
+
+    def touch(self, key: str) -> bool:
+        path = self.local_path(key)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # 检查后被清理任务删除
+            return False
+        record_output(path, "output", str(self.root))
+        return True
+
+    def put_bytes(self, key: str, data: bytes, kind: str = "output"):
+        path = self._path(key, create=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.commit(key, path, kind)
+
+
+class SharedFSStorage(LocalStorage):
+    """
+    多个后端任务共享挂载的文件系统存储
+    先写入同目录下的临时文件，落盘后原子重命名，其他任务不会读到写了一半的文件
+    """
+
+    def write_path(self, key: str) -> Path:
+        path = self._path(key, create=True)
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+    def commit(self, key: str, path: Path, kind: str = "output"):
+        final_path = self._path(key)
+        if Path(path) != final_path:
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(path, final_path)
+        super().commit(key, final_path, kind)
+
+
+class _CachingReader:
+    """
+    读取S3对象流的同时写入本地缓存
+    完整读完后才把临时文件重命名为缓存文件，中途关闭则丢弃
+    """
+
+    def __init__(self, body, cache_path: Path, on_cached):
+        self._body = body
+        self._cache_path = cache_path
+        self._tmp_path = cache_path.with_name(f".{cache_path.name}.{uuid.uuid4().hex}.tmp")
+        self._tmp = open(self._tmp_path, 'wb')
+        self._on_cached = on_cached
+        self._finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._body.read(size if size and size > 0 else None)
+        if chunk:
+            self._tmp.write(chunk)
+        elif not self._finished:
+            self._finished = True
+            self._tmp.close()
+            os.replace(self._tmp_path, self._cache_path)
+            self._on_cached(self._cache_path)
+        return chunk
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self):
+        if not self._tmp.closed:
+            self._tmp.close()
+        if not self._finished:
+            try:
+                self._tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+        self._body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class S3Storage(OutputStorage):
+    """
+    S3兼容的对象存储
+    上传和下载均为流式；最近访问的对象保留在本地缓存目录中，按最近使用时间淘汰
+    设置endpoint_url即可连接MinIO等本地替代服务进行测试
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 cache_dir: str = "s3_cache", cache_max_bytes: int = 512 * 1024 ** 2):
+        """
+        初始化S3存储
+
+        参数:
+            bucket: 存储桶名称
+            prefix: 对象键前缀
+            endpoint_url: 自定义端点（MinIO等），None表示使用AWS S3
+            cache_dir: 本地缓存目录
+            cache_max_bytes: 本地缓存的总大小上限
+        """
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("使用S3输出存储需要安装boto3: pip install boto3")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.cache = LocalStorage(cache_dir)
+        self._cache_janitor = OutputJanitor(
+            cache_dir, max_age_seconds=None, max_total_bytes=cache_max_bytes, grace_seconds=0
+        )
+        self._cache_lock = threading.Lock()
+
+    def _object_key(self, key: str) -> str:
+        _validate_key(key)
+        return self.prefix + key
+
+    def _is_missing(self, error) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def _touch(self, path: Path):
+        """刷新缓存文件的使用时间（索引中的时间即淘汰顺序）"""
+        os.utime(path)
+        self.cache.commit(path.name, path, "cache")
+
+    def _cached(self, path: Path):
+        """登记新写入的缓存文件并按配额淘汰最久未使用的缓存"""
+        self._touch(path)
+        # 只在缓存增长后淘汰；已有线程在淘汰时直接跳过，不阻塞其他上传和下载
+        if self._cache_lock.acquire(blocking=False):
+            try:
+                self._cache_janitor.run_once()
+            finally:
+                self._cache_lock.release()
+
+    def write_path(self, key: str) -> Path:
+        return self.cache.write_path(key)
+
+    def commit(self, key: str, path: Path, kind: str = "output"):
+        # upload_file按分片从磁盘读取上传，不会把整个文件读入内存
+        try:
+            self.client.upload_file(
+                str(path), self.bucket, self._object_key(key),
+                ExtraArgs={'ContentType': XLSX_MIMETYPE if key.endswith('.xlsx') else 'application/octet-stream'}
+            )
+        except Exception as e:
+            # 上传失败的文件不能留在缓存中，否则本任务会把存储桶中不存在的文件当作已生成的输出提供下载
+            Path(path).unlink(missing_ok=True)
+            logger.error(f"上传到S3失败，已删除本地缓存: {path} ({str(e)})")
+            raise
+        logger.info(f"已上传到S3: s3://{self.bucket}/{self._object_key(key)}")
+        self._cached(Path(path))
+
+    def local_path(self, key: str) -> Optional[Path]:
+        path = self.cache.local_path(key)
+        if path:
+            # 命中缓存时只刷新使用时间，不触发淘汰
+            self._touch(path)
+        return path
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        cached = self.local_path(key)
+        if cached:
+            return open(cached, 'rb')
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return _CachingReader(response['Body'], self.cache.write_path(key), self._cached)
+
+    def exists(self, key: str) -> bool:
+        if self.cache.local_path(key):
+            return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def touch(self, key: str) -> bool:
+        # 对象存储中的对象由存储桶自身的策略管理，只刷新本地缓存的使用时间
+        cached = self.local_path(key)
+        return cached is not None or self.exists(key)
+
+    def put_bytes(self, key: str, data: bytes, kind: str = "output"):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return response['Body'].read()
+
+
+class MemoryStorage(OutputStorage):
+    """
+    带内存预算的TTL存储，适用于生成后几秒内下载一次即不再使用的工作簿
+    超出内存预算时把最早的对象溢出到磁盘；延长保留时间的对象也转存到磁盘，
+    过期的内存对象直接丢弃
+    """
+
+    in_memory = True
+
+    def __init__(self, spill: OutputStorage, max_bytes: int = 256 * 1024 ** 2,
+                 ttl_seconds: float = 600):
+        """
+        初始化内存存储
+
+        参数:
+            spill: 溢出和长期保留使用的存储后端
+            max_bytes: 内存中保存的字节总数上限
+            ttl_seconds: 内存对象的保留时间
+        """
+        self.spill = spill
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"stored": 0, "expired": 0, "spilled": 0, "memory_hits": 0}
+
+    def _expire(self, now: float):
+        # 条目按写入顺序排列，TTL相同，因此只需检查队首
+        while self._entries:
+            key, (data, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            self._used_bytes -= len(data)
+            self._stats["expired"] += 1
+
+    def _pop(self, key: str) -> Optional[bytes]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._used_bytes -= len(entry[0])
+        return entry[0]
+
+    def put_bytes(self, key: str, data: bytes, kind: str = "output"):
+        _validate_key(key)
+        if kind != "output" or len(data) > self.max_bytes:
+            # 任务清单等需要长期保留的对象和超大对象直接写入磁盘
+            self.spill.put_bytes(key, data, kind)
+            return
+
+        to_spill = []
+        with self._lock:
+            self._expire(time.time())
+            self._pop(key)
+            while self._entries and self._used_bytes + len(data) > self.max_bytes:
+                spill_key, (spill_data, _) = self._entries.popitem(last=False)
+                self._used_bytes -= len(spill_data)
+                to_spill.append((spill_key, spill_data))
+            self._entries[key] = (data, time.time() + self.ttl_seconds)
+            self._used_bytes += len(data)
+            self._stats["stored"] += 1
+            self._stats["spilled"] += len(to_spill)
+
+        # 磁盘写入在锁外进行
+        for spill_key, spill_data in to_spill:
+            self.spill.put_bytes(spill_key, spill_data)
+        if to_spill:
+            logger.info(f"内存存储超出预算，已溢出 {len(to_spill)} 个对象到磁盘")
+
+    def write_path(self, key: str) -> Path:
+        return self.spill.write_path(key)
+
+    def commit(self, key: str, path: Path, kind: str = "output"):
+        self.spill.commit(key, path, kind)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._stats["memory_hits"] += 1
+            return entry[0]
+
+    def local_path(self, key: str) -> Optional[Path]:
+        with self._lock:
+            if key in self._entries:
+                return None
+        return self.spill.local_path(key)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        data = self._get(key)
+        if data is not None:
+            return io.BytesIO(data)
+        return self.spill.open(key)
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            self._expire(time.time())
+            if key in self._entries:
+                return True
+        return self.spill.exists(key)
+
+    def touch(self, key: str) -> bool:
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # 重新计时并移到队尾，保持条目按过期时间排列
+                self._entries[key] = (entry[0], time.time() + self.ttl_seconds)
+                return True
+        return self.spill.touch(key)
+
+    def extend_ttl(self, key: str) -> bool:
+        """
+        长期保留一个对象：从内存转存到磁盘，之后按磁盘的保留策略管理
+
+        返回:
+            对象是否存在
+        """
+        with self._lock:
+            data = self._pop(key)
+            if data is not None:
+                self._stats["spilled"] += 1
+        if data is not None:
+            self.spill.put_bytes(key, data)
+            return True
+        return self.spill.exists(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回内存使用情况和累计计数"""
+        with self._lock:
+            self._expire(time.time())
+            return dict(self._stats, objects=len(self._entries),
+                        used_bytes=self._used_bytes, max_bytes=self.max_bytes)
+
+
+_storage: Optional[OutputStorage] = None
+_storage_lock = threading.Lock()
+
+
+def create_output_storage() -> OutputStorage:
+    """
+    根据环境变量创建存储后端
+
+    OUTPUT_STORAGE: local（默认）、shared、s3、memory
+    OUTPUT_DIR: 本地存储目录（默认output），memory模式下作为溢出目录
+    MEMORY_STORE_MAX_MB / MEMORY_STORE_TTL_SECONDS: memory模式的内存预算和保留时间
+    SHARED_OUTPUT_DIR: 共享文件系统的挂载目录
+    S3_BUCKET / S3_PREFIX / S3_ENDPOINT_URL / S3_CACHE_DIR / S3_CACHE_MAX_MB: S3存储配置
+    """
+    backend = os.environ.get('OUTPUT_STORAGE', 'local').lower()
+
+    if backend == 'local':
+        return LocalStorage(os.environ.get('OUTPUT_DIR', 'output'))
+    if backend == 'shared':
+        return SharedFSStorage(os.environ.get('SHARED_OUTPUT_DIR', '/mnt/excelsync/output'))
+    if backend == 's3':
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', 'output'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            cache_dir=os.environ.get('S3_CACHE_DIR', 's3_cache'),
+            cache_max_bytes=int(float(os.environ.get('S3_CACHE_MAX_MB', 512)) * 1024 ** 2)
+        )
+    if backend == 'memory':
+        return MemoryStorage(
+            LocalStorage(os.environ.get('OUTPUT_DIR', 'output')),
+            max_bytes=int(float(os.environ.get('MEMORY_STORE_MAX_MB', 256)) * 1024 ** 2),
+            ttl_seconds=float(os.environ.get('MEMORY_STORE_TTL_SECONDS', 600))
+        )
+    raise ValueError(f"未知的输出存储后端: {backend}")
+
+
+def get_output_storage() -> OutputStorage:
+    """获取进程内共享的存储后端（首次调用时创建）"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_output_storage()
+                logger.info(f"输出存储后端: {type(_storage).__name__}")
+    return _storage
@@ -4,7 +4,7 @@ MarkdownSync Backend Server
 启动脚本：简化版MD解析服务器
 """
 
-from app import app
+from app import create_app
 
 if __name__ == '__main__':
     print("🚀 Starting MarkdownSync Backend Server...")
@@ -18,4 +18,4 @@ if __name__ == '__main__':
     print("   - GET  /api/health (health check)")
     print("-" * 50)
     
-    app.run(debug=True, host='0.0.0.0', port=8001)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=8001)
\ No newline at end of file
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+多客户模板注册表
+从配置目录读取每个客户的模板定义（工作簿、工作表、映射、科目别名），每个模板只编译一次，
+按内存预算以LRU方式缓存，配置或工作簿变化时自动重新加载
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from mapping_compiler import CompiledMapping, MappingError, compile_mapping, load_mapping
+from mapping_config import COMPILED_MAPPING
+
+logger = logging.getLogger(__name__)
+
+# 未指定模板时使用的模板ID
+DEFAULT_TEMPLATE_ID = "default"
+
+# 内置默认模板（配置目录中没有 default.json 时使用）
+DEFAULT_WORKBOOK = "mapping.xlsx"
+DEFAULT_SHEET = "A社貼り付けBS"
+
+# 默认的缓存上限和配置检查间隔
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 ** 2
+DEFAULT_CHECK_INTERVAL_SECONDS = 2.0
+
+# 模板ID只允许字母、数字、下划线和连字符（含日文等Unicode文字）
+_TEMPLATE_ID_PATTERN = re.compile(r'^[\w-]{1,64}$')
+
+class TemplateError(ValueError):
+    """模板定义无效"""
+
+
+class TemplateNotFoundError(TemplateError):
+    """找不到指定ID的模板"""
+
+
+class CompiledTemplate(NamedTuple):
+    """编译后的模板，所有字段只读"""
+    template_id: str
+    workbook_path: Path
+    sheet: str
+    mapping: Mapping[str, str]
+    aliases: Mapping[str, str]
+    workbook_bytes: bytes
+    signature: Tuple
+    compiled_mapping: CompiledMapping
+
+    @property
+    def mapping_version(self) -> str:
+        """映射定义的版本哈希"""
+        return self.compiled_mapping.version
+
+    @property
+    def size(self) -> int:
+        """缓存占用的近似字节数"""
+        return len(self.workbook_bytes) + 200 * (len(self.mapping) + len(self.aliases))
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class TemplateRegistry:
+    """
+    模板注册表
+
+    配置目录中每个模板一个JSON文件，文件名（不含扩展名）即模板ID:
+
+        templates/b_company.json
+        {
+            "workbook": "b_company.xlsx",      # 相对于配置目录，也可以是绝对路径
+            "sheet": "B社貼り付けBS",
+            "mapping_file": "b_company.yaml",  # 可选，独立的映射文件（结构同 mapping.json），相对于配置目录
+            "mapping": {"cash": "D4", ...},    # 可选，内联映射，默认为TRIAL_BALANCE_MAPPING
+            "descriptions": {"D4": "現金", ...},  # 可选，用于生成科目别名，默认为CELL_DESCRIPTIONS
+            "aliases": {"現預金": "cash"}       # 可选，补充的科目别名
+        }
+
+    未指定的科目别名沿用默认映射的别名表
+    """
+
+    def __init__(self, config_dir: str = "templates",
+                 max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 check_interval_seconds: float = DEFAULT_CHECK_INTERVAL_SECONDS):
+        """
+        初始化注册表
+
+        参数:
+            config_dir: 模板定义目录
+            max_bytes: 已编译模板的内存预算，超出时淘汰最久未使用的模板
+            check_interval_seconds: 检查配置和工作簿是否变化的最短间隔
+        """
+        self.config_dir = Path(config_dir)
+        self.max_bytes = max_bytes
+        self.check_interval_seconds = check_interval_seconds
+        self._cache: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self._checked_at: Dict[str, float] = {}
+        # 正在检查或编译的模板 → 其结果
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "compiles": 0, "reloads": 0, "evictions": 0}
+
+    def _definition_path(self, template_id: str) -> Path:
+        return self.config_dir / f"{template_id}.json"
+
+    def _load_definition(self, template_id: str) -> Tuple[Dict[str, Any], Optional[Path]]:
+        """读取模板定义，返回 (定义, 定义文件路径)"""
+        path = self._definition_path(template_id)
+        if path.is_file():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    definition = json.load(f)
+            except ValueError as e:
+                raise TemplateError(f"模板定义 {path} 格式错误: {str(e)}")
+            if not isinstance(definition, dict) or "workbook" not in definition:
+                raise TemplateError(f"模板定义 {path} 缺少 workbook")
+            return definition, path
+
+        if template_id == DEFAULT_TEMPLATE_ID:
+            return {"workbook": DEFAULT_WORKBOOK, "sheet": DEFAULT_SHEET}, None
+
+        raise TemplateNotFoundError(f"找不到模板: {template_id}")
+
+    def _workbook_path(self, definition: Dict[str, Any], definition_path: Optional[Path]) -> Path:
+        workbook = Path(definition["workbook"])
+        if definition_path is not None and not workbook.is_absolute():
+            workbook = definition_path.parent / workbook
+        return workbook
+
+    def _mapping_path(self, definition: Dict[str, Any], definition_path: Optional[Path]) -> Optional[Path]:
+        if not definition.get("mapping_file"):
+            return None
+        mapping_path = Path(definition["mapping_file"])
+        if definition_path is not None and not mapping_path.is_absolute():
+            mapping_path = definition_path.parent / mapping_path
+        return mapping_path
+
+    def _signature(self, template_id: str) -> Tuple:
+        """模板定义文件、工作簿和映射文件的状态，任一变化都需要重新编译"""
+        definition_path = self._definition_path(template_id)
+        try:
+            definition, path = self._load_definition(template_id)
+        except TemplateError:
+            return (_file_signature(definition_path), None, None)
+        mapping_path = self._mapping_path(definition, path)
+        return (_file_signature(definition_path),
+                _file_signature(self._workbook_path(definition, path)),
+                _file_signature(mapping_path) if mapping_path else None)
+
+    def _compile_mapping(self, template_id: str, definition: Dict[str, Any],
+                         definition_path: Optional[Path]) -> CompiledMapping:
+        """编译模板的映射：映射文件、内联映射或默认映射"""
+        mapping_path = self._mapping_path(definition, definition_path)
+        try:
+            if mapping_path is not None:
+                compiled = load_mapping(mapping_path)
+            elif any(definition.get(key) for key in ("mapping", "descriptions", "aliases")):
+                compiled = compile_mapping({
+                    "mapping": definition.get("mapping") or dict(COMPILED_MAPPING.cells),
+                    "descriptions": definition.get("descriptions") or dict(COMPILED_MAPPING.descriptions),
+                    "data_types": dict(COMPILED_MAPPING.data_types),
+                    "aliases": definition.get("aliases") or {},
+                    "source_columns": dict(COMPILED_MAPPING.source_columns),
+                    "primary_source_column": COMPILED_MAPPING.primary_source_column
+                })
+            else:
+                return COMPILED_MAPPING
+        except FileNotFoundError:
+            raise TemplateError(f"模板 {template_id} 的映射文件不存在: {mapping_path}")
+        except MappingError as e:
+            raise TemplateError(f"模板 {template_id} 的映射无效: {str(e)}")
+
+        # 模板自身的别名优先，未覆盖的科目名称沿用默认别名表
+        aliases = dict(COMPILED_MAPPING.aliases)
+        aliases.update(compiled.aliases)
+        return compiled._replace(aliases=MappingProxyType(aliases))
+
+    def compile(self, template_id: str) -> CompiledTemplate:
+        """
+        编译模板：读取定义和工作簿，检查工作表存在，构建别名表
+
+        异常:
+            TemplateNotFoundError: 找不到模板定义
+            TemplateError: 定义无效、工作簿不存在或工作表不存在
+        """
+        # 先记录文件状态再读取内容，编译期间文件被修改时下次访问会重新编译
+        signature = self._signature(template_id)
+        definition, definition_path = self._load_definition(template_id)
+        workbook_path = self._workbook_path(definition, definition_path)
+        sheet = definition.get("sheet", DEFAULT_SHEET)
+        compiled_mapping = self._compile_mapping(template_id, definition, definition_path)
+
+        try:
+            workbook_bytes = workbook_path.read_bytes()
+        except FileNotFoundError:
+            raise TemplateError(f"模板 {template_id} 的工作簿不存在: {workbook_path}")
+
+        # 只读方式检查工作表是否存在，避免完整加载
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(workbook_path, read_only=True)
+        try:
+            if sheet not in workbook.sheetnames:
+                raise TemplateError(f"模板 {template_id} 的工作簿中找不到工作表 '{sheet}'")
+        finally:
+            workbook.close()
+
+        compiled = CompiledTemplate(
+            template_id=template_id,
+            workbook_path=workbook_path,
+            sheet=sheet,
+            mapping=compiled_mapping.cells,
+            aliases=compiled_mapping.aliases,
+            workbook_bytes=workbook_bytes,
+            signature=signature,
+            compiled_mapping=compiled_mapping
+        )
+        logger.info(f"已编译模板 {template_id}: {workbook_path} [{sheet}]，"
+                    f"{len(compiled.mapping)} 个字段，{len(compiled.aliases)} 个别名，映射版本 {compiled.mapping_version}")
+        return compiled
+
+    def get(self, template_id: Optional[str] = None) -> CompiledTemplate:
+        """
+        获取已编译的模板，未缓存或文件已变化时重新编译
+
+        参数:
+            template_id: 模板ID，None表示默认模板
+        """
+        template_id = template_id or DEFAULT_TEMPLATE_ID
+        if not _TEMPLATE_ID_PATTERN.match(template_id):
+            raise TemplateNotFoundError(f"无效的模板ID: {template_id}")
+
+        with self._lock:
+            compiled = self._cache.get(template_id)
+            now = time.monotonic()
+            if compiled is not None and now - self._checked_at.get(template_id, 0) < self.check_interval_seconds:
+                self._cache.move_to_end(template_id)
+                self._stats["hits"] += 1
+                return compiled
+            # 同一模板同时只由一个线程检查和编译，其他线程等待其结果
+            future = self._pending.get(template_id)
+            owner = future is None
+            if owner:
+                future = self._pending[template_id] = Future()
+                if compiled is not None:
+                    self._checked_at[template_id] = now
+        if not owner:
+            return future.result()
+
+        # 检查文件状态和编译（读取工作簿、openpyxl加载）在全局锁之外进行，不阻塞其他模板
+        try:
+            if compiled is not None and self._signature(template_id) == compiled.signature:
+                with self._lock:
+                    if template_id in self._cache:
+                        self._cache.move_to_end(template_id)
+                    self._stats["hits"] += 1
+            else:
+                if compiled is not None:
+                    logger.info(f"模板 {template_id} 已变化，重新加载")
+                    with self._lock:
+                        self._stats["reloads"] += 1
+                compiled = self.compile(template_id)
+                with self._lock:
+                    self._stats["compiles"] += 1
+                    self._cache[template_id] = compiled
+                    self._cache.move_to_end(template_id)
+                    self._checked_at[template_id] = now
+                    self._evict()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(compiled)
+            return compiled
+        finally:
+            with self._lock:
+                self._pending.pop(template_id, None)
+
+    def _evict(self):
+        """超出内存预算时淘汰最久未使用的模板，至少保留最近使用的一个"""
+        total = sum(compiled.size for compiled in self._cache.values())
+        while total > self.max_bytes and len(self._cache) > 1:
+            template_id, compiled = self._cache.popitem(last=False)
+            self._checked_at.pop(template_id, None)
+            total -= compiled.size
+            self._stats["evictions"] += 1
+            logger.info(f"模板缓存超出预算，淘汰 {template_id}")
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        """列出配置目录中的全部模板"""
+        template_ids = {DEFAULT_TEMPLATE_ID}
+        if self.config_dir.is_dir():
+            template_ids.update(path.stem for path in self.config_dir.glob("*.json"))
+
+        with self._lock:
+            mapping_versions = {template_id: compiled.mapping_version for template_id, compiled in self._cache.items()}
+
+        templates = []
+        for template_id in sorted(template_ids):
+            if not _TEMPLATE_ID_PATTERN.match(template_id):
+                continue
+            try:
+                definition, path = self._load_definition(template_id)
+            except TemplateError as e:
+                templates.append({"template_id": template_id, "error": str(e)})
+                continue
+            templates.append({
+                "template_id": template_id,
+                "workbook": str(self._workbook_path(definition, path)),
+                "sheet": definition.get("sheet", DEFAULT_SHEET),
+                "loaded": template_id in mapping_versions,
+                "mapping_version": mapping_versions.get(template_id)
+            })
+        return templates
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中、编译、重新加载和淘汰次数以及当前占用"""
+        with self._lock:
+            return dict(self._stats,
+                        cached_templates=len(self._cache),
+                        cached_bytes=sum(compiled.size for compiled in self._cache.values()),
+                        max_bytes=self.max_bytes)
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry() -> TemplateRegistry:
+    """
+    获取进程内共享的模板注册表
+
+    环境变量:
+        TEMPLATE_CONFIG_DIR: 模板定义目录（默认templates）
+        TEMPLATE_CACHE_MAX_MB: 已编译模板的内存预算（默认256）
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry(
+                    os.environ.get('TEMPLATE_CONFIG_DIR', 'templates'),
+                    max_bytes=int(float(os.environ.get('TEMPLATE_CACHE_MAX_MB', DEFAULT_CACHE_MAX_BYTES / 1024 ** 2)) * 1024 ** 2)
+                )
+    return _registry
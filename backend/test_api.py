@@ -6,6 +6,8 @@
 import requests
 import json
 import io
+import os
+import zipfile
 from pathlib import Path
 
 # API配置
@@ -141,6 +143,39 @@ def test_parse_md_file():
         except:
             pass
 
+def test_zip_upload_over_16mb():
+    """测试ZIP上传接口接受超过16MB的归档，其他接口仍限制为16MB（进程内测试，无需启动服务器）"""
+    print("\n🔍 测试ZIP上传大小限制...")
+    
+    try:
+        from app import app
+        
+        client = app.test_client()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('padding.bin', os.urandom(17 * 1024 * 1024))
+            zf.writestr('report.md', '| 科目 | 当月残高 |\n|---|---|\n| 現金 | 1000 |\n')
+        body = buffer.getvalue()
+        
+        response = client.post('/api/generate-excel-zip',
+                                data={'file': (io.BytesIO(body), 'reports.zip')},
+                                content_type='multipart/form-data')
+        if response.status_code == 413:
+            print(f"❌ ZIP上传接口按16MB拒绝了 {len(body) // (1024 * 1024)}MB的归档")
+            return False
+        
+        response = client.post('/api/parse-md-text', data=body, content_type='application/json')
+        if response.status_code != 413:
+            print(f"❌ 其他接口应限制为16MB，实际返回: {response.status_code}")
+            return False
+        
+        print(f"✅ {len(body) // (1024 * 1024)}MB的ZIP已接受，其他接口仍返回413")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ZIP上传大小限制测试异常: {str(e)}")
+        return False
+
 def main():
     """运行所有测试"""
     print("🚀 开始测试MarkdownSync API接口")
@@ -150,7 +185,8 @@ def main():
         test_health_check,
         test_sample_md,
         test_parse_md_text,
-        test_parse_md_file
+        test_parse_md_file,
+        test_zip_upload_over_16mb
     ]
     
     passed = 0
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+工作簿保存模块
+openpyxl的Workbook.save固定使用默认级别的deflate压缩；这里自己创建ZipFile，
+按压缩配置（stored/fast/default/max）写入工作簿的所有ZIP成员。
+确定性模式下固定文档属性的时间、ZIP成员的日期和顺序，相同的模板和数据生成逐字节相同的文件
+"""
+
+import os
+import zipfile
+import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, NamedTuple, Optional, Union
+
+
+class CompressionProfile(NamedTuple):
+    """ZIP成员的压缩方式"""
+    name: str
+    compression: int
+    level: Optional[int]
+
+
+# stored: 不压缩，CPU开销最小，文件最大；fast/default/max: deflate级别1/6/9
+COMPRESSION_PROFILES: Dict[str, CompressionProfile] = {
+    "stored": CompressionProfile("stored", zipfile.ZIP_STORED, None),
+    "fast": CompressionProfile("fast", zipfile.ZIP_DEFLATED, 1),
+    "default": CompressionProfile("default", zipfile.ZIP_DEFLATED, 6),
+    "max": CompressionProfile("max", zipfile.ZIP_DEFLATED, 9),
+}
+
+# 未指定时使用的压缩配置，可用环境变量 EXCEL_COMPRESSION 修改（如局域网内下载的输出用fast）
+DEFAULT_COMPRESSION_PROFILE = os.environ.get('EXCEL_COMPRESSION', 'default')
+
+# 是否默认使用确定性输出，可用环境变量 EXCEL_DETERMINISTIC=1 开启
+DEFAULT_DETERMINISTIC = os.environ.get('EXCEL_DETERMINISTIC', '').lower() in ('1', 'true', 'yes')
+
+# 确定性输出使用的固定时间：ZIP格式能表示的最早日期
+FIXED_TIMESTAMP = datetime.datetime(1980, 1, 1)
+_FIXED_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+# 成员的固定权限（-rw-r--r--）
+_FIXED_EXTERNAL_ATTR = 0o100644 << 16
+
+# 确定性输出中排在最前面的成员，其余成员按名称排序
+_LEADING_MEMBERS = ("[Content_Types].xml", "_rels/.rels")
+
+
+def resolve_compression(profile: Optional[str] = None) -> CompressionProfile:
+    """
+    取得压缩配置
+
+    参数:
+        profile: 配置名称，None表示默认配置
+
+    异常:
+        ValueError: 未知的配置名称
+    """
+    name = (profile or DEFAULT_COMPRESSION_PROFILE).lower()
+    try:
+        return COMPRESSION_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的压缩配置 '{name}'，可选: {', '.join(COMPRESSION_PROFILES)}")
+
+
+class _DeterministicZipFile(zipfile.ZipFile):
+    """
+    先收集所有成员，关闭时按固定顺序、固定日期和权限写出
+    成员内容与写入顺序、保存时间和平台无关
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._members: Dict[str, bytes] = {}
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        name = zinfo_or_arcname.filename if isinstance(zinfo_or_arcname, zipfile.ZipInfo) else zinfo_or_arcname
+        self._members[name] = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        # openpyxl先把工作表写入临时文件再加入归档，临时文件的修改时间不能进入输出
+        with open(filename, 'rb') as f:
+            self._members[arcname or os.path.basename(filename)] = f.read()
+
+    def close(self):
+        if self.fp is not None and self._members:
+            members, self._members = self._members, {}
+            order = [name for name in _LEADING_MEMBERS if name in members]
+            order += sorted(name for name in members if name not in _LEADING_MEMBERS)
+            for name in order:
+                zinfo = zipfile.ZipInfo(name, date_time=_FIXED_ZIP_DATE)
+                zinfo.compress_type = self.compression
+                zinfo.create_system = 3
+                zinfo.external_attr = _FIXED_EXTERNAL_ATTR
+                super().writestr(zinfo, members[name], compresslevel=self.compresslevel)
+        super().close()
+
+
+def save_workbook(workbook, target: Union[str, Path, BinaryIO], profile: Optional[str] = None,
+                  deterministic: Optional[bool] = None):
+    """
+    按压缩配置保存工作簿
+
+    参数:
+        workbook: openpyxl工作簿
+        target: 保存路径或可写的二进制流
+        profile: 压缩配置名称，None表示默认配置
+        deterministic: 是否使用确定性输出，None表示环境变量EXCEL_DETERMINISTIC的配置
+    """
+    from openpyxl.writer.excel import ExcelWriter as _ArchiveWriter
+
+    if workbook.read_only:
+        raise TypeError("只读模式加载的工作簿不能保存")
+
+    settings = resolve_compression(profile)
+    if isinstance(target, Path):
+        target = str(target)
+    if deterministic is None:
+        deterministic = DEFAULT_DETERMINISTIC
+
+    if deterministic:
+        archive = _DeterministicZipFile(target, 'w', settings.compression, allowZip64=True,
+                                        compresslevel=settings.level)
+        workbook.properties.created = FIXED_TIMESTAMP
+        workbook.properties.modified = FIXED_TIMESTAMP
+    else:
+        archive = zipfile.ZipFile(target, 'w', settings.compression, allowZip64=True,
+                                  compresslevel=settings.level)
+        workbook.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    # openpyxl的写入器用writestr写入各成员，成员沿用archive的压缩方式和级别；save()结束时关闭archive
+    _ArchiveWriter(workbook, archive).save()
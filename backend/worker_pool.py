@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+MD或JSON数据到Excel处理的工作线程池
+处理器和其中的Excel写入器不保存请求状态，每个模板只创建一个处理器，由所有工作线程和请求线程共享
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from md_to_excel_processor import MDToExcelProcessor
+from template_registry import get_template_registry
+
+logger = logging.getLogger(__name__)
+
+# 默认工作线程数，可通过环境变量调整
+DEFAULT_MAX_WORKERS = int(os.environ.get('EXCEL_WORKERS', min(8, os.cpu_count() or 4)))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_processors: Dict[str, MDToExcelProcessor] = {}
+_processors_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取进程内共享的线程池（首次调用时创建）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DEFAULT_MAX_WORKERS,
+                    thread_name_prefix='md-excel-worker'
+                )
+                logger.info(f"已创建MD到Excel工作线程池: {DEFAULT_MAX_WORKERS} 个线程")
+    return _executor
+
+
+def get_processor(template_id: Optional[str] = None) -> MDToExcelProcessor:
+    """
+    获取模板对应的共享处理器，可在多个线程中同时使用
+
+    参数:
+        template_id: 模板注册表中的模板ID，None表示默认模板
+    """
+    template = get_template_registry().get(template_id)
+    processor = _processors.get(template.template_id)
+    if processor is not None and processor.template is template:
+        return processor
+
+    # 模板重新编译后缓存的处理器失效
+    with _processors_lock:
+        processor = _processors.get(template.template_id)
+        if processor is None or processor.template is not template:
+            processor = MDToExcelProcessor(template=template)
+            _processors[template.template_id] = processor
+    return processor
+
+
+def _process_md_content(md_content: str, filename: str,
+                        progress_callback: Optional[Callable] = None,
+                        template_id: Optional[str] = None) -> Dict[str, Any]:
+    """在工作线程中处理一个MD文档"""
+    return get_processor(template_id).process_md_content(md_content, filename, progress_callback)
+
+
+def submit_md_content(md_content: str, filename: str,
+                      progress_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                      template_id: Optional[str] = None) -> Future:
+    """
+    提交一个MD文档到线程池处理
+
+    参数:
+        md_content: Markdown文本内容
+        filename: 原始文件名
+        progress_callback: 可选的阶段进度回调，在工作线程中调用
+        template_id: 模板ID，None表示默认模板
+
+    返回:
+        结果为process_md_content返回字典的Future
+    """
+    return get_executor().submit(_process_md_content, md_content, filename, progress_callback, template_id)
+
+
+def _process_api_data(api_data: Dict[str, Any], filename: str,
+                      template_id: Optional[str] = None) -> Dict[str, Any]:
+    """在工作线程中处理一条API数据"""
+    return get_processor(template_id).process_api_data(api_data, filename)
+
+
+def submit_api_data(api_data: Dict[str, Any], filename: str,
+                    template_id: Optional[str] = None) -> Future:
+    """
+    提交一条结构化API数据到线程池写入Excel
+
+    参数:
+        api_data: 字段名到数值的字典
+        filename: 用于生成输出文件名的名称
+        template_id: 模板ID，None表示默认模板
+
+    返回:
+        结果为process_api_data返回字典的Future
+    """
+    return get_executor().submit(_process_api_data, api_data, filename, template_id)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+同一目标工作簿的写入合并（write-behind）
+多个任务同时更新同一个工作簿时，按到达顺序合并各自的字段更新，每个刷新间隔只加载和保存一次；
+保存时持有文件锁，其他进程中的同步不会与之互相覆盖。后台线程不等待被其他进程持有的文件锁，
+该目标稍后重试，其他目标照常写入
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from excel_writer import ExcelWriter
+from mapping_config import TRIAL_BALANCE_MAPPING
+
+logger = logging.getLogger(__name__)
+
+# 第一条更新到达后等待多久再刷新，期间到达的更新合并到同一次保存，可用环境变量 WRITE_BEHIND_FLUSH_SECONDS 修改
+DEFAULT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_SECONDS', 1.0))
+
+# 等待其他进程释放文件锁的最长时间
+DEFAULT_LOCK_TIMEOUT_SECONDS = 60.0
+
+_LOCK_POLL_SECONDS = 0.05
+
+
+def lock_path_for(path: Union[str, Path]) -> Path:
+    """工作簿对应的锁文件（同目录下的隐藏文件）"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.lock")
+
+
+@contextmanager
+def file_lock(path: Union[str, Path], timeout: float = DEFAULT_LOCK_TIMEOUT_SECONDS) -> Iterator[None]:
+    """
+    独占工作簿的跨进程文件锁
+
+    参数:
+        path: 工作簿路径
+        timeout: 等待锁的最长秒数
+
+    异常:
+        TimeoutError: 超时仍未取得锁
+    """
+    lock_file = open(lock_path_for(path), 'a+')
+    try:
+        try:
+            import fcntl
+
+            def try_lock():
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            def unlock():
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        except ImportError:
+            # Windows
+            import msvcrt
+
+            def try_lock():
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+
+            def unlock():
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                try_lock()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待工作簿锁超时: {path}")
+                time.sleep(_LOCK_POLL_SECONDS)
+
+        try:
+            yield
+        finally:
+            unlock()
+    finally:
+        lock_file.close()
+
+
+class _PendingTarget:
+    """一个目标工作簿尚未保存的更新"""
+
+    def __init__(self, due_at: float):
+        self.updates: Dict[str, Any] = {}
+        self.futures: List[Future] = []
+        # 下一次尝试写入的时间
+        self.due_at = due_at
+        # 第一次因文件锁被占用而推迟的时间，超过lock_timeout后放弃
+        self.lock_wait_started: Optional[float] = None
+
+
+class WriteBehindQueue:
+    """
+    按目标工作簿合并写入
+
+    submit提交的更新按到达顺序合并（同一字段以最后一次为准），第一条更新到达flush_interval秒后
+    由后台线程一次性写入：取得文件锁，加载工作簿，只写入有变化的单元格，保存一次。
+    同一批合并的所有提交得到同一个处理结果。
+    文件锁被占用时后台线程不等待，把该目标放回队列稍后重试（期间到达的更新一并合并），
+    一个目标的锁等待不会阻塞其他目标的写入
+    """
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None, sheet_name: str = "A社貼り付けBS",
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 lock_timeout: float = DEFAULT_LOCK_TIMEOUT_SECONDS):
+        """
+        初始化写入队列
+
+        参数:
+            mapping: API字段名到单元格位置的映射，默认为TRIAL_BALANCE_MAPPING
+            sheet_name: 默认的工作表名称
+            flush_interval: 合并等待时间（秒）
+            lock_timeout: 等待文件锁的最长秒数
+        """
+        self.mapping = dict(mapping or TRIAL_BALANCE_MAPPING)
+        self.sheet_name = sheet_name
+        self.flush_interval = flush_interval
+        self.lock_timeout = lock_timeout
+        self._pending: Dict[Tuple[str, str, Optional[str]], _PendingTarget] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"submitted": 0, "flushes": 0, "saves": 0, "failed_flushes": 0, "lock_retries": 0}
+
+    def submit(self, target: Union[str, Path], updates: Dict[str, Any],
+               sheet_name: Optional[str] = None, compression: Optional[str] = None) -> Future:
+        """
+        提交一个工作簿的字段更新
+
+        参数:
+            target: 目标工作簿路径
+            updates: 字段名到数值的字典，映射之外的字段会被忽略
+            sheet_name: 工作表名称，默认为队列的工作表
+            compression: 保存时的压缩配置，None表示默认配置；只合并压缩配置相同的提交
+
+        返回:
+            结果为ExcelWriter.process_api_data返回字典（另含coalesced合并的提交数）的Future
+        """
+        future: Future = Future()
+        key = (str(Path(target).resolve()), sheet_name or self.sheet_name, compression)
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("写入队列已关闭")
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _PendingTarget(time.monotonic() + self.flush_interval)
+            pending.updates.update(updates)
+            pending.futures.append(future)
+            self._stats["submitted"] += 1
+            self._ensure_thread()
+            self._condition.notify()
+
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _take_due(self, force: bool = False) -> List[Tuple[Tuple[str, str, Optional[str]], _PendingTarget]]:
+        """取出已到刷新时间的目标（调用方持有锁）"""
+        now = time.monotonic()
+        due = [key for key, pending in self._pending.items()
+               if force or now >= pending.due_at]
+        return [(key, self._pending.pop(key)) for key in due]
+
+    def _requeue(self, key: Tuple[str, str, Optional[str]], pending: _PendingTarget):
+        """文件锁被占用：把目标放回队列稍后重试，期间新到达的更新合并在其后"""
+        with self._condition:
+            newer = self._pending.get(key)
+            if newer is not None:
+                pending.updates.update(newer.updates)
+                pending.futures.extend(newer.futures)
+            pending.due_at = time.monotonic() + _LOCK_POLL_SECONDS
+            self._pending[key] = pending
+            self._stats["lock_retries"] += 1
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    closing = self._closed
+                    due = self._take_due(force=closing)
+                    if due or (closing and not self._pending):
+                        break
+                    if self._pending:
+                        next_due = min(pending.due_at for pending in self._pending.values())
+                        self._condition.wait(max(0.0, next_due - time.monotonic()))
+                    else:
+                        self._condition.wait()
+            # 关闭时等待文件锁写完剩余的更新，运行期间不等待
+            for key, pending in due:
+                self._flush(key, pending, wait=closing)
+            if not due:
+                return
+
+    def _flush(self, key: Tuple[str, str, Optional[str]], pending: _PendingTarget, wait: bool = True):
+        """
+        把一个目标的合并更新写入工作簿并通知所有提交方
+
+        参数:
+            wait: 文件锁被占用时是否等待（最多lock_timeout秒）；False时放回队列稍后重试
+        """
+        path, sheet_name, compression = key
+        mapping = {field: cell for field, cell in self.mapping.items() if field in pending.updates}
+        coalesced = len(pending.futures)
+
+        try:
+            # process_api_data自行捕获写入中的异常，这里的TimeoutError只来自取得文件锁
+            with file_lock(path, self.lock_timeout if wait else 0):
+                result = ExcelWriter(path, sheet_name, compression=compression).process_api_data(pending.updates, mapping)
+        except TimeoutError as e:
+            now = time.monotonic()
+            if pending.lock_wait_started is None:
+                pending.lock_wait_started = now
+            if not wait and now - pending.lock_wait_started < self.lock_timeout:
+                self._requeue(key, pending)
+                return
+            self._fail(path, pending, e)
+            return
+        except Exception as e:
+            self._fail(path, pending, e)
+            return
+
+        result["coalesced"] = coalesced
+        with self._condition:
+            self._stats["flushes"] += 1
+            if not result.get("save_skipped") and result["status"] in ("success", "partial_success"):
+                self._stats["saves"] += 1
+        logger.info(f"已合并 {coalesced} 次更新写入 {path}: 变化 {result.get('changed', 0)} 个字段"
+                    f"{'，未保存' if result.get('save_skipped') else ''}")
+
+        for future in pending.futures:
+            future.set_result(result)
+
+    def _fail(self, path: str, pending: _PendingTarget, error: Exception):
+        """写入失败：所有提交方得到同一个异常"""
+        logger.error(f"合并写入 {path} 失败: {str(error)}")
+        with self._condition:
+            self._stats["failed_flushes"] += 1
+        for future in pending.futures:
+            future.set_exception(error)
+
+    def flush(self):
+        """立即写入所有等待中的更新（在调用线程中执行）"""
+        with self._condition:
+            due = self._take_due(force=True)
+        for key, pending in due:
+            self._flush(key, pending)
+
+    def close(self, timeout: Optional[float] = None):
+        """停止接收新的更新，写入所有等待中的更新后结束后台线程"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """返回提交数、刷新次数、实际保存次数、因文件锁被占用的重试次数和等待中的目标数"""
+        with self._condition:
+            return dict(self._stats, pending_targets=len(self._pending))
+
+
+_queue: Optional[WriteBehindQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """获取进程内共享的写入队列（首次调用时创建），同一进程中原地同步的任务共用"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue()
+    return _queue
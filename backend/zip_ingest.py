@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+ZIP批量上传读取模块
+逐个成员流式读取ZIP中的MD文件，并通过大小和压缩比限制防御ZIP炸弹
+"""
+
+import zipfile
+import logging
+from pathlib import PurePosixPath
+from typing import IO, Iterable, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# 默认限制
+MAX_MEMBERS = 2000                          # 最多处理的成员数
+MAX_MEMBER_SIZE = 16 * 1024 * 1024          # 单个成员解压后的最大字节数
+MAX_TOTAL_SIZE = 512 * 1024 * 1024          # 全部成员解压后的最大字节数
+MAX_COMPRESSION_RATIO = 100                 # 单个成员允许的最大压缩比
+MAX_ARCHIVE_SIZE = MAX_TOTAL_SIZE           # 上传的ZIP包本身的最大字节数
+READ_CHUNK_SIZE = 64 * 1024
+
+# UTF-8文件名标志位
+_UTF8_FLAG = 0x800
+
+
+class ZipBombError(ValueError):
+    """ZIP归档超出大小或压缩比限制"""
+
+
+class ZipMember(NamedTuple):
+    """ZIP中读取出的一个成员"""
+    index: int
+    name: str
+    content: Optional[bytes]
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+def _decode_member_name(info: zipfile.ZipInfo) -> str:
+    """
+    还原成员文件名
+    Windows日文环境打包的ZIP通常使用CP932且不设置UTF-8标志，zipfile会按CP437解码
+    """
+    name = info.filename
+    if info.flag_bits & _UTF8_FLAG:
+        return name
+    try:
+        return name.encode('cp437').decode('cp932')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return name
+
+
+def _is_ignored(name: str) -> bool:
+    """判断是否为目录或系统生成的隐藏文件"""
+    path = PurePosixPath(name)
+    if name.endswith('/'):
+        return True
+    return any(part.startswith('.') or part == '__MACOSX' for part in path.parts)
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, limit: int) -> bytes:
+    """
+    分块读取成员内容，实际解压字节数超出限制时立即中止
+    不信任ZIP头中声明的大小
+    """
+    chunks = []
+    size = 0
+    with archive.open(info) as src:
+        while True:
+            chunk = src.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise ZipBombError(f"成员 {info.filename} 解压后超过 {limit} 字节")
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def iter_zip_members(fileobj: IO[bytes],
+                     allowed_extensions: Iterable[str],
+                     max_members: int = MAX_MEMBERS,
+                     max_member_size: int = MAX_MEMBER_SIZE,
+                     max_total_size: int = MAX_TOTAL_SIZE,
+                     max_ratio: float = MAX_COMPRESSION_RATIO) -> Iterator[ZipMember]:
+    """
+    逐个读取ZIP中的成员
+
+    每读完一个成员就立即产出，调用方可以在读取下一个成员的同时处理它。
+    不符合扩展名的成员以带错误的ZipMember产出；超出限制时抛出ZipBombError，
+    整个归档应被视为不可信并中止处理。
+
+    参数:
+        fileobj: 可seek的ZIP文件对象
+        allowed_extensions: 允许的扩展名集合（不含点）
+        max_members: 最多处理的成员数
+        max_member_size: 单个成员解压后的最大字节数
+        max_total_size: 全部成员解压后的最大字节数
+        max_ratio: 单个成员允许的最大压缩比
+
+    返回:
+        ZipMember迭代器
+
+    异常:
+        zipfile.BadZipFile: 文件不是有效的ZIP
+        ZipBombError: 超出大小、数量或压缩比限制
+    """
+    allowed = {ext.lower() for ext in allowed_extensions}
+
+    with zipfile.ZipFile(fileobj) as archive:
+        infos = [info for info in archive.infolist() if not _is_ignored(info.filename)]
+
+        if len(infos) > max_members:
+            raise ZipBombError(f"ZIP包含 {len(infos)} 个文件，超过上限 {max_members}")
+
+        # 先按头部声明的大小快速拒绝
+        declared_total = sum(info.file_size for info in infos)
+        if declared_total > max_total_size:
+            raise ZipBombError(f"ZIP解压后总大小 {declared_total} 字节，超过上限 {max_total_size}")
+
+        total_read = 0
+        for index, info in enumerate(infos):
+            name = _decode_member_name(info)
+            suffix = PurePosixPath(name).suffix.lstrip('.').lower()
+
+            if suffix not in allowed:
+                yield ZipMember(index, name, None,
+                                'Invalid file type. Only .md, .markdown, and .txt files are allowed',
+                                'INVALID_FILE_TYPE')
+                continue
+
+            if info.file_size > max_member_size:
+                raise ZipBombError(f"成员 {name} 解压后 {info.file_size} 字节，超过上限 {max_member_size}")
+
+            if info.compress_size and info.file_size / info.compress_size > max_ratio:
+                raise ZipBombError(f"成员 {name} 压缩比异常 ({info.file_size}/{info.compress_size})")
+
+            limit = min(max_member_size, max_total_size - total_read)
+            content = _read_member(archive, info, limit)
+            total_read += len(content)
+
+            if info.compress_size and len(content) / info.compress_size > max_ratio:
+                raise ZipBombError(f"成员 {name} 实际压缩比异常 ({len(content)}/{info.compress_size})")
+
+            logger.debug(f"已读取ZIP成员 {name}: {len(content)} 字节")
+            yield ZipMember(index, name, content)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+ZIP流式打包模块
+边读边写地把多个输出文件打包成一个ZIP字节流，归档不会完整缓存在内存或磁盘中
+"""
+
+import time
+import zipfile
+import logging
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 每次从源文件读取的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 本身已经是压缩格式的文件，直接存储，不再二次压缩
+STORED_EXTENSIONS = {'.xlsx', '.xlsm', '.zip', '.gz', '.png', '.jpg', '.jpeg'}
+
+
+class _StreamSink:
+    """
+    zipfile的只写输出目标
+    不支持tell/seek，zipfile会自动改用数据描述符模式，写入的字节由生成器逐块取走
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """取出并清空当前累积的字节"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(arcname: str) -> int:
+    """
+    根据文件扩展名选择ZIP成员的压缩方式
+
+    参数:
+        arcname: 归档内的文件名
+
+    返回:
+        zipfile.ZIP_STORED 或 zipfile.ZIP_DEFLATED
+    """
+    if Path(arcname).suffix.lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_zip_stream(members: Iterable[Tuple[str, Union[str, Path, Callable[[], BinaryIO]]]],
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    逐块生成ZIP归档的字节
+
+    参数:
+        members: (归档内文件名, 源文件路径或返回二进制流的函数) 的可迭代对象，
+                 流在轮到该成员时才打开，打包完成后关闭；
+                 文件不存在或函数返回None的成员跳过并记录警告
+        chunk_size: 每次读取源文件的字节数
+
+    返回:
+        ZIP字节块的迭代器，可直接作为HTTP响应体
+    """
+    sink = _StreamSink()
+    added = set()
+
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for arcname, source in members:
+            if arcname in added:
+                logger.warning(f"跳过重复的归档成员: {arcname}")
+                continue
+
+            # 成员的数据写入前才打开源文件；此时源已不存在（如被清理）则跳过该成员，
+            # 不中断已经开始发送的归档
+            try:
+                if callable(source):
+                    # 远程存储的流无法预先获知大小和修改时间
+                    src = source()
+                    if src is None:
+                        raise FileNotFoundError(arcname)
+                    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                else:
+                    stat = Path(source).stat()
+                    src = open(source, 'rb')
+                    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime(stat.st_mtime)[:6])
+                    zinfo.file_size = stat.st_size
+            except OSError as e:
+                logger.warning(f"跳过无法打开的归档成员: {arcname} ({str(e)})")
+                continue
+            added.add(arcname)
+            zinfo.compress_type = compress_type_for(arcname)
+
+            size = 0
+            with src, archive.open(zinfo, 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            # 成员结束时写入的数据描述符
+            data = sink.drain()
+            if data:
+                yield data
+
+            logger.debug(f"已打包归档成员: {arcname} ({size} 字节)")
+
+    # 中央目录在关闭归档时写出
+    data = sink.drain()
+    if data:
+        yield data
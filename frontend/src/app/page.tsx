@@ -135,10 +135,20 @@ export default function HomePage() {
 
       // Auto-download all generated Excel files
       console.log('⬇️ [PAGE] 开始自动下载Excel文件')
-      for (const result of results) {
-        if (result.output_filename) {
-          console.log(`⬇️ [PAGE] 下载文件: ${result.output_filename}`)
-          await downloadExcelFile(result.output_filename)
+      if (results.length > 1 && response.data.batch_download_url) {
+        // 多个文件时打包为一个ZIP下载
+        console.log(`⬇️ [PAGE] 批量下载ZIP: ${response.data.job_id}`)
+        const link = document.createElement('a')
+        link.href = api.getBatchDownloadUrl(response.data.batch_download_url)
+        document.body.appendChild(link)
+        link.click()
+        document.body.removeChild(link)
+      } else {
+        for (const result of results) {
+          if (result.output_filename) {
+            console.log(`⬇️ [PAGE] 下载文件: ${result.output_filename}`)
+            await downloadExcelFile(result.output_filename)
+          }
         }
       }
       console.log('✅ [PAGE] 所有文件下载完成')
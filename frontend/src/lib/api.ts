@@ -209,6 +209,8 @@ class ApiService {
       success_count: number;
       error_count: number;
     };
+    job_id?: string;
+    batch_download_url?: string;
   }>> {
     console.log('🚀 [API] 开始生成Excel - 文件数量:', files.length)
     
@@ -339,6 +341,71 @@ class ApiService {
     }
   }
 
+  // 新增：批量生成Excel并通过SSE接收逐个文件的进度
+  async generateMultipleExcelStream(
+    files: File[],
+    onEvent: (event: string, data: any) => void
+  ): Promise<ApiResponse<null>> {
+    const formData = new FormData()
+    files.forEach((file) => {
+      formData.append('files', file)
+    })
+
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/generate-excel-stream`, {
+        method: 'POST',
+        body: formData,
+      })
+
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}))
+        return {
+          success: false,
+          error: data.error || `Excel generation failed: ${response.status}`,
+          error_code: data.error_code,
+        }
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        // SSE消息以空行分隔
+        let boundary = buffer.indexOf('\n\n')
+        while (boundary !== -1) {
+          const message = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          boundary = buffer.indexOf('\n\n')
+
+          let event = 'message'
+          let data = ''
+          for (const line of message.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          if (data) onEvent(event, JSON.parse(data))
+        }
+      }
+
+      return { success: true, data: null }
+    } catch (error) {
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : 'Excel generation failed',
+      }
+    }
+  }
+
+  // 新增：批量下载的ZIP地址（由浏览器直接流式保存，不经过Blob缓存）
+  getBatchDownloadUrl(batchDownloadUrl: string): string {
+    return `${API_BASE_URL}${batchDownloadUrl}`
+  }
+
   // Health check endpoint
   async healthCheck(): Promise<ApiResponse<{ status: string; timestamp: string }>> {
     return this.request<{ status: string; timestamp: string }>('/api/health')